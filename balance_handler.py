@@ -1,20 +1,63 @@
+import os
+import hashlib
 import pandas as pd
+from collections.abc import Callable
 
 import config
+import instrumentation
 from structs.balance import Balance, SpreadType
+from structs.balance_table import BalanceTable
+from storage import BALANCE_COLUMNS, NUMERIC_COLUMNS, CsvStorage, EncodedStringDtype, StorageBackend, storage_for
+from journal import JournalOperation, LedgerJournal, journal_path
 import dataclasses as dc
 
 
+# (spread_type, active) -> row labels, active meaning the balance starts at month 0
+PartitionKey = tuple[SpreadType, bool]
+# Called after every mutation with the row labels it touched; None means the whole ledger changed
+ChangeListener = Callable[[JournalOperation | None, list[int]], None]
+
 @dc.dataclass(kw_only=True)
 class BalanceHandler:
     df: pd.DataFrame = dc.field(init=False)
+    dataframe: dc.InitVar[pd.DataFrame | None] = None
+    storage: StorageBackend | None = None
+    journal: LedgerJournal | None = None
+
+    # Bumped on every mutation; lets ledger_hash skip rehashing an unchanged ledger
+    version: int = dc.field(init=False, default=0)
+    _hashed: tuple[int, str] | None = dc.field(init=False, repr=False, default=None)
+    _table: tuple[int, BalanceTable] | None = dc.field(init=False, repr=False, default=None)
+
+    # Id lookup and partitions, built on first use by _rows and _partitions
+    _ids: dict[str, int] | None = dc.field(init=False, repr=False, default=None)
+    _partition_rows: dict[PartitionKey, set[int]] | None = dc.field(init=False, repr=False, default=None)
+    _next_row: int = dc.field(init=False, repr=False, default=0)
+    _listeners: list[ChangeListener] = dc.field(init=False, repr=False, default_factory=list)
+
+    def __post_init__ (self, dataframe: pd.DataFrame | None) -> None:
+        if self.storage is None:
+            self.storage = storage_for(config.BALANCE_FILE_PATH)
+
+        if dataframe is not None:
+            self.df = dataframe
 
-    def __post_init__ (self) -> None:
-        try:
-            self.df = pd.read_csv(config.BALANCE_FILE_PATH)
+        else:
+            with instrumentation.phase("handler.load"):
+                self.df = self.storage.load()
+                if self.df is None:
+                    self._init_dataframe()
 
-        except FileNotFoundError:
-            self._init_dataframe()
+            if self.journal is None and config.BALANCE_JOURNAL:
+                self.journal = LedgerJournal(path=journal_path(self.storage.path))
+
+        with instrumentation.phase("handler.index") as phase:
+            self._build_index()
+            phase.iterations = len(self.df)
+
+        if self.journal is not None:
+            with instrumentation.phase("handler.replay"):
+                self._replay_journal()
 
     def _init_dataframe (self) -> None:
         headers = [
@@ -24,51 +67,303 @@ class BalanceHandler:
 
         self.df = pd.DataFrame(columns=headers)
 
+    def save (self) -> None:
+        if self.journal is not None:
+            self.journal.wait()
+
+        self.storage.save(self.df)
+
+        if self.journal is not None:
+            self.journal.reset()
+
+    def close (self) -> None:
+        if self.journal is not None:
+            self.journal.close()
+
+    def import_csv (self, path: str | os.PathLike) -> None:
+        df = CsvStorage(path=path).load()
+        if df is None:
+            raise ValueError(f"Balance file {path} not found")
+
+        self.df = df
+        self._build_index()
+        self._notify(None, [])
+
+        # Replacing the whole ledger is cheaper to snapshot than to journal
+        if self.journal is not None:
+            self.save()
+
+    def append_frame (self, df: pd.DataFrame) -> None:
+        # Bulk counterpart of add_balances for rows already validated, such as a bulk import:
+        # one concat for the whole frame, and a snapshot instead of a journal record per row
+        if len(df) == 0:
+            return
+
+        duplicated = df["id"][df["id"].duplicated() | df["id"].isin(self._rows)]
+        if len(duplicated):
+            raise ValueError(f"Duplicate balance id {duplicated.iloc[0]}")
+
+        with instrumentation.phase("handler.append") as phase:
+            phase.iterations = len(df)
+
+            rows = range(self._next_row, self._next_row + len(df))
+            df = df[list(BALANCE_COLUMNS)].set_axis(rows)
+            self.df = pd.concat([self.df, df]) if len(self.df) else df
+            self._next_row += len(df)
+
+            self._rows.update(zip(df["id"].tolist(), rows))
+            if self._partition_rows is not None:
+                labels = df.index.to_numpy()
+                spread_type = df["spread_type"].to_numpy(dtype=object)
+                active = pd.to_numeric(df["start_month"], errors="coerce").to_numpy(dtype=float) == 0
+                for spread in SpreadType:
+                    for is_active in (True, False):
+                        self._partition_rows[(spread, is_active)].update(
+                            labels[(spread_type == spread.value) & (active == is_active)].tolist()
+                        )
+
+        self.version += 1
+        self._notify(None, [])
+
+        if self.journal is not None:
+            self.save()
+
+    def export_csv (self, path: str | os.PathLike) -> None:
+        CsvStorage(path=path).save(self.df)
+
+    def _replay_journal (self) -> None:
+        # Only the last record of every id matters, so the journal collapses into one batch
+        latest: dict[str, dict | None] = {}
+        for operation, payload in self.journal.records():
+            if operation is JournalOperation.REMOVE:
+                latest.update(dict.fromkeys(payload))
+
+            else:
+                latest.update((row[0], dict(zip(BALANCE_COLUMNS, row))) for row in payload)
+
+        self._remove_rows([balance_id for balance_id, row in latest.items() if row is None])
+
+        balances = [Balance(**row) for row in latest.values() if row is not None]
+        self._update_rows([balance for balance in balances if balance.id in self._rows])
+        self._add_rows([balance for balance in balances if balance.id not in self._rows])
+
+        # Fold the journal into a snapshot so new records never follow a torn tail
+        if self.journal.size or self.journal.rotated_path.exists():
+            self.journal.compact(self.df.copy(), self.storage)
+
+    def subscribe (self, listener: ChangeListener) -> None:
+        self._listeners.append(listener)
+
+    def unsubscribe (self, listener: ChangeListener) -> None:
+        self._listeners.remove(listener)
+
+    def _notify (self, operation: JournalOperation | None, rows: list[int]) -> None:
+        for listener in self._listeners:
+            listener(operation, rows)
+
+    def _record (self, operation: JournalOperation, payload: list, rows: list[int]) -> None:
+        self.version += 1
+        if self.journal is not None:
+            self.journal.append(operation, payload)
+            if self.journal.needs_compaction:
+                # A deep copy keeps the snapshot fixed while this handler keeps editing, whatever the
+                # pandas copy semantics; encoded string columns share their immutable buffers
+                self.journal.compact(self.df.copy(), self.storage)
+
+        self._notify(operation, rows)
+
+    @staticmethod
+    def _partition_key (spread_type: str, start_month: float) -> PartitionKey:
+        return SpreadType(spread_type), start_month == 0
+
+    def _build_index (self) -> None:
+        # Row labels are never reused, so the index stays valid across removals
+        self.version += 1
+        self.df = self.df.reset_index(drop=True)
+        self._next_row = len(self.df)
+        self._ids = None
+        self._partition_rows = None
+
+        # A mapped columnar ledger had its ids checked when it was saved, so opening it
+        # decodes none of them; any other frame is checked for duplicates now
+        if not isinstance(self.df["id"].dtype, EncodedStringDtype):
+            self._index_ids()
+
+    def _index_ids (self) -> None:
+        self._ids = dict(zip(self.df["id"].tolist(), self.df.index.tolist()))
+        if len(self._ids) != len(self.df):
+            duplicated = self.df["id"][self.df["id"].duplicated()].iloc[0]
+            raise ValueError(f"Duplicate balance id {duplicated}")
+
+    @property
+    def _rows (self) -> dict[str, int]:
+        if self._ids is None:
+            self._index_ids()
+
+        return self._ids
+
+    @property
+    def _partitions (self) -> dict[PartitionKey, set[int]]:
+        if self._partition_rows is None:
+            rows = self.df.index.to_numpy()
+            spread_type = self.df["spread_type"].to_numpy(dtype=object)
+            active = pd.to_numeric(self.df["start_month"], errors="coerce").to_numpy(dtype=float) == 0
+
+            self._partition_rows = {
+                (spread, is_active): set(rows[(spread_type == spread.value) & (active == is_active)].tolist())
+                for spread in SpreadType for is_active in (True, False)
+            }
+
+        return self._partition_rows
+
+    @property
+    def ledger_hash (self) -> str:
+        if self._hashed is None or self._hashed[0] != self.version:
+            # Normalized dtypes, so a ledger hashes the same whichever backend loaded it
+            ledger = pd.DataFrame({
+                column: (
+                    pd.to_numeric(self.df[column], errors="coerce").astype(float)
+                    if column in NUMERIC_COLUMNS else self.df[column].astype(str)
+                )
+                for column in BALANCE_COLUMNS
+            })
+            rows = pd.util.hash_pandas_object(ledger, index=False)
+            self._hashed = (self.version, hashlib.blake2b(rows.to_numpy().tobytes(), digest_size=16).hexdigest())
+
+        return self._hashed[1]
+
     @property
-    def monthly_balances_flag (self) -> pd.DataFrame:
-        return (self.df.spread_type == SpreadType.MONTHLY.value) & self.df.start_month == 0
+    def table (self) -> BalanceTable:
+        # Rebuilt on the first read after a mutation, in df row order
+        if self._table is None or self._table[0] != self.version:
+            with instrumentation.phase("handler.table") as phase:
+                phase.iterations = len(self.df)
+                self._table = (self.version, BalanceTable.from_frame(self.df))
+
+        return self._table[1]
+
+    def partition (self, spread_type: SpreadType, active: bool) -> pd.DataFrame:
+        with instrumentation.phase("handler.partition") as phase:
+            rows = sorted(self._partitions[(spread_type, active)])
+            phase.iterations = len(rows)
+
+            return self.df.loc[rows]
+
+    def _partition_flag (self, spread_type: SpreadType, active: bool) -> pd.Series:
+        return pd.Series(self.df.index.isin(self._partitions[(spread_type, active)]), index=self.df.index)
+
+    @property
+    def monthly_balances_flag (self) -> pd.Series:
+        return self._partition_flag(SpreadType.MONTHLY, True)
 
     @property
-    def yearly_balances_flag (self) -> pd.DataFrame:
-        return (self.df.spread_type == SpreadType.YEARLY.value) & self.df.start_month == 0
+    def yearly_balances_flag (self) -> pd.Series:
+        return self._partition_flag(SpreadType.YEARLY, True)
 
     @property
-    def inactive_monthly_balances_flag (self) -> pd.DataFrame:
-        return (self.df.spread_type == SpreadType.MONTHLY.value) & self.df.start_month != 0
+    def inactive_monthly_balances_flag (self) -> pd.Series:
+        return self._partition_flag(SpreadType.MONTHLY, False)
 
     @property
-    def inactive_yearly_balances_flag (self) -> pd.DataFrame:
-        return (self.df.spread_type == SpreadType.YEARLY.value) & self.df.start_month != 0
+    def inactive_yearly_balances_flag (self) -> pd.Series:
+        return self._partition_flag(SpreadType.YEARLY, False)
 
     def add_balances (self, balances: list[Balance]) -> None:
         if len(balances) == 0:
             return
 
-        df_new = pd.DataFrame([balance.to_csv() for balance in balances])
-        self.df = pd.concat([self.df, df_new], ignore_index=True)
+        new_ids = [balance.id for balance in balances]
+        for balance_id in new_ids:
+            if balance_id in self._rows or new_ids.count(balance_id) > 1:
+                raise ValueError(f"Duplicate balance id {balance_id}")
+
+        with instrumentation.phase("handler.add") as phase:
+            phase.iterations = len(balances)
+            payload = self._add_rows(balances)
+            self._record(JournalOperation.ADD, payload, [self._rows[balance_id] for balance_id in new_ids])
+
+    def _add_rows (self, balances: list[Balance]) -> list[list]:
+        if len(balances) == 0:
+            return []
+
+        new_data = [balance.to_csv() for balance in balances]
+        rows = range(self._next_row, self._next_row + len(balances))
+        df_new = pd.DataFrame(new_data, index=rows)
+        self.df = pd.concat([self.df, df_new]) if len(self.df) else df_new
+        self._next_row += len(balances)
+
+        # Partitions nobody has asked for yet are left to be built from the frame
+        for row, balance in zip(rows, balances):
+            self._rows[balance.id] = row
+            if self._partition_rows is not None:
+                self._partition_rows[self._partition_key(balance.spread_type, balance._start_month)].add(row)
+
+        return [list(data.values()) for data in new_data]
 
     def update_balances_by_id (self, balances: list[Balance]) -> None:
         if len(balances) == 0:
             return
 
         for balance in balances:
-            mask = self.df["id"] == balance.id
-            if mask.any():
-                new_data = balance.to_csv()
-                self.df.loc[mask, list(new_data.keys())] = list(new_data.values())
-
-            else:
+            if balance.id not in self._rows:
                 raise ValueError(f"Balance with id {balance.id} not found")
 
+        with instrumentation.phase("handler.update") as phase:
+            phase.iterations = len(balances)
+            payload = self._update_rows(balances)
+            self._record(
+                JournalOperation.UPDATE, payload,
+                list(dict.fromkeys(self._rows[balance.id] for balance in balances)),
+            )
+
+    def _update_rows (self, balances: list[Balance]) -> list[list]:
+        if len(balances) == 0:
+            return []
+
+        # The last update of an id repeated within the batch wins
+        balances = list({balance.id: balance for balance in balances}.values())
+        rows = [self._rows[balance.id] for balance in balances]
+        if self._partition_rows is not None:
+            old_keys = [
+                self._partition_key(spread_type, start_month)
+                for spread_type, start_month in zip(
+                    self.df.loc[rows, "spread_type"], self.df.loc[rows, "start_month"]
+                )
+            ]
+
+            for row, old_key, balance in zip(rows, old_keys, balances):
+                self._partition_rows[old_key].discard(row)
+                self._partition_rows[self._partition_key(balance.spread_type, balance._start_month)].add(row)
+
+        new_data = [list(balance.to_csv().values()) for balance in balances]
+        self.df.loc[rows, list(BALANCE_COLUMNS)] = new_data
+
+        return new_data
+
     def remove_balances_by_id (self, balances_id: list[str]) -> None:
         if len(balances_id) == 0:
             return
 
-        self.df = self.df[~self.df["id"].isin(balances_id)]
+        with instrumentation.phase("handler.remove") as phase:
+            phase.iterations = len(balances_id)
+            rows = self._remove_rows(balances_id)
+            self._record(JournalOperation.REMOVE, list(balances_id), rows)
+
+    def _remove_rows (self, balances_id: list[str]) -> list[int]:
+        rows = [self._rows.pop(balance_id) for balance_id in balances_id if balance_id in self._rows]
+        if len(rows) == 0:
+            return rows
+
+        for partition in (self._partition_rows or {}).values():
+            partition.difference_update(rows)
+
+        self.df = self.df.drop(index=rows)
+
+        return rows
 
     def query_balance_by_id (self, balance_id: str) -> Balance | None:
-        mask = self.df["id"] == balance_id
-        if mask.any():
-            return Balance(**self.df[mask].iloc[0].to_dict())
+        row = self._rows.get(balance_id)
+        if row is not None:
+            return Balance(**self.df.loc[row].to_dict())
 
         return None
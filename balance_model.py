@@ -0,0 +1,251 @@
+import numpy as np
+import pandas as pd
+from PyQt5.QtCore import QAbstractTableModel, QModelIndex, Qt
+
+from balance_handler import BalanceHandler
+from journal import JournalOperation
+from storage import BALANCE_COLUMNS, NUMERIC_COLUMNS
+
+
+BALANCE_HEADERS = (
+    "ID", "Nome", "Valor", "Frequência", "Unidade", "Spread", "Expiração", "Mês de início", "Tipo"
+)
+
+
+class BalanceTableModel (QAbstractTableModel):
+    # View over the handler's frame: the model only keeps the row labels in display order,
+    # cells are read from the frame when the view paints them, and sorting or filtering
+    # permutes that label array instead of copying the frame.
+    def __init__ (self, handler: BalanceHandler, parent=None) -> None:
+        super().__init__(parent)
+
+        self.handler = handler
+        self._sort_column: int | None = None
+        self._sort_order = Qt.AscendingOrder
+        self._filter_text = ""
+        self._filter_column: int | None = None
+
+        self._labels = self._visible_labels()
+        self._index_rows()
+        self.handler.subscribe(self._on_ledger_changed)
+
+    def rowCount (self, parent: QModelIndex = QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self._labels)
+
+    def columnCount (self, parent: QModelIndex = QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(BALANCE_COLUMNS)
+
+    def data (self, index: QModelIndex, role: int = Qt.DisplayRole):
+        if not index.isValid() or role not in (Qt.DisplayRole, Qt.ToolTipRole):
+            return None
+
+        value = self.handler.df.at[int(self._labels[index.row()]), BALANCE_COLUMNS[index.column()]]
+        return "" if pd.isna(value) else str(value)
+
+    def headerData (self, section: int, orientation: Qt.Orientation, role: int = Qt.DisplayRole):
+        if role != Qt.DisplayRole:
+            return None
+
+        if orientation == Qt.Horizontal:
+            return BALANCE_HEADERS[section]
+
+        return str(section + 1)
+
+    def label_at (self, row: int) -> int:
+        return int(self._labels[row])
+
+    def balance_id_at (self, row: int) -> str:
+        return str(self.handler.df.at[self.label_at(row), "id"])
+
+    # Sorting and filtering
+
+    def _column_keys (self, column: int, labels: np.ndarray) -> np.ndarray:
+        values = self.handler.df[BALANCE_COLUMNS[column]].reindex(labels)
+        if BALANCE_COLUMNS[column] in NUMERIC_COLUMNS:
+            return np.nan_to_num(pd.to_numeric(values, errors="coerce").to_numpy(dtype=float), nan=np.inf)
+
+        return values.astype(str).str.casefold().to_numpy(dtype=object)
+
+    def _sort_key (self, label: int) -> object:
+        return self._column_keys(self._sort_column, np.array([label]))[0]
+
+    def _matches (self, labels: np.ndarray) -> np.ndarray:
+        if not self._filter_text:
+            return np.ones(len(labels), dtype=bool)
+
+        columns = (
+            [BALANCE_COLUMNS[self._filter_column]] if self._filter_column is not None
+            else ["id", "name"]
+        )
+
+        matches = np.zeros(len(labels), dtype=bool)
+        for column in columns:
+            values = self.handler.df[column].reindex(labels).astype(str).str.casefold()
+            matches |= values.str.contains(self._filter_text, regex=False).to_numpy(dtype=bool)
+
+        return matches
+
+    def _visible_labels (self) -> np.ndarray:
+        labels = self.handler.df.index.to_numpy(dtype=np.int64)
+        labels = labels[self._matches(labels)]
+
+        if self._sort_column is not None:
+            order = np.argsort(self._column_keys(self._sort_column, labels), kind="stable")
+            if self._sort_order == Qt.DescendingOrder:
+                order = order[::-1]
+
+            labels = labels[order]
+
+        return labels
+
+    def _relayout (self) -> None:
+        # Persistent indexes (selection, current cell) follow their balance to its new row
+        self.layoutAboutToBeChanged.emit()
+
+        persistent = self.persistentIndexList()
+        labels = [self._labels[index.row()] for index in persistent]
+        self._labels = self._visible_labels()
+        self._index_rows()
+
+        rows = [self._row_of(label) for label in labels]
+        self.changePersistentIndexList(persistent, [
+            self.index(row, index.column()) if row is not None else QModelIndex()
+            for row, index in zip(rows, persistent)
+        ])
+
+        self.layoutChanged.emit()
+
+    def sort (self, column: int, order: Qt.SortOrder = Qt.AscendingOrder) -> None:
+        self._sort_column = column
+        self._sort_order = order
+        self._relayout()
+
+    def set_filter (self, text: str, column: int | None = None) -> None:
+        self._filter_text = text.casefold()
+        self._filter_column = column
+        self._relayout()
+
+    # Fine-grained updates from the handler
+
+    def _index_rows (self) -> None:
+        # The visible labels in ascending order and the row showing each, so a label's row is
+        # found by bisection rather than by scanning the display order
+        order = np.argsort(self._labels, kind="stable")
+        self._sorted_labels = self._labels[order]
+        self._rows = order.astype(np.int64)
+
+    def _row_of (self, label: int) -> int | None:
+        position = int(np.searchsorted(self._sorted_labels, label))
+        if position < len(self._sorted_labels) and self._sorted_labels[position] == label:
+            return int(self._rows[position])
+
+        return None
+
+    def _insert_position (self, label: int, labels: np.ndarray) -> int:
+        if self._sort_column is None:
+            # Unsorted views keep the frame order, which is ascending by label
+            return int(np.searchsorted(labels, label))
+
+        # Binary search reading one cell per probe; ties go after equal keys, like a stable sort
+        key = self._sort_key(label)
+        descending = self._sort_order == Qt.DescendingOrder
+        low, high = 0, len(labels)
+        while low < high:
+            mid = (low + high) // 2
+            probe = self._sort_key(int(labels[mid]))
+            if (probe > key) if descending else not (key < probe):
+                low = mid + 1
+
+            else:
+                high = mid
+
+        return low
+
+    def _in_order (self, row: int) -> bool:
+        if self._sort_column is None:
+            return True
+
+        # An edit that keeps the row between its neighbours only needs a repaint
+        keys = [self._sort_key(int(label)) for label in self._labels[max(row - 1, 0):row + 2]]
+        if self._sort_order == Qt.DescendingOrder:
+            keys.reverse()
+
+        return all(not (after < before) for before, after in zip(keys, keys[1:]))
+
+    def _insert (self, label: int) -> None:
+        row = self._insert_position(label, self._labels)
+        self.beginInsertRows(QModelIndex(), row, row)
+        self._labels = np.insert(self._labels, row, label)
+
+        self._rows[self._rows >= row] += 1
+        position = int(np.searchsorted(self._sorted_labels, label))
+        self._sorted_labels = np.insert(self._sorted_labels, position, label)
+        self._rows = np.insert(self._rows, position, row)
+        self.endInsertRows()
+
+    def _remove (self, row: int) -> None:
+        label = self._labels[row]
+        self.beginRemoveRows(QModelIndex(), row, row)
+        self._labels = np.delete(self._labels, row)
+
+        position = int(np.searchsorted(self._sorted_labels, label))
+        self._sorted_labels = np.delete(self._sorted_labels, position)
+        self._rows = np.delete(self._rows, position)
+        self._rows[self._rows > row] -= 1
+        self.endRemoveRows()
+
+    def _move (self, row: int) -> int:
+        # Moves an edited row to its sorted place; the view keeps its selection and current
+        # index on the moved balance
+        label = int(self._labels[row])
+        rest = np.delete(self._labels, row)
+        target = self._insert_position(label, rest)
+        if target == row:
+            return row
+
+        # Qt counts the destination before the row is taken out
+        if not self.beginMoveRows(QModelIndex(), row, row, QModelIndex(), target + 1 if target > row else target):
+            return row
+
+        self._labels = np.insert(rest, target, label)
+        if target > row:
+            self._rows[(self._rows > row) & (self._rows <= target)] -= 1
+
+        else:
+            self._rows[(self._rows >= target) & (self._rows < row)] += 1
+
+        self._rows[np.searchsorted(self._sorted_labels, label)] = target
+        self.endMoveRows()
+
+        return target
+
+    def _on_ledger_changed (self, operation: JournalOperation | None, rows: list[int]) -> None:
+        if operation is None:
+            self.beginResetModel()
+            self._labels = self._visible_labels()
+            self._index_rows()
+            self.endResetModel()
+            return
+
+        for label in rows:
+            row = self._row_of(label)
+
+            if operation is JournalOperation.REMOVE:
+                if row is not None:
+                    self._remove(row)
+
+            elif not self._matches(np.array([label]))[0]:
+                if row is not None:
+                    self._remove(row)
+
+            elif row is None:
+                self._insert(label)
+
+            else:
+                if not self._in_order(row):
+                    row = self._move(row)
+
+                self.dataChanged.emit(
+                    self.index(row, 0), self.index(row, len(BALANCE_COLUMNS) - 1),
+                    [Qt.DisplayRole],
+                )
@@ -0,0 +1,64 @@
+import sys
+import argparse
+
+from benchmarks.cases import CASE_NAMES, HORIZONS, QUICK_HORIZONS, QUICK_SCALES, SCALES, run_benchmarks
+from benchmarks.harness import (
+    DEFAULT_THRESHOLD, compare, failed, format_measurements, format_report, load_results, save_results,
+)
+
+
+def run_command (args: argparse.Namespace) -> int:
+    scales = args.scales or (QUICK_SCALES if args.quick else SCALES)
+    horizons = args.horizons or (QUICK_HORIZONS if args.quick else HORIZONS)
+
+    measurements = run_benchmarks(
+        args.cases, scales=tuple(scales), horizons=tuple(horizons), repeat=args.repeat, seed=args.seed,
+        on_measurement=lambda measurement: print(
+            f"{measurement.key}: {measurement.min_seconds:.6f}s", file=sys.stderr, flush=True
+        ),
+    )
+
+    if args.output:
+        save_results(args.output, measurements)
+
+    if args.baseline:
+        comparisons = compare(load_results(args.baseline), measurements, threshold=args.threshold)
+        print(format_report(comparisons))
+        return 1 if failed(comparisons) else 0
+
+    print(format_measurements(measurements))
+    return 1 if any(measurement.over_budget for measurement in measurements) else 0
+
+def compare_command (args: argparse.Namespace) -> int:
+    comparisons = compare(load_results(args.baseline), load_results(args.current), threshold=args.threshold)
+    print(format_report(comparisons))
+
+    return 1 if failed(comparisons) else 0
+
+def main (argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description="Balance simulation benchmarks.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="measure the benchmark cases")
+    run.add_argument("--cases", nargs="+", choices=CASE_NAMES, default=list(CASE_NAMES))
+    run.add_argument("--scales", type=int, nargs="+", help="ledger sizes in balances")
+    run.add_argument("--horizons", type=int, nargs="+", help="simulated months until payoff")
+    run.add_argument("--quick", action="store_true", help="only the small scales and horizons")
+    run.add_argument("--repeat", type=int, default=3)
+    run.add_argument("--seed", type=int, default=0)
+    run.add_argument("--output", "-o", help="save the measurements as a JSON baseline")
+    run.add_argument("--baseline", help="compare against this saved baseline")
+    run.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    run.set_defaults(handler=run_command)
+
+    report = commands.add_parser("compare", help="compare two saved runs")
+    report.add_argument("baseline")
+    report.add_argument("current")
+    report.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    report.set_defaults(handler=compare_command)
+
+    args = parser.parse_args(argv)
+    return args.handler(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,259 @@
+import sys
+import shutil
+import itertools
+import tempfile
+import subprocess
+import dataclasses as dc
+from pathlib import Path
+from datetime import datetime
+from collections.abc import Callable
+
+import numpy as np
+import pandas as pd
+
+import cli
+import config
+from balance_handler import BalanceHandler
+from bulk_import import bulk_import
+from incremental import IncrementalSimulation
+from storage import ColumnarStorage, CsvStorage
+from structs.schedule import CashFlowLedger
+from structs.balance_table import BalanceTable
+from portfolio import PORTFOLIO_COLUMN, PortfolioLedger
+from streaming import stream_payment_trajectory
+from simulate import get_payment_status_list, get_payment_sweep, get_payment_trajectory, get_portfolio_simulation
+from benchmarks.harness import Measurement, measure
+from benchmarks.ledger import horizon_payment_size, synthetic_balances, synthetic_ledger
+
+
+SCALES = (10, 1_000, 100_000, 1_000_000)
+HORIZONS = (12, 120, 1_200)
+QUICK_SCALES = (10, 1_000)
+QUICK_HORIZONS = (12, 120)
+
+# Balances touched by every CRUD and query run
+BATCH_SIZE = 100
+SWEEP_SCENARIOS = 64
+# Balances per portfolio when the ledger is split between many owners
+PORTFOLIO_SIZE = 10
+# A fixed calendar, so December falls on the same months in every run
+START_DATE = datetime(2025, 1, 1)
+INVESTMENT_RATE = 0.008
+SIMULATION_PARAMETERS = dict(
+    initial_payment=0.0, profit_tax=0.15, investment_yearly_percentage=0.1, start_date=START_DATE
+)
+
+
+@dc.dataclass(kw_only=True)
+class Workload:
+    scale: int
+    horizon: int
+    seed: int
+    frame: pd.DataFrame
+    handler: BalanceHandler
+    ledger: CashFlowLedger
+    payment_size: float
+    directory: Path
+
+    def storage_file (self, suffix: str) -> Path:
+        return self.directory / f"ledger-{self.scale}-{self.seed}{suffix}"
+
+def workload (scale: int, horizon: int, seed: int = 0) -> Workload:
+    frame = synthetic_ledger(scale, seed=seed, horizon=horizon)
+    handler = BalanceHandler(dataframe=frame.copy())
+    ledger = CashFlowLedger.from_handler(handler)
+
+    return Workload(
+        scale=scale,
+        horizon=horizon,
+        seed=seed,
+        frame=frame,
+        handler=handler,
+        ledger=ledger,
+        payment_size=horizon_payment_size(ledger, horizon, START_DATE),
+        directory=Path(tempfile.mkdtemp(prefix="balance-benchmark-")),
+    )
+
+def load_setup (storage_class: type, suffix: str) -> Callable[[Workload], Callable[[], object]]:
+    def setup (work: Workload) -> Callable[[], object]:
+        storage = storage_class(path=work.storage_file(suffix))
+        if not storage.path.exists():
+            storage.save(work.frame)
+
+        return lambda: BalanceHandler(storage=storage_class(path=storage.path))
+
+    return setup
+
+def compile_setup (work: Workload) -> Callable[[], object]:
+    # The handler caches its table, so every run builds it again from the frame
+    return lambda: CashFlowLedger.from_table(BalanceTable.from_frame(work.handler.df))
+
+def table_setup (work: Workload) -> Callable[[], object]:
+    return lambda: BalanceTable.from_frame(work.frame).breakdown()
+
+def import_setup (work: Workload) -> Callable[[], object]:
+    # Every run validates the whole export and appends it to an empty ledger
+    export = work.storage_file(".export.csv")
+    if not export.exists():
+        CsvStorage(path=export).save(work.frame)
+
+    return lambda: bulk_import(BalanceHandler(dataframe=work.frame.iloc[:0]), export)
+
+def simulate_setup (engine: str) -> Callable[[Workload], Callable[[], object]]:
+    def setup (work: Workload) -> Callable[[], object]:
+        return lambda: get_payment_trajectory(
+            work.handler, work.payment_size, work.payment_size / 2, **SIMULATION_PARAMETERS, engine=engine
+        )
+
+    return setup
+
+def resimulate_setup (work: Workload) -> Callable[[], object]:
+    # Every run edits the balance starting nearest mid-horizon, alternating its value, and
+    # brings a kept trajectory up to date from the last checkpoint before the edit
+    handler = BalanceHandler(dataframe=work.frame.copy())
+    simulation = IncrementalSimulation(
+        handler=handler, payment_size=work.payment_size, investment_size=work.payment_size / 2,
+        **SIMULATION_PARAMETERS,
+    )
+    simulation.refresh()
+
+    start_month = pd.to_numeric(work.frame["start_month"], errors="coerce").fillna(0).to_numpy(dtype=float)
+    balance = handler.query_balance_by_id(work.frame["id"].iloc[int(np.argmin(np.abs(start_month - work.horizon / 2)))])
+    edited = dc.replace(balance, value=balance.value * 2, expiry=balance._expiry, start_month=balance._start_month)
+    edits = itertools.cycle([edited, balance])
+
+    def run () -> object:
+        handler.update_balances_by_id([next(edits)])
+        return simulation.refresh()
+
+    return run
+
+def status_list_setup (work: Workload) -> Callable[[], object]:
+    return lambda: get_payment_status_list(
+        work.handler, work.payment_size, work.payment_size / 2, **SIMULATION_PARAMETERS
+    )
+
+def stream_setup (work: Workload) -> Callable[[], object]:
+    # Consumed without keeping the months, the way an exporter would
+    return lambda: sum(1 for _ in stream_payment_trajectory(
+        work.handler, work.payment_size, work.payment_size / 2, **SIMULATION_PARAMETERS
+    ))
+
+def sweep_setup (work: Workload) -> Callable[[], object]:
+    payment_size = np.linspace(0.5, 1.0, SWEEP_SCENARIOS) * work.payment_size
+
+    return lambda: get_payment_sweep(
+        work.handler, payment_size, work.payment_size / 2, **SIMULATION_PARAMETERS,
+        keep_trajectories=False,
+    )
+
+def portfolios_setup (work: Workload) -> Callable[[], object]:
+    # The ledger split into consecutive portfolios, each paying its share of the calibrated payment
+    frame = work.frame.assign(**{PORTFOLIO_COLUMN: (np.arange(work.scale) // PORTFOLIO_SIZE).astype(str)})
+    payment_size = work.payment_size * PORTFOLIO_SIZE / work.scale
+
+    return lambda: get_portfolio_simulation(
+        PortfolioLedger.from_frame(frame), payment_size, payment_size / 2, **SIMULATION_PARAMETERS,
+        keep_trajectories=False, max_months=work.horizon,
+    )
+
+def crud_setup (work: Workload) -> Callable[[], object]:
+    # One run adds a batch, updates as many existing balances and removes the batch again,
+    # so every run starts from the same ledger
+    added = synthetic_balances(BATCH_SIZE, seed=work.seed + 1, prefix="crud")
+    existing = work.handler.df["id"].head(BATCH_SIZE).tolist()
+    updated = [
+        dc.replace(balance, id=balance_id, name=balance_id, expiry=None, start_month=None)
+        for balance_id, balance in zip(existing, synthetic_balances(len(existing), seed=work.seed + 2))
+    ]
+
+    def run () -> None:
+        work.handler.add_balances(added)
+        work.handler.update_balances_by_id(updated)
+        work.handler.remove_balances_by_id([balance.id for balance in added])
+
+    return run
+
+def query_setup (work: Workload) -> Callable[[], object]:
+    ids = work.handler.df["id"].sample(min(BATCH_SIZE, work.scale), random_state=work.seed).tolist()
+    return lambda: [work.handler.query_balance_by_id(balance_id) for balance_id in ids]
+
+def startup_setup () -> Callable[[], object]:
+    command = [sys.executable, str(Path(cli.__file__).resolve()), "--help"]
+    return lambda: subprocess.run(command, check=True, capture_output=True)
+
+@dc.dataclass(kw_only=True, frozen=True)
+class Case:
+    name: str
+    setup: Callable[[Workload], Callable[[], object]]
+    # Whether the measurement depends on the simulated horizon, or only on the ledger
+    uses_horizon: bool = False
+
+CASES = {
+    case.name: case for case in (
+        Case(name="load_csv", setup=load_setup(CsvStorage, ".csv")),
+        Case(name="load_columnar", setup=load_setup(ColumnarStorage, ".bal")),
+        Case(name="compile", setup=compile_setup),
+        Case(name="table", setup=table_setup),
+        Case(name="import", setup=import_setup),
+        Case(name="crud", setup=crud_setup),
+        Case(name="query", setup=query_setup),
+        Case(name="simulate_loop", setup=simulate_setup("loop"), uses_horizon=True),
+        Case(name="simulate_vectorized", setup=simulate_setup("vectorized"), uses_horizon=True),
+        Case(name="simulate_fast_forward", setup=simulate_setup("fast_forward"), uses_horizon=True),
+        Case(name="resimulate", setup=resimulate_setup, uses_horizon=True),
+        Case(name="status_list", setup=status_list_setup, uses_horizon=True),
+        Case(name="stream", setup=stream_setup, uses_horizon=True),
+        Case(name="sweep", setup=sweep_setup, uses_horizon=True),
+        Case(name="portfolios", setup=portfolios_setup, uses_horizon=True),
+    )
+}
+# Scale-free cases, run once
+STARTUP_CASE = "startup"
+CASE_NAMES = (*CASES, STARTUP_CASE)
+
+def prepare () -> None:
+    # Benchmarks measure the engines, not journaling, and the calibrated horizons assume no
+    # payment interest
+    config.BALANCE_JOURNAL = False
+    config.PAYMENT_INTEREST_RATE = 0.0
+    config.INVESTMENT_INTERST_RATE = INVESTMENT_RATE
+
+def run_benchmarks (
+    names: list[str], *, scales: tuple[int, ...] = SCALES, horizons: tuple[int, ...] = HORIZONS,
+    repeat: int = 3, seed: int = 0, on_measurement: Callable[[Measurement], None] | None = None,
+) -> list[Measurement]:
+    prepare()
+    measurements = []
+
+    def record (measurement: Measurement) -> None:
+        measurements.append(measurement)
+        if on_measurement is not None:
+            on_measurement(measurement)
+
+    if STARTUP_CASE in names:
+        record(measure(
+            STARTUP_CASE, startup_setup, repeat=repeat,
+            budget_seconds=cli.STARTUP_BUDGET_SECONDS, trace_memory=False,
+        ))
+
+    cases = [CASES[name] for name in names if name in CASES]
+    for scale in scales:
+        # One ledger per scale and horizon at a time; a million balances take a few hundred MB
+        for idx, horizon in enumerate(horizons):
+            selected = [case for case in cases if case.uses_horizon or idx == 0]
+            if not selected:
+                continue
+
+            work = workload(scale, horizon, seed)
+            try:
+                for case in selected:
+                    record(measure(
+                        case.name, lambda: case.setup(work), repeat=repeat,
+                        scale=scale, horizon=horizon if case.uses_horizon else None,
+                    ))
+
+            finally:
+                shutil.rmtree(work.directory, ignore_errors=True)
+
+    return measurements
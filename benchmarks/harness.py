@@ -0,0 +1,240 @@
+import gc
+import sys
+import json
+import time
+import platform
+import statistics
+import tracemalloc
+import dataclasses as dc
+from enum import StrEnum
+from pathlib import Path
+from datetime import datetime
+from collections.abc import Callable
+
+import numpy as np
+import pandas as pd
+
+
+# Relative slowdown (or growth of peak memory) reported as a regression
+DEFAULT_THRESHOLD = 0.10
+# Slowdowns smaller than this are timer and scheduler noise, whatever their ratio
+MIN_COMPARED_SECONDS = 0.002
+# Peak memory below this is noise from the allocator, not worth comparing
+MIN_COMPARED_BYTES = 1 << 20
+
+
+@dc.dataclass(kw_only=True)
+class Measurement:
+    case: str
+    scale: int | None = None
+    horizon: int | None = None
+    repeat: int
+    seconds: float
+    min_seconds: float
+    # Peak traced memory during one extra run, and blocks it left allocated (its result included)
+    peak_bytes: int = 0
+    allocated_blocks: int = 0
+    budget_seconds: float | None = None
+
+    @property
+    def key (self) -> str:
+        return f"{self.case}[scale={self.scale},horizon={self.horizon}]"
+
+    @property
+    def over_budget (self) -> bool:
+        return self.budget_seconds is not None and self.min_seconds > self.budget_seconds
+
+def measure (
+    case: str, setup: Callable[[], Callable[[], object]], *,
+    scale: int | None = None, horizon: int | None = None, repeat: int = 3,
+    budget_seconds: float | None = None, trace_memory: bool = True,
+) -> Measurement:
+    # setup runs outside the timed region and returns the call to time, fresh for every run
+    durations = []
+    for _ in range(repeat):
+        run = setup()
+        gc.collect()
+
+        start = time.perf_counter()
+        run()
+        durations.append(time.perf_counter() - start)
+
+    peak_bytes = allocated_blocks = 0
+    if trace_memory:
+        # Traced separately: tracemalloc slows allocation-heavy code down too much to time it
+        run = setup()
+        gc.collect()
+
+        blocks = sys.getallocatedblocks()
+        tracemalloc.start()
+        try:
+            result = run()
+            _, peak_bytes = tracemalloc.get_traced_memory()
+
+        finally:
+            tracemalloc.stop()
+
+        allocated_blocks = sys.getallocatedblocks() - blocks
+        del result
+
+    return Measurement(
+        case=case,
+        scale=scale,
+        horizon=horizon,
+        repeat=repeat,
+        seconds=statistics.median(durations),
+        min_seconds=min(durations),
+        peak_bytes=peak_bytes,
+        allocated_blocks=allocated_blocks,
+        budget_seconds=budget_seconds,
+    )
+
+def environment () -> dict[str, str]:
+    return {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+    }
+
+def save_results (path: str | Path, measurements: list[Measurement]) -> None:
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    payload = {
+        "environment": environment(),
+        "measurements": [dc.asdict(measurement) for measurement in measurements],
+    }
+    path.write_text(json.dumps(payload, indent=2) + "\n", encoding="utf-8")
+
+def load_results (path: str | Path) -> list[Measurement]:
+    payload = json.loads(Path(path).read_text(encoding="utf-8"))
+    return [Measurement(**measurement) for measurement in payload["measurements"]]
+
+class ComparisonStatus (StrEnum):
+    OK = "ok"
+    REGRESSION = "regression"
+    IMPROVEMENT = "improvement"
+    OVER_BUDGET = "over budget"
+    NEW = "new"
+    MISSING = "missing"
+
+@dc.dataclass(kw_only=True)
+class Comparison:
+    key: str
+    baseline: Measurement | None
+    current: Measurement | None
+    status: ComparisonStatus
+
+    @property
+    def time_ratio (self) -> float | None:
+        if self.baseline is None or self.current is None or self.baseline.min_seconds == 0:
+            return None
+
+        return self.current.min_seconds / self.baseline.min_seconds
+
+    @property
+    def time_delta (self) -> float:
+        if self.baseline is None or self.current is None:
+            return 0.0
+
+        return self.current.min_seconds - self.baseline.min_seconds
+
+    @property
+    def memory_ratio (self) -> float | None:
+        if self.baseline is None or self.current is None or self.baseline.peak_bytes < MIN_COMPARED_BYTES:
+            return None
+
+        return self.current.peak_bytes / self.baseline.peak_bytes
+
+def compare (
+    baseline: list[Measurement], current: list[Measurement], *, threshold: float = DEFAULT_THRESHOLD,
+) -> list[Comparison]:
+    # Times are compared on the fastest run, the one least disturbed by the rest of the machine
+    baseline_by_key = {measurement.key: measurement for measurement in baseline}
+    current_by_key = {measurement.key: measurement for measurement in current}
+
+    comparisons = []
+    for key in [*current_by_key, *(key for key in baseline_by_key if key not in current_by_key)]:
+        comparison = Comparison(
+            key=key,
+            baseline=baseline_by_key.get(key),
+            current=current_by_key.get(key),
+            status=ComparisonStatus.OK,
+        )
+
+        time_ratio = comparison.time_ratio if abs(comparison.time_delta) >= MIN_COMPARED_SECONDS else None
+        ratios = [ratio for ratio in (time_ratio, comparison.memory_ratio) if ratio is not None]
+        if comparison.current is None:
+            comparison.status = ComparisonStatus.MISSING
+
+        elif comparison.current.over_budget:
+            comparison.status = ComparisonStatus.OVER_BUDGET
+
+        elif comparison.baseline is None:
+            comparison.status = ComparisonStatus.NEW
+
+        elif any(ratio > 1 + threshold for ratio in ratios):
+            comparison.status = ComparisonStatus.REGRESSION
+
+        elif time_ratio is not None and time_ratio < 1 - threshold:
+            comparison.status = ComparisonStatus.IMPROVEMENT
+
+        comparisons.append(comparison)
+
+    return comparisons
+
+def failed (comparisons: list[Comparison]) -> bool:
+    return any(
+        comparison.status in (ComparisonStatus.REGRESSION, ComparisonStatus.OVER_BUDGET)
+        for comparison in comparisons
+    )
+
+def format_seconds (seconds: float | None) -> str:
+    if seconds is None:
+        return "-"
+
+    if seconds < 1e-3:
+        return f"{seconds * 1e6:.1f}us"
+
+    return f"{seconds * 1e3:.1f}ms" if seconds < 1 else f"{seconds:.2f}s"
+
+def format_bytes (size: int | None) -> str:
+    if size is None:
+        return "-"
+
+    return f"{size / (1 << 20):.1f}MB"
+
+def format_report (comparisons: list[Comparison]) -> str:
+    header = ("benchmark", "baseline", "current", "time", "peak memory", "status")
+    rows = [header]
+    for comparison in comparisons:
+        baseline, current = comparison.baseline, comparison.current
+        rows.append((
+            comparison.key,
+            format_seconds(baseline.min_seconds if baseline else None),
+            format_seconds(current.min_seconds if current else None),
+            f"x{comparison.time_ratio:.2f}" if comparison.time_ratio is not None else "-",
+            (
+                f"{format_bytes(baseline.peak_bytes)} -> {format_bytes(current.peak_bytes if current else None)}"
+                if baseline else format_bytes(current.peak_bytes)
+            ),
+            comparison.status.value,
+        ))
+
+    widths = [max(len(row[column]) for row in rows) for column in range(len(header))]
+    return "\n".join(
+        "  ".join(cell.ljust(width) for cell, width in zip(row, widths)).rstrip() for row in rows
+    )
+
+def format_measurements (measurements: list[Measurement]) -> str:
+    return format_report([
+        Comparison(
+            key=measurement.key, baseline=None, current=measurement,
+            status=ComparisonStatus.OVER_BUDGET if measurement.over_budget else ComparisonStatus.OK,
+        )
+        for measurement in measurements
+    ])
@@ -0,0 +1,108 @@
+import numpy as np
+import pandas as pd
+from enum import StrEnum
+from datetime import datetime
+
+from structs.balance import Balance, BalanceType, FrequencyType, SpreadType
+from structs.calendar import SimulationCalendar
+from structs.schedule import PAYMENT, CashFlowLedger
+from storage import BALANCE_COLUMNS
+
+
+# Every type, spread and frequency unit appears, cycled so any prefix of a ledger covers them
+COMBINATIONS = [
+    (balance_type, spread_type, frequency_unit)
+    for balance_type in BalanceType for spread_type in SpreadType for frequency_unit in FrequencyType
+]
+
+class TimingProfile (StrEnum):
+    # All balances active from month 0 and never expiring
+    STEADY = "steady"
+    # Starts spread over the horizon, long expiries
+    STAGGERED = "staggered"
+    # Short-lived balances starting and expiring all the time
+    CHURN = "churn"
+    # A blend of the three, plus fractional months and expiries before the start
+    MIXED = "mixed"
+
+def timing (profile: TimingProfile, rng: np.random.Generator, size: int, horizon: int) -> tuple[np.ndarray, np.ndarray]:
+    if profile is TimingProfile.STEADY:
+        return np.zeros(size), np.full(size, np.inf)
+
+    elif profile is TimingProfile.STAGGERED:
+        start = rng.integers(0, horizon, size).astype(float)
+        return start, np.where(rng.random(size) < 0.5, np.inf, start + rng.integers(horizon // 2 + 1, 2 * horizon + 2, size))
+
+    elif profile is TimingProfile.CHURN:
+        start = rng.integers(0, horizon, size).astype(float)
+        return start, start + rng.integers(1, 13, size)
+
+    pick = rng.integers(0, 3, size)
+    start, expiry = np.zeros(size), np.full(size, np.inf)
+    for idx, other in enumerate((TimingProfile.STEADY, TimingProfile.STAGGERED, TimingProfile.CHURN)):
+        other_start, other_expiry = timing(other, rng, size, horizon)
+        start = np.where(pick == idx, other_start, start)
+        expiry = np.where(pick == idx, other_expiry, expiry)
+
+    fractional = rng.random(size) < 0.1
+    start = np.where(fractional, start + rng.random(size), start)
+    expired = rng.random(size) < 0.02
+    expiry = np.where(expired, np.maximum(start - 1, -1), expiry)
+
+    return start, expiry
+
+def synthetic_ledger (
+    size: int, *, seed: int = 0, horizon: int = 120, profile: TimingProfile | str = TimingProfile.MIXED,
+) -> pd.DataFrame:
+    # Built column by column, so a million balances take about a second
+    profile = TimingProfile(profile)
+    rng = np.random.default_rng(seed)
+
+    combination = (np.arange(size) + int(rng.integers(len(COMBINATIONS)))) % len(COMBINATIONS)
+    balance_type, spread_type, frequency_unit = (
+        np.array([combo[field].value for combo in COMBINATIONS], dtype=object)[combination]
+        for field in range(3)
+    )
+    start, expiry = timing(profile, rng, size, horizon)
+    frequency = rng.choice([1.0, 2.0, 0.5, 3.0], size)
+
+    if size:
+        # A steady monthly payment keeps every month paying something, see horizon_payment_size
+        balance_type[0], spread_type[0], frequency_unit[0] = (
+            BalanceType.PAYMENT.value, SpreadType.MONTHLY.value, FrequencyType.MONTH.value
+        )
+        start[0], expiry[0], frequency[0] = 0, np.inf, 1
+
+    ids = np.char.add("b", np.arange(size).astype(str)).astype(object)
+
+    return pd.DataFrame({
+        "id": ids,
+        "name": ids,
+        "value": np.round(rng.lognormal(4.5, 1.0, size), 2),
+        "frequency": frequency,
+        "frequency_unit": frequency_unit,
+        "spread_type": spread_type,
+        "expiry": expiry,
+        "start_month": start,
+        "type": balance_type,
+    }, columns=list(BALANCE_COLUMNS))
+
+def synthetic_balances (size: int, *, seed: int = 0, prefix: str = "new", horizon: int = 120) -> list[Balance]:
+    df = synthetic_ledger(size, seed=seed, horizon=horizon)
+    df["id"] = prefix + df["id"]
+    df["name"] = df["id"]
+
+    return [
+        Balance(**{**row, "expiry": None if np.isinf(row["expiry"]) else row["expiry"]})
+        for row in df.to_dict(orient="records")
+    ]
+
+def horizon_payment_size (ledger: CashFlowLedger, horizon: int, start_date: datetime) -> float:
+    # With no payment interest the debt shrinks by the scheduled payments only, so a debt between
+    # the totals paid after horizon - 1 and horizon months is paid off in exactly horizon months.
+    # The anchor payment of synthetic ledgers keeps that total increasing every month.
+    payments = ledger.cash_flows(SimulationCalendar(start_date=start_date), np.arange(horizon))[:, PAYMENT]
+    paid = np.cumsum(payments)
+
+    previous = paid[-2] if horizon > 1 else 0.0
+    return float((previous + paid[-1]) / 2)
@@ -0,0 +1,365 @@
+import os
+import json
+import numpy as np
+import pandas as pd
+import dataclasses as dc
+from enum import StrEnum
+from pathlib import Path
+from collections import Counter
+from collections.abc import Iterator
+
+import instrumentation
+from structs.balance import BalanceType, FrequencyType, SpreadType
+from storage import BALANCE_COLUMNS
+from balance_handler import BalanceHandler
+
+
+# Records read, validated and hashed at a time; only accepted rows outlive their chunk
+IMPORT_CHUNK_ROWS = 50_000
+# Rejections listed in the report; later ones are only counted
+MAX_REPORTED_REJECTIONS = 10_000
+
+TEXT_COLUMNS = ("id", "name", "frequency_unit", "spread_type", "type")
+# Value of missing numbers: starts default to month 0 and expiries to never, while a missing
+# value or frequency rejects the row
+NUMERIC_DEFAULTS = {"value": np.nan, "frequency": np.nan, "start_month": 0.0, "expiry": np.inf}
+NUMERIC_COLUMNS = tuple(NUMERIC_DEFAULTS)
+# Decimals two numbers must share to be the same balance
+HASH_DECIMALS = 9
+REQUIRED_COLUMNS = ("id", "value", "frequency", "frequency_unit", "spread_type", "type")
+ENUM_CHECKS = (
+    ("frequency_unit", FrequencyType),
+    ("spread_type", SpreadType),
+    ("type", BalanceType),
+)
+
+
+class ImportFormat (StrEnum):
+    CSV = "csv"
+    JSON_LINES = "jsonl"
+
+    @classmethod
+    def from_path (cls, path: str | os.PathLike) -> "ImportFormat":
+        return cls.JSON_LINES if Path(path).suffix.lower() in (".jsonl", ".ndjson") else cls.CSV
+
+class RejectReason (StrEnum):
+    MALFORMED = "malformed"
+    MISSING_ID = "missing_id"
+    # NUL characters in the id or name, which no ledger file format keeps intact
+    INVALID_TEXT = "invalid_text"
+    INVALID_FREQUENCY_UNIT = "invalid_frequency_unit"
+    INVALID_SPREAD_TYPE = "invalid_spread_type"
+    INVALID_TYPE = "invalid_type"
+    INVALID_NUMBER = "invalid_number"
+    OUT_OF_RANGE = "out_of_range"
+    # Same id as an earlier row or a ledger balance, with the same contents
+    DUPLICATE_ID = "duplicate_id"
+    # Same id as an earlier row or a ledger balance, with different contents
+    CONFLICTING_ID = "conflicting_id"
+
+# (column, lowest allowed, whether the lowest itself is allowed, reason detail)
+NUMERIC_RANGES = (
+    ("value", 0.0, True, "value must be a non-negative finite number"),
+    ("frequency", 0.0, False, "frequency must be a positive finite number"),
+    ("start_month", 0.0, True, "start_month must be a non-negative finite number"),
+)
+
+# Rejections of the id checks, which run once every other check passed
+ID_CAUSES = (
+    (RejectReason.DUPLICATE_ID, "id repeats an identical balance"),
+    (RejectReason.CONFLICTING_ID, "id already holds a different balance"),
+)
+
+@dc.dataclass(kw_only=True, frozen=True)
+class RejectedRow:
+    # Line of the record in the source; CSV lines assume no quoted line breaks
+    line: int
+    id: str | None
+    reason: RejectReason
+    detail: str
+
+@dc.dataclass(kw_only=True)
+class ImportReport:
+    source: str
+    format: ImportFormat
+    read: int = 0
+    accepted: int = 0
+    rejected: int = 0
+    reasons: Counter = dc.field(default_factory=Counter)
+    rejections: list[RejectedRow] = dc.field(default_factory=list)
+
+    @property
+    def truncated (self) -> bool:
+        return self.rejected > len(self.rejections)
+
+    def reject (self, line: int, balance_id: str | None, reason: RejectReason, detail: str) -> None:
+        self.rejected += 1
+        self.reasons[reason] += 1
+        if len(self.rejections) < MAX_REPORTED_REJECTIONS:
+            self.rejections.append(RejectedRow(line=line, id=balance_id, reason=reason, detail=detail))
+
+    def rejections_frame (self) -> pd.DataFrame:
+        return pd.DataFrame(
+            [dc.astuple(rejection) for rejection in self.rejections],
+            columns=[field.name for field in dc.fields(RejectedRow)],
+        )
+
+    def summary (self) -> dict:
+        return {
+            "source": self.source,
+            "format": self.format.value,
+            "read": self.read,
+            "accepted": self.accepted,
+            "rejected": self.rejected,
+            "reasons": {reason.value: count for reason, count in sorted(self.reasons.items())},
+        }
+
+def csv_chunks (path: Path, chunk_rows: int) -> Iterator[tuple[pd.DataFrame, np.ndarray, list]]:
+    # Text columns are read verbatim, only blanks being missing; the parser already converts
+    # numeric columns of well-formed chunks, and leaves the others as text for validation
+    line = 2
+    with pd.read_csv(
+        path, dtype={column: str for column in TEXT_COLUMNS}, keep_default_na=False, na_values=[""],
+        chunksize=chunk_rows, skipinitialspace=True,
+    ) as reader:
+        for chunk in reader:
+            yield chunk.reset_index(drop=True), np.arange(line, line + len(chunk)), []
+            line += len(chunk)
+
+def json_lines_chunks (path: Path, chunk_rows: int) -> Iterator[tuple[pd.DataFrame, np.ndarray, list]]:
+    # Lines that are not JSON objects come back as (line, reason detail) instead of records
+    with open(path, encoding="utf-8") as file:
+        number = 0
+        while True:
+            records, lines, malformed = [], [], []
+            for text in file:
+                number += 1
+                if not text.strip():
+                    continue
+
+                try:
+                    record = json.loads(text)
+
+                except json.JSONDecodeError as e:
+                    malformed.append((number, f"invalid JSON: {e.msg}"))
+                    continue
+
+                if not isinstance(record, dict):
+                    malformed.append((number, "not a JSON object"))
+                    continue
+
+                records.append(record)
+                lines.append(number)
+                if len(records) == chunk_rows:
+                    break
+
+            if not records and not malformed:
+                return
+
+            yield pd.DataFrame.from_records(records), np.array(lines, dtype=np.int64), malformed
+
+def read_chunks (
+    path: Path, import_format: ImportFormat, chunk_rows: int
+) -> Iterator[tuple[pd.DataFrame, np.ndarray, list]]:
+    if import_format is ImportFormat.JSON_LINES:
+        return json_lines_chunks(path, chunk_rows)
+
+    return csv_chunks(path, chunk_rows)
+
+def text_column (chunk: pd.DataFrame, column: str) -> tuple[np.ndarray, np.ndarray]:
+    # The column as an object array of strings, blank where missing, and where it is blank
+    if column not in chunk.columns:
+        return np.full(len(chunk), "", dtype=object), np.ones(len(chunk), dtype=bool)
+
+    values = chunk[column].astype(str).to_numpy(dtype=object)
+    missing = pd.isna(values)
+    text = np.where(missing, "", values)
+
+    return text, missing | (text == "")
+
+def has_nul (text: np.ndarray) -> np.ndarray:
+    # Clean chunks, by far the common case, are settled with one scan of the joined column
+    if "\0" not in "".join(text):
+        return np.zeros(len(text), dtype=bool)
+
+    return np.fromiter(("\0" in value for value in text), dtype=bool, count=len(text))
+
+def numeric_column (chunk: pd.DataFrame, column: str) -> tuple[np.ndarray, np.ndarray]:
+    # The column as floats, NaN where it is not a number, and where it is missing or blank
+    if column not in chunk.columns:
+        return np.full(len(chunk), np.nan), np.ones(len(chunk), dtype=bool)
+
+    values = chunk[column]
+    numbers = pd.to_numeric(values, errors="coerce").to_numpy(dtype=float)
+    missing = values.isna().to_numpy().copy()
+    # Only rows that did not parse can be blank, so the string test stays off the common path
+    unparsed = np.flatnonzero(np.isnan(numbers) & ~missing)
+    missing[unparsed] = values.iloc[unparsed].astype(str).str.strip().eq("").to_numpy()
+
+    return numbers, missing
+
+def normalize_chunk (chunk: pd.DataFrame) -> tuple[pd.DataFrame, dict[str, np.ndarray]]:
+    # The chunk in ledger dtypes, plus the rows rejected by every check as (reason, detail)
+    # masks; the first failing check of a row is the one reported
+    n = len(chunk)
+    failures = {}
+
+    def fail (mask: np.ndarray, reason: RejectReason, detail: str) -> None:
+        failures.setdefault((reason, detail), np.zeros(n, dtype=bool))
+        failures[(reason, detail)] |= mask
+
+    ids, missing_id = text_column(chunk, "id")
+    names, missing_name = text_column(chunk, "name")
+    names = np.where(missing_name, ids, names)
+    fail(missing_id, RejectReason.MISSING_ID, "id is missing")
+    fail(
+        has_nul(ids) | has_nul(names),
+        RejectReason.INVALID_TEXT, "id and name cannot contain NUL characters",
+    )
+
+    columns = {"id": ids, "name": names}
+    for column, enum in ENUM_CHECKS:
+        text, missing = text_column(chunk, column)
+        valid = np.isin(text, np.array([member.value for member in enum], dtype=object))
+        fail(~valid, RejectReason(f"invalid_{column}"), f"{column} must be one of {', '.join(enum)}")
+        columns[column] = text
+
+    for column, default in NUMERIC_DEFAULTS.items():
+        numbers, missing = numeric_column(chunk, column)
+        fail(~missing & np.isnan(numbers), RejectReason.INVALID_NUMBER, f"{column} is not a number")
+        if np.isnan(default):
+            fail(missing, RejectReason.INVALID_NUMBER, f"{column} is missing")
+
+        columns[column] = np.where(missing, default, numbers)
+
+    for column, low, inclusive, detail in NUMERIC_RANGES:
+        numbers = columns[column]
+        with np.errstate(invalid="ignore"):
+            valid = np.isfinite(numbers) & ((numbers >= low) if inclusive else (numbers > low))
+
+        fail(~np.isnan(numbers) & ~valid, RejectReason.OUT_OF_RANGE, detail)
+
+    frame = pd.DataFrame({column: columns[column] for column in BALANCE_COLUMNS})
+    return frame, failures
+
+def row_hashes (frame: pd.DataFrame) -> np.ndarray:
+    # Content hash of ledger rows, to tell a repeated balance from a conflicting one; the id
+    # is left out as rows are only compared under the same id. Numbers are rounded, as a CSV
+    # round trip may change their last digit, and missing starts and expiries take their defaults.
+    normalized = pd.DataFrame({
+        column: (
+            frame[column].astype(float).fillna(NUMERIC_DEFAULTS[column]).round(HASH_DECIMALS)
+            if column in NUMERIC_COLUMNS else frame[column].astype(str)
+        )
+        for column in BALANCE_COLUMNS if column != "id"
+    })
+
+    return pd.util.hash_pandas_object(normalized, index=False).to_numpy()
+
+@dc.dataclass(kw_only=True)
+class BulkImport:
+    # Accepted rows are kept in ledger dtypes and appended in one pass once the source is read,
+    # so a failure halfway leaves the ledger untouched
+    handler: BalanceHandler
+    report: ImportReport
+    chunk_rows: int = IMPORT_CHUNK_ROWS
+
+    accepted: list[pd.DataFrame] = dc.field(init=False, default_factory=list)
+    # Content hash of every id in the ledger or accepted so far
+    seen: dict[str, int] = dc.field(init=False)
+
+    def __post_init__ (self) -> None:
+        ledger = self.handler.df
+        self.seen = dict(zip(ledger["id"].astype(str).tolist(), row_hashes(ledger).tolist())) if len(ledger) else {}
+
+    def add_chunk (self, chunk: pd.DataFrame, lines: np.ndarray, malformed: list) -> None:
+        for line, detail in malformed:
+            self.report.reject(line, None, RejectReason.MALFORMED, detail)
+
+        self.report.read += len(chunk) + len(malformed)
+        if len(chunk) == 0:
+            return
+
+        with instrumentation.phase("import.validate") as phase:
+            phase.iterations = len(chunk)
+            frame, failures = normalize_chunk(chunk)
+
+            # Index into `causes` of the first check each row fails, -1 for accepted rows
+            causes = list(failures)
+            codes = np.full(len(frame), -1, dtype=np.int64)
+            for code, mask in enumerate(failures.values()):
+                codes[mask & (codes < 0)] = code
+
+            causes.extend(ID_CAUSES)
+            self._check_ids(frame, codes, len(causes) - len(ID_CAUSES))
+
+        ids = frame["id"].to_numpy(dtype=object)
+        for row in np.flatnonzero(codes >= 0).tolist():
+            reason, detail = causes[codes[row]]
+            self.report.reject(int(lines[row]), ids[row] or None, reason, detail)
+
+        accepted = frame[codes < 0]
+        self.report.accepted += len(accepted)
+        if len(accepted):
+            self.accepted.append(accepted)
+
+    def _check_ids (self, frame: pd.DataFrame, codes: np.ndarray, first_code: int) -> None:
+        # The first row of an id is accepted; later rows, and rows repeating a ledger balance,
+        # are duplicates when identical and conflicts otherwise
+        rows = np.flatnonzero(codes < 0)
+        ids = frame["id"].to_numpy(dtype=object)[rows]
+        hashes = row_hashes(frame.iloc[rows])
+
+        repeated = pd.Series(ids).duplicated().to_numpy()
+        known = np.fromiter((balance_id in self.seen for balance_id in ids), dtype=bool, count=len(ids))
+
+        first = ~repeated & ~known
+        self.seen.update(zip(ids[first].tolist(), hashes[first].tolist()))
+
+        for index in np.flatnonzero(repeated | known).tolist():
+            conflicting = self.seen[ids[index]] != hashes[index]
+            codes[rows[index]] = first_code + int(conflicting)
+
+    def run (self, path: Path) -> None:
+        for chunk, lines, malformed in read_chunks(path, self.report.format, self.chunk_rows):
+            self.add_chunk(chunk, lines, malformed)
+
+    def commit (self) -> None:
+        if self.accepted:
+            self.handler.append_frame(pd.concat(self.accepted, ignore_index=True))
+            self.accepted = []
+
+def bulk_import (
+    handler: BalanceHandler, path: str | os.PathLike, *,
+    import_format: ImportFormat | str | None = None, chunk_rows: int = IMPORT_CHUNK_ROWS,
+    dry_run: bool = False,
+) -> ImportReport:
+    # Validates a CSV or JSON lines export chunk by chunk and appends the accepted balances;
+    # a dry run only reports. Rejected rows never stop the import.
+    path = Path(path)
+    if not path.exists():
+        raise ValueError(f"Balance file {path} not found")
+
+    import_format = ImportFormat(import_format) if import_format is not None else ImportFormat.from_path(path)
+    if chunk_rows <= 0:
+        raise ValueError(f"Import chunk size must be positive, got {chunk_rows}")
+
+    if import_format is ImportFormat.CSV:
+        header = pd.read_csv(path, nrows=0, skipinitialspace=True).columns
+        missing = [column for column in REQUIRED_COLUMNS if column not in header]
+        if missing:
+            raise ValueError(f"Balance file {path} is missing columns {', '.join(missing)}")
+
+    with instrumentation.phase("import.bulk") as phase:
+        job = BulkImport(
+            handler=handler,
+            report=ImportReport(source=str(path), format=import_format),
+            chunk_rows=chunk_rows,
+        )
+        job.run(path)
+        if not dry_run:
+            job.commit()
+
+        phase.iterations = job.report.read
+
+    return job.report
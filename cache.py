@@ -0,0 +1,164 @@
+import os
+import pickle
+import hashlib
+import threading
+import dataclasses as dc
+from pathlib import Path
+from collections import OrderedDict
+
+import config
+
+
+# Bumped whenever cached result classes change shape, so older pickles are never looked up
+CACHE_FORMAT_VERSION = 1
+
+def result_size (value: object) -> int:
+    # Results are numpy-backed, so their buffers dominate; anything else is measured pickled
+    arrays = [field for field in getattr(value, "__dict__", {}).values() if hasattr(field, "nbytes")]
+    if arrays:
+        return sum(int(array.nbytes) for array in arrays)
+
+    return len(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+
+def cache_key (ledger_hash: str, kind: str, **parameters) -> str:
+    payload = repr((
+        CACHE_FORMAT_VERSION, ledger_hash, kind, sorted(parameters.items()),
+        config.PAYMENT_INTEREST_RATE, config.INVESTMENT_INTERST_RATE,
+    ))
+
+    return hashlib.blake2b(payload.encode(), digest_size=20).hexdigest()
+
+@dc.dataclass(kw_only=True)
+class CacheStats:
+    hits: int = 0
+    disk_hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+
+    @property
+    def hit_rate (self) -> float:
+        lookups = self.hits + self.disk_hits + self.misses
+        return (self.hits + self.disk_hits) / lookups if lookups else 0.0
+
+@dc.dataclass(kw_only=True)
+class SimulationCache:
+    max_entries: int = 128
+    max_bytes: int = 256 << 20
+    # Optional second tier of pickled results, evicted least recently used first
+    disk_path: Path | None = None
+    max_disk_bytes: int = 1 << 30
+
+    stats: CacheStats = dc.field(init=False, default_factory=CacheStats)
+    _entries: OrderedDict[str, tuple[object, int]] = dc.field(init=False, default_factory=OrderedDict, repr=False)
+    _bytes: int = dc.field(init=False, default=0, repr=False)
+    _lock: threading.Lock = dc.field(init=False, default_factory=threading.Lock, repr=False)
+
+    def __post_init__ (self) -> None:
+        if self.disk_path is not None:
+            self.disk_path = Path(self.disk_path)
+            self.disk_path.mkdir(parents=True, exist_ok=True)
+
+    def __len__ (self) -> int:
+        return len(self._entries)
+
+    @property
+    def nbytes (self) -> int:
+        return self._bytes
+
+    def _disk_file (self, key: str) -> Path | None:
+        return self.disk_path / f"{key}.pkl" if self.disk_path is not None else None
+
+    def get (self, key: str) -> object | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.stats.hits += 1
+                return entry[0]
+
+        value = self._load_disk(key)
+        if value is None:
+            self.stats.misses += 1
+            return None
+
+        self.stats.disk_hits += 1
+        self._put_memory(key, value)
+
+        return value
+
+    def put (self, key: str, value: object) -> None:
+        self._put_memory(key, value)
+        self._store_disk(key, value)
+
+    def _put_memory (self, key: str, value: object) -> None:
+        size = result_size(value)
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous[1]
+
+            self._entries[key] = (value, size)
+            self._bytes += size
+
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._bytes -= evicted
+                self.stats.evictions += 1
+
+    def _load_disk (self, key: str) -> object | None:
+        path = self._disk_file(key)
+        if path is None:
+            return None
+
+        try:
+            with open(path, "rb") as file:
+                value = pickle.load(file)
+
+        except FileNotFoundError:
+            return None
+
+        except Exception:
+            # Truncated, corrupt or written by code that no longer exists: a miss, and the file goes
+            path.unlink(missing_ok=True)
+            return None
+
+        os.utime(path)
+        return value
+
+    def _store_disk (self, key: str, value: object) -> None:
+        path = self._disk_file(key)
+        if path is None:
+            return
+
+        tmp_path = path.with_name(f".{path.name}.{threading.get_ident()}.tmp")
+        with open(tmp_path, "wb") as file:
+            pickle.dump(value, file, protocol=pickle.HIGHEST_PROTOCOL)
+
+        os.replace(tmp_path, path)
+        self._evict_disk()
+
+    def _evict_disk (self) -> None:
+        files = sorted(
+            ((path.stat(), path) for path in self.disk_path.glob("*.pkl")),
+            key=lambda item: item[0].st_mtime,
+        )
+        total = sum(stat.st_size for stat, _ in files)
+
+        for stat, path in files:
+            if total <= self.max_disk_bytes:
+                break
+
+            path.unlink(missing_ok=True)
+            total -= stat.st_size
+
+    def clear (self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+        if self.disk_path is not None:
+            for path in self.disk_path.glob("*.pkl"):
+                path.unlink(missing_ok=True)
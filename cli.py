@@ -0,0 +1,521 @@
+import sys
+import csv
+import json
+import argparse
+import dataclasses as dc
+from datetime import datetime
+from typing import IO
+
+import config
+
+
+# Wall-clock budget for `python cli.py --help`, checked by the benchmark suite. Only argparse
+# and config load before a command runs; numpy, pandas and the engines are imported by the
+# command that needs them and matplotlib never is.
+STARTUP_BUDGET_SECONDS = 0.25
+
+# Mirrors simulate.SimulationEngine without importing the engines to build the parser
+ENGINES = ("loop", "vectorized", "fast_forward")
+SUMMARY_COLUMNS = ("months", "paid_off", "final_payment", "final_investment")
+# Mirrors solver.GoalParameter
+GOAL_PARAMETERS = ("payment_size", "investment_size", "initial_payment", "investment_yearly_percentage")
+SWEEP_PARAMETERS = (
+    "payment_size", "investment_size", "initial_payment", "profit_tax", "investment_yearly_percentage"
+)
+
+
+def parse_date (value: str) -> datetime:
+    try:
+        return datetime.fromisoformat(value)
+
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid date {value!r}, expected YYYY-MM-DD")
+
+def write_json (payload: dict, output: IO[str]) -> None:
+    json.dump(payload, output, separators=(",", ":"))
+    output.write("\n")
+
+def write_csv (header: list[str], rows: list[list], output: IO[str]) -> None:
+    writer = csv.writer(output, lineterminator="\n")
+    writer.writerow(header)
+    writer.writerows(rows)
+
+def open_handler (path: str | None):
+    from balance_handler import BalanceHandler
+    from storage import storage_for
+
+    return BalanceHandler(storage=storage_for(path) if path is not None else None)
+
+def apply_rates (args: argparse.Namespace) -> None:
+    # The engines read the monthly rates from config when they run
+    if args.payment_rate is not None:
+        config.PAYMENT_INTEREST_RATE = args.payment_rate
+
+    if args.investment_rate is not None:
+        config.INVESTMENT_INTERST_RATE = args.investment_rate
+
+def start_profiling (spec: str) -> None:
+    # Replaces whatever BALANCE_PROFILE configured
+    import logging
+    import instrumentation
+
+    if "log" in spec.split(","):
+        logging.basicConfig(level=logging.INFO, stream=sys.stderr, format="%(name)s: %(message)s")
+
+    instrumentation.configure(spec)
+
+def stop_profiling () -> None:
+    import instrumentation
+
+    profiler = instrumentation.active()
+    for sink in profiler.sinks if profiler is not None else []:
+        if isinstance(sink, instrumentation.MemorySink):
+            print(instrumentation.format_summary(sink.summary()), file=sys.stderr)
+
+    instrumentation.disable()
+
+def stream_run (args: argparse.Namespace, output: IO[str], parameters: dict) -> None:
+    # Months are written as they are simulated and never kept, so the run takes constant memory
+    from streaming import extra_credit_below, investment_below, max_horizon, stream_payment_trajectory
+    from structs.trajectory import BREAKDOWN_COLUMNS, TRAJECTORY_COLUMNS
+
+    if args.engine != "loop":
+        raise ValueError("streamed runs only support the loop engine")
+
+    stop = []
+    if args.max_months is not None:
+        stop.append(max_horizon(args.max_months))
+
+    if args.min_investment is not None:
+        stop.append(investment_below(args.min_investment))
+
+    if args.min_extra_credit is not None:
+        stop.append(extra_credit_below(args.min_extra_credit))
+
+    writer = csv.writer(output, lineterminator="\n")
+    if args.format == "csv" and not args.summary:
+        writer.writerow(["month", *TRAJECTORY_COLUMNS])
+
+    handler = open_handler(args.ledger)
+    try:
+        stream = stream_payment_trajectory(
+            handler, args.payment_size, args.investment_size, **parameters, stop=stop
+        )
+
+        for point in stream:
+            if args.summary:
+                continue
+
+            row = [
+                point.month, point.payment_size, point.investment_size,
+                *(getattr(point.total_breakdown, name) for name in BREAKDOWN_COLUMNS),
+            ]
+            if args.format == "csv":
+                writer.writerow(row)
+
+            else:
+                write_json(dict(zip(("month", *TRAJECTORY_COLUMNS), row)), output)
+
+            output.flush()
+
+    finally:
+        handler.close()
+
+    summary = [
+        point.month, not point.payment_size > 0, point.payment_size, point.investment_size, stream.reason.value
+    ]
+    if args.format == "csv":
+        if args.summary:
+            write_csv([*SUMMARY_COLUMNS, "stop_reason"], [summary], output)
+
+        return
+
+    # JSON lines: one object per month, then the summary
+    write_json(dict(zip((*SUMMARY_COLUMNS, "stop_reason"), summary)), output)
+
+def run_command (args: argparse.Namespace, output: IO[str]) -> None:
+    from simulate import get_payment_fast_forward, get_payment_trajectory
+    from structs.trajectory import TRAJECTORY_COLUMNS
+
+    parameters = dict(
+        initial_payment=args.initial_payment,
+        profit_tax=args.profit_tax,
+        investment_yearly_percentage=args.investment_yearly,
+        start_date=args.start_date,
+    )
+
+    stops = (args.max_months, args.min_investment, args.min_extra_credit)
+    if args.stream or any(value is not None for value in stops):
+        return stream_run(args, output, parameters)
+
+    handler = open_handler(args.ledger)
+    try:
+        if args.summary and args.engine == "fast_forward":
+            # Closed-form segments give the summary without materializing any month
+            simulation = get_payment_fast_forward(handler, args.payment_size, args.investment_size, **parameters)
+            summary = [simulation.months, simulation.paid_off, simulation.payment_size, simulation.investment_size]
+            trajectory = None
+
+        else:
+            trajectory = get_payment_trajectory(
+                handler, args.payment_size, args.investment_size, **parameters, engine=args.engine
+            )
+            summary = [
+                len(trajectory) - 1, not trajectory.payment_size[-1] > 0,
+                trajectory.payment_size[-1], trajectory.investment_size[-1],
+            ]
+
+    finally:
+        handler.close()
+
+    summary = [int(summary[0]), bool(summary[1]), float(summary[2]), float(summary[3])]
+    if args.format == "csv":
+        if trajectory is None or args.summary:
+            write_csv(list(SUMMARY_COLUMNS), [summary], output)
+
+        else:
+            rows = [[month, *values] for month, values in enumerate(trajectory.to_numpy().tolist())]
+            write_csv(["month", *TRAJECTORY_COLUMNS], rows, output)
+
+        return
+
+    payload = dict(zip(SUMMARY_COLUMNS, summary))
+    if trajectory is not None and not args.summary:
+        payload["trajectory"] = {
+            name: trajectory.column(name).tolist() for name in TRAJECTORY_COLUMNS
+        }
+
+    write_json(payload, output)
+
+def sweep_command (args: argparse.Namespace, output: IO[str]) -> None:
+    from simulate import get_payment_sweep
+
+    handler = open_handler(args.ledger)
+    try:
+        sweep = get_payment_sweep(
+            handler, args.payment_size, args.investment_size,
+            initial_payment=args.initial_payment,
+            profit_tax=args.profit_tax,
+            investment_yearly_percentage=args.investment_yearly,
+            start_date=args.start_date,
+            grid=args.grid,
+            keep_trajectories=False,
+        )
+
+    finally:
+        handler.close()
+
+    columns = {
+        **{name: sweep.parameters[name].tolist() for name in SWEEP_PARAMETERS},
+        "months": sweep.months.tolist(),
+        "paid_off": sweep.paid_off.tolist(),
+        "final_payment": sweep.final_payment.tolist(),
+        "final_investment": sweep.final_investment.tolist(),
+    }
+
+    if args.format == "csv":
+        write_csv(list(columns), [list(row) for row in zip(*columns.values())], output)
+
+    else:
+        write_json({"scenarios": [dict(zip(columns, row)) for row in zip(*columns.values())]}, output)
+
+def solve_command (args: argparse.Namespace, output: IO[str]) -> None:
+    from simulate import get_goal_solution
+
+    if args.payoff_within is not None:
+        metric, target = "payoff_month", args.payoff_within
+
+    else:
+        metric, target = "final_investment", args.final_investment
+
+    handler = open_handler(args.ledger)
+    try:
+        solution = get_goal_solution(
+            handler, args.payment_size, args.investment_size,
+            parameter=args.parameter,
+            metric=metric,
+            target=target,
+            initial_payment=args.initial_payment,
+            profit_tax=args.profit_tax,
+            investment_yearly_percentage=args.investment_yearly,
+            start_date=args.start_date,
+            low=args.low,
+            high=args.high,
+            guess=args.guess,
+            tolerance=args.tolerance,
+        )
+
+    finally:
+        handler.close()
+
+    evaluation = solution.evaluation
+    result = {
+        "parameter": solution.parameter.value,
+        "metric": solution.metric.value,
+        "target": target,
+        "value": solution.value,
+        "months": evaluation.months if evaluation else None,
+        "paid_off": evaluation.paid_off if evaluation else None,
+        "final_payment": evaluation.final_payment if evaluation else None,
+        "final_investment": evaluation.final_investment if evaluation else None,
+        "evaluations": solution.evaluations,
+        "converged": solution.converged,
+    }
+
+    if args.format == "csv":
+        write_csv(list(result), [list(result.values())], output)
+
+    else:
+        write_json(result, output)
+
+def portfolios_command (args: argparse.Namespace, output: IO[str]) -> None:
+    import pandas as pd
+    from portfolio import PORTFOLIO_COLUMN, PortfolioLedger
+    from simulate import get_portfolio_simulation
+
+    ledger = PortfolioLedger.from_csv(args.source)
+    parameters = dict(zip(SWEEP_PARAMETERS, (
+        args.payment_size, args.investment_size, args.initial_payment, args.profit_tax, args.investment_yearly
+    )))
+
+    if args.plans is not None:
+        # Per-portfolio values for any of the parameters; the options fill in what a plan leaves out
+        try:
+            plans = pd.read_csv(args.plans, dtype={PORTFOLIO_COLUMN: str})
+
+        except FileNotFoundError:
+            raise ValueError(f"Plan file {args.plans} not found")
+
+        if PORTFOLIO_COLUMN not in plans.columns:
+            raise ValueError(f"Plan file {args.plans} has no {PORTFOLIO_COLUMN} column")
+
+        plans = plans.drop_duplicates(PORTFOLIO_COLUMN, keep="last").set_index(PORTFOLIO_COLUMN)
+        plans = plans.reindex(ledger.portfolios)
+        for name in SWEEP_PARAMETERS:
+            if name in plans.columns:
+                parameters[name] = pd.to_numeric(plans[name], errors="coerce").fillna(parameters[name]).to_numpy()
+
+    simulation = get_portfolio_simulation(
+        ledger, **parameters,
+        start_date=args.start_date,
+        keep_trajectories=False,
+        max_months=args.max_months,
+    )
+    summary = simulation.summary()
+
+    if args.format == "csv":
+        write_csv(list(summary.columns), summary.to_numpy().tolist(), output)
+
+    else:
+        write_json({"portfolios": summary.to_dict(orient="records")}, output)
+
+def import_command (args: argparse.Namespace, output: IO[str]) -> None:
+    if args.append or args.dry_run:
+        bulk_import_command(args, output)
+        return
+
+    handler = open_handler(args.ledger)
+    try:
+        handler.import_csv(args.source)
+        handler.save()
+
+    finally:
+        handler.close()
+
+    summary = {"ledger": str(handler.storage.path), "balances": len(handler.df)}
+    if args.format == "csv":
+        write_csv(list(summary), [list(summary.values())], output)
+
+    else:
+        write_json(summary, output)
+
+def bulk_import_command (args: argparse.Namespace, output: IO[str]) -> None:
+    from bulk_import import IMPORT_CHUNK_ROWS, bulk_import
+
+    handler = open_handler(args.ledger)
+    try:
+        report = bulk_import(
+            handler, args.source,
+            import_format=args.input_format,
+            chunk_rows=args.chunk_rows if args.chunk_rows is not None else IMPORT_CHUNK_ROWS,
+            dry_run=args.dry_run,
+        )
+        if not args.dry_run:
+            handler.save()
+
+    finally:
+        handler.close()
+
+    if args.rejects:
+        report.rejections_frame().to_csv(args.rejects, index=False)
+
+    summary = {"ledger": str(handler.storage.path), "balances": len(handler.df), **report.summary()}
+    if args.format == "csv":
+        # The per-reason counts are in the rejections listing, or the JSON summary
+        summary.pop("reasons")
+        write_csv(list(summary), [list(summary.values())], output)
+
+    else:
+        summary["truncated"] = report.truncated
+        summary["rejections"] = [dc.asdict(rejection) for rejection in report.rejections]
+        write_json(summary, output)
+
+def serve_command (args: argparse.Namespace, output: IO[str]) -> None:
+    from service import LedgerPool, SimulationService, ServiceServer
+
+    if args.start_date is not None:
+        config.SIMULATION_START_DATE = args.start_date.date().isoformat()
+
+    service = SimulationService(
+        workers=args.workers,
+        max_pending=args.max_pending,
+        batch_window=args.batch_window_ms / 1000,
+        ledgers=LedgerPool(default_path=args.ledger),
+    )
+    # The default ledger is loaded before the first request rather than by it
+    service.ledgers.get(None)
+
+    with service, ServiceServer(service, args.host, args.port) as server:
+        write_json({"url": server.url}, output)
+        output.flush()
+
+        try:
+            server.serve_forever()
+
+        except KeyboardInterrupt:
+            pass
+
+def build_parser () -> argparse.ArgumentParser:
+    ledger = argparse.ArgumentParser(add_help=False)
+    ledger.add_argument("--ledger", help="ledger file, .csv or columnar (default: BALANCE_FILE_PATH)")
+
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--format", choices=("json", "csv"), default="json")
+    common.add_argument("--output", "-o", help="write the result to this file instead of stdout")
+    common.add_argument(
+        "--profile", metavar="SINKS",
+        help="time the pipeline phases: log, memory (summary on stderr) or a JSON lines path, comma-separated",
+    )
+
+    rates = argparse.ArgumentParser(add_help=False)
+    rates.add_argument("--start-date", type=parse_date, default=None, help="YYYY-MM-DD (default: SIMULATION_START_DATE, else today)")
+    rates.add_argument("--payment-rate", type=float, help="monthly payment interest (default: PAYMENT_INTEREST_RATE)")
+    rates.add_argument("--investment-rate", type=float, help="monthly investment interest (default: INVESTMENT_INTEREST_RATE)")
+
+    parser = argparse.ArgumentParser(prog="simulate", description="Headless balance simulations.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", parents=[common, ledger, rates], help="simulate one payment plan")
+    run.add_argument("--payment-size", type=float, default=config.DEBIT_SIZE)
+    run.add_argument("--investment-size", type=float, default=config.INVESTMENT_SIZE)
+    run.add_argument("--initial-payment", type=float, default=0.0)
+    run.add_argument("--profit-tax", type=float, default=0.0)
+    run.add_argument("--investment-yearly", type=float, default=0.0)
+    run.add_argument("--engine", choices=ENGINES, default="loop")
+    run.add_argument("--summary", action="store_true", help="only print the payoff summary")
+    run.add_argument(
+        "--stream", action="store_true",
+        help="write every month as it is simulated (JSON lines or CSV rows); implied by the stop options",
+    )
+    run.add_argument("--max-months", type=int, help="stop after this many months")
+    run.add_argument("--min-investment", type=float, help="stop once the investment falls below this")
+    run.add_argument("--min-extra-credit", type=float, help="stop once a month's extra credit falls below this")
+    run.set_defaults(handler=run_command)
+
+    sweep = commands.add_parser("sweep", parents=[common, ledger, rates], help="simulate many payment plans at once")
+    sweep.add_argument("--payment-size", type=float, nargs="+", default=[config.DEBIT_SIZE])
+    sweep.add_argument("--investment-size", type=float, nargs="+", default=[config.INVESTMENT_SIZE])
+    sweep.add_argument("--initial-payment", type=float, nargs="+", default=[0.0])
+    sweep.add_argument("--profit-tax", type=float, nargs="+", default=[0.0])
+    sweep.add_argument("--investment-yearly", type=float, nargs="+", default=[0.0])
+    sweep.add_argument("--grid", action="store_true", help="cross every value instead of pairing them")
+    sweep.set_defaults(handler=sweep_command)
+
+    solve = commands.add_parser(
+        "solve", parents=[common, ledger, rates], help="find the parameter value that meets a payoff or investment goal"
+    )
+    solve.add_argument("parameter", choices=GOAL_PARAMETERS, help="the parameter to adjust")
+    goal = solve.add_mutually_exclusive_group(required=True)
+    goal.add_argument("--payoff-within", type=int, metavar="MONTHS", help="pay the debt off within this many months")
+    goal.add_argument("--final-investment", type=float, metavar="VALUE", help="end with at least this investment")
+    solve.add_argument("--payment-size", type=float, default=config.DEBIT_SIZE)
+    solve.add_argument("--investment-size", type=float, default=config.INVESTMENT_SIZE)
+    solve.add_argument("--initial-payment", type=float, default=0.0)
+    solve.add_argument("--profit-tax", type=float, default=0.0)
+    solve.add_argument("--investment-yearly", type=float, default=0.0)
+    solve.add_argument("--low", type=float, help="lowest value to try (default depends on the parameter)")
+    solve.add_argument("--high", type=float, help="highest value to try (default depends on the parameter)")
+    solve.add_argument("--guess", type=float, help="a value close to the answer, such as a previous solution")
+    solve.add_argument("--tolerance", type=float, help="width of the final bracket (default: a cent, or 0.0001)")
+    solve.set_defaults(handler=solve_command)
+
+    portfolios = commands.add_parser(
+        "portfolios", parents=[common, rates], help="simulate every portfolio of a combined ledger at once"
+    )
+    portfolios.add_argument("source", help="CSV file with the balance columns and a portfolio column")
+    portfolios.add_argument("--plans", help="CSV file with a portfolio column and per-portfolio parameters")
+    portfolios.add_argument("--payment-size", type=float, default=config.DEBIT_SIZE)
+    portfolios.add_argument("--investment-size", type=float, default=config.INVESTMENT_SIZE)
+    portfolios.add_argument("--initial-payment", type=float, default=0.0)
+    portfolios.add_argument("--profit-tax", type=float, default=0.0)
+    portfolios.add_argument("--investment-yearly", type=float, default=0.0)
+    portfolios.add_argument("--max-months", type=int, default=None, help="stop portfolios still paying after this")
+    portfolios.set_defaults(handler=portfolios_command)
+
+    load = commands.add_parser("import", parents=[common, ledger], help="replace the ledger with a CSV file, or append an export")
+    load.add_argument("source", help="CSV file with the balance columns, or a CSV or JSON lines export with --append")
+    load.add_argument(
+        "--append", action="store_true",
+        help="validate the export chunk by chunk and append the valid balances, reporting rejected rows",
+    )
+    load.add_argument("--dry-run", action="store_true", help="validate and report as --append, without changing the ledger")
+    load.add_argument("--input-format", choices=("csv", "jsonl"), help="format of the export (default: from its extension)")
+    load.add_argument("--chunk-rows", type=int, help="rows validated at a time (default: 50000)")
+    load.add_argument("--rejects", metavar="PATH", help="write the rejected rows and their reasons to this CSV file")
+    load.set_defaults(handler=import_command)
+
+    serve = commands.add_parser(
+        "serve", parents=[common, ledger, rates], help="serve run, sweep and solve requests over local HTTP"
+    )
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=8765, help="0 picks a free port (default: 8765)")
+    serve.add_argument("--workers", type=int, default=4, help="simulations running at once (default: 4)")
+    serve.add_argument("--max-pending", type=int, default=256, help="requests queued before turning new ones away")
+    serve.add_argument(
+        "--batch-window-ms", type=float, default=2.0,
+        help="how long a summary run waits to share a vectorized pass with others (default: 2)",
+    )
+    serve.set_defaults(handler=serve_command)
+
+    return parser
+
+def main (argv: list[str] | None = None) -> int:
+    parser = build_parser()
+    args = parser.parse_args(argv)
+
+    if hasattr(args, "payment_rate"):
+        apply_rates(args)
+
+    # BALANCE_PROFILE may have turned profiling on already; either way the summary is printed
+    profiling = args.profile is not None or bool(config.BALANCE_PROFILE)
+    if args.profile is not None:
+        start_profiling(args.profile)
+
+    output = open(args.output, "w", newline="", encoding="utf-8") if args.output else sys.stdout
+    try:
+        args.handler(args, output)
+
+    except ValueError as e:
+        parser.exit(1, f"{parser.prog}: error: {e}\n")
+
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+        if profiling:
+            stop_profiling()
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
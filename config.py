@@ -2,7 +2,18 @@ import os
 from typing import Final
 
 
-BALANCE_FILE_PATH: Final = os.getenv("BALANCE_FILE_PATH", "balance.csv")
+BALANCE_FILE_PATH: Final = os.getenv("BALANCE_FILE_PATH", "balance.bal")
+BALANCE_JOURNAL: bool = os.getenv("BALANCE_JOURNAL", "1") != "0"
+BALANCE_JOURNAL_COMPACT_BYTES: int = int(os.getenv("BALANCE_JOURNAL_COMPACT_BYTES", 1 << 20))
+
+# Phase timing sinks: "log", "memory" or a JSON lines path, comma-separated; unset disables it
+BALANCE_PROFILE: str | None = os.getenv("BALANCE_PROFILE")
+
+# Directory of the on-disk simulation cache tier, disabled when unset
+SIMULATION_CACHE_PATH: str | None = os.getenv("SIMULATION_CACHE_PATH")
+
+# First simulated month as YYYY-MM-DD, so runs are reproducible; unset starts today
+SIMULATION_START_DATE: str | None = os.getenv("SIMULATION_START_DATE")
 
 # DEBIT VARIABLES
 DEBIT_SIZE: float = float(os.getenv("DEBIT_SIZE", 0))
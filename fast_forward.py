@@ -0,0 +1,202 @@
+import numpy as np
+import dataclasses as dc
+from datetime import datetime
+
+import config
+from structs.balance import SpreadType
+from structs.trajectory import PaymentTrajectory
+from structs.calendar import SimulationCalendar
+from structs.schedule import CREDIT, DEBIT, INVESTMENT, PAYMENT, CashFlowLedger
+
+
+def growth (rate: float, months: np.ndarray | int) -> np.ndarray | float:
+    return np.power(1 + rate, months)
+
+def geometric_sum (rate: float, months: np.ndarray | int) -> np.ndarray | float:
+    # 1 + (1 + rate) + ... + (1 + rate) ** (months - 1)
+    if rate == 0:
+        return months * 1.0
+
+    elif rate > -1:
+        return np.expm1(months * np.log1p(rate)) / rate
+
+    return (growth(rate, months) - 1) / rate
+
+def advance (value: float, rate: float, addend: float, months: np.ndarray | int) -> np.ndarray | float:
+    # Closed form of `months` steps of value = value * (1 + rate) + addend
+    return growth(rate, months) * value + addend * geometric_sum(rate, months)
+
+@dc.dataclass(kw_only=True, frozen=True)
+class Segment:
+    # Months [month, month + length) share one breakdown and one investment multiplier
+    month: int
+    length: int
+    payment_size: float
+    investment_size: float
+    breakdown: np.ndarray
+    investment_rate: float
+
+    @property
+    def end (self) -> int:
+        return self.month + self.length
+
+@dc.dataclass(kw_only=True)
+class FastForwardSimulation:
+    start_date: datetime
+    payment_rate: float
+    investment_rate: float
+    profit_tax: float
+
+    initial_payment_size: float
+    initial_investment_size: float
+    segments: list[Segment] = dc.field(default_factory=list)
+
+    payment_size: float = dc.field(init=False)
+    investment_size: float = dc.field(init=False)
+
+    def __post_init__ (self) -> None:
+        self.payment_size = self.initial_payment_size
+        self.investment_size = self.initial_investment_size
+
+    @property
+    def months (self) -> int:
+        return self.segments[-1].end if self.segments else 0
+
+    @property
+    def paid_off (self) -> bool:
+        return not self.payment_size > 0
+
+    @property
+    def payoff_month (self) -> int | None:
+        return self.months if self.paid_off else None
+
+    def __len__ (self) -> int:
+        return self.months + 1
+
+    def to_trajectory (self) -> PaymentTrajectory:
+        payment_size = [np.array([self.initial_payment_size])]
+        investment_size = [np.array([self.initial_investment_size])]
+        total_breakdown = [np.zeros((1, 4))]
+
+        for segment in self.segments:
+            steps = np.arange(1, segment.length + 1)
+            payments = advance(
+                segment.payment_size, self.payment_rate, -segment.breakdown[PAYMENT], steps
+            )
+            investments = advance(
+                segment.investment_size, segment.investment_rate, segment.breakdown[INVESTMENT], steps
+            )
+
+            earnings = np.concatenate([[segment.investment_size], investments[:-1]]) * self.investment_rate
+            totals = np.repeat(segment.breakdown[None], segment.length, axis=0)
+            totals[:, DEBIT] += (earnings + totals[:, CREDIT]) * self.profit_tax
+            totals[:, INVESTMENT] += earnings
+
+            payment_size.append(payments)
+            investment_size.append(investments)
+            total_breakdown.append(totals)
+
+        return PaymentTrajectory.from_arrays(
+            np.concatenate(payment_size),
+            np.concatenate(investment_size),
+            np.concatenate(total_breakdown),
+            start_date=self.start_date,
+        )
+
+def payoff_length (payment: float, rate: float, addend: float, length: int) -> int:
+    # Smallest n <= length with advance(...) <= 0, given a shrinking payment that ends at or below 0
+    low, high = 1, length
+    while low < high:
+        mid = (low + high) // 2
+        if advance(payment, rate, addend, mid) > 0:
+            low = mid + 1
+
+        else:
+            high = mid
+
+    return low
+
+def fast_forward (
+    ledger: CashFlowLedger, payment_size: float, investment_size: float, *,
+    initial_payment: float = 0, profit_tax: float = 0.0,
+    investment_yearly_percentage: float = 0, start_date: datetime | None = None,
+    max_months: int | None = None,
+) -> FastForwardSimulation:
+    calendar = SimulationCalendar.starting(start_date)
+    start_date = calendar.start_date
+    payment_rate = config.PAYMENT_INTEREST_RATE
+    investment_rate = config.INVESTMENT_INTERST_RATE
+
+    simulation = FastForwardSimulation(
+        start_date=start_date,
+        payment_rate=payment_rate,
+        investment_rate=investment_rate,
+        profit_tax=profit_tax,
+        initial_payment_size=payment_size - initial_payment,
+        initial_investment_size=investment_size - initial_payment,
+    )
+
+    payment = simulation.payment_size
+    investment = simulation.investment_size
+    event_months = ledger.monthly.counters
+    # Segments end where a period closes; December always does, for the yearly investment payment
+    periodic = {
+        spread: schedule for spread, schedule in ledger.periodic.items()
+        if spread is SpreadType.YEARLY or not schedule.is_empty
+    }
+
+    month = 0
+    stopped = not payment > 0
+    while not stopped and (max_months is None or month < max_months):
+        breakdown = ledger.monthly.state_at(month)
+
+        due = [spread for spread in calendar.due_at(month) if spread in periodic]
+        if due:
+            for spread in due:
+                breakdown = breakdown + periodic[spread].state_at(calendar.periods_before(spread, month))
+
+            segment_rate = investment_rate
+            if SpreadType.YEARLY in due:
+                segment_rate = investment_rate - investment_yearly_percentage
+
+            length = 1
+
+        else:
+            segment_rate = investment_rate
+            end = min(calendar.next_due(spread, month) for spread in periodic)
+            next_event = np.searchsorted(event_months, month, side="right")
+            if next_event < len(event_months):
+                end = min(end, int(event_months[next_event]))
+
+            if max_months is not None:
+                end = min(end, max_months)
+
+            # A non-positive growth factor makes the payment oscillate, so step it month by month
+            length = end - month if 1 + payment_rate > 0 else 1
+
+        first = advance(payment, payment_rate, -breakdown[PAYMENT], 1)
+        if not (first < payment and first > 0):
+            length = 1
+            stopped = True
+
+        elif not advance(payment, payment_rate, -breakdown[PAYMENT], length) > 0:
+            length = payoff_length(payment, payment_rate, -breakdown[PAYMENT], length)
+            stopped = True
+
+        simulation.segments.append(Segment(
+            month=month,
+            length=length,
+            payment_size=payment,
+            investment_size=investment,
+            breakdown=breakdown,
+            investment_rate=segment_rate,
+        ))
+
+        payment = float(advance(payment, payment_rate, -breakdown[PAYMENT], length))
+        investment = float(advance(investment, segment_rate, breakdown[INVESTMENT], length))
+        month += length
+
+    simulation.payment_size = payment
+    simulation.investment_size = investment
+
+    return simulation
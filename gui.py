@@ -1,14 +1,25 @@
 import sys
+import math
 from PyQt5.QtWidgets import (
     QApplication, QMainWindow, QPushButton, QVBoxLayout, QHBoxLayout, QGridLayout,
     QWidget, QLineEdit, QLabel, QMessageBox, QComboBox, QTextEdit, QInputDialog,
-    QTableWidget, QTableWidgetItem
+    QTableView, QProgressBar, QCheckBox
 )
+from matplotlib.figure import Figure
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
+from matplotlib.backends.backend_qt5agg import NavigationToolbar2QT as NavigationToolbar
 
+import config
+import instrumentation
+from cache import SimulationCache
 from balance_handler import BalanceHandler
+from balance_model import BalanceTableModel
 from structs.balance import Balance, FrequencyType, SpreadType, BalanceType
-from simulate import get_payment_simulation_plot
+from structs.calendar import default_start_date
+from incremental import IncrementalSimulation
+from simulate import get_goal_solution, trajectory_cache_key
+from plotting import TrajectoryPlot
+from simulation_worker import SimulationController, SimulationWorker
 
 
 class MainWindow(QMainWindow):
@@ -19,6 +30,17 @@ class MainWindow(QMainWindow):
         self.setMinimumSize(900, 600)
         self.setSizePolicy(QWidget.sizePolicy(self))
         self.handler = BalanceHandler()
+        self.simulation_cache = SimulationCache(disk_path=config.SIMULATION_CACHE_PATH)
+        self.simulation_controller = SimulationController(self)
+        self.simulation_controller.progress.connect(self.show_simulation_progress)
+        self.simulation_controller.finished.connect(self.show_simulation_result)
+        self.simulation_controller.failed.connect(self.show_simulation_error)
+        self.simulation_controller.running_changed.connect(self.set_simulation_running)
+        self.simulation_key = None
+        # Kept while the simulation inputs stay the same, so a run after a ledger edit resumes
+        # from the last checkpoint before it
+        self.incremental_simulation = None
+        self.incremental_inputs = None
 
         main_layout = QVBoxLayout()
 
@@ -79,11 +101,20 @@ class MainWindow(QMainWindow):
         main_layout.addLayout(balance_ops_layout)
 
         # Display Balances
-        self.balances_table = QTableWidget(self)
-        self.balances_table.setColumnCount(10)
-        self.balances_table.setHorizontalHeaderLabels([
-            "ID", "Nome", "Valor", "Frequência", "Unidade", "Spread", "Expiração", "Mês de início", "Tipo", ""
-        ])
+        filter_layout = QHBoxLayout()
+        filter_layout.addWidget(QLabel("Filtrar:"))
+        self.balances_filter_input = QLineEdit(self)
+        filter_layout.addWidget(self.balances_filter_input)
+        main_layout.addLayout(filter_layout)
+
+        # The model reads cells from the handler on demand and follows its changes
+        self.balances_model = BalanceTableModel(self.handler, self)
+        self.balances_filter_input.textChanged.connect(self.balances_model.set_filter)
+        self.balances_table = QTableView(self)
+        self.balances_table.setModel(self.balances_model)
+        self.balances_table.setSortingEnabled(True)
+        self.balances_table.setSelectionBehavior(QTableView.SelectRows)
+        self.balances_table.horizontalHeader().setStretchLastSection(True)
         main_layout.addWidget(self.balances_table)
 
         # Payment Simulation
@@ -108,38 +139,59 @@ class MainWindow(QMainWindow):
         self.simulate_button = QPushButton("Simular Pagamento", self)
         self.simulate_button.clicked.connect(self.simulate_payment)
         sim_layout.addWidget(self.simulate_button, 1, 4, 1, 2)
+        # Third row: progress of the background run and its cancel button
+        self.simulation_progress = QProgressBar(self)
+        self.simulation_progress.setRange(0, 0)
+        self.simulation_progress.setVisible(False)
+        sim_layout.addWidget(self.simulation_progress, 2, 0, 1, 2)
+        self.simulation_status = QLabel("", self)
+        sim_layout.addWidget(self.simulation_status, 2, 2, 1, 2)
+        self.cancel_simulation_button = QPushButton("Cancelar Simulação", self)
+        self.cancel_simulation_button.clicked.connect(self.cancel_simulation)
+        self.cancel_simulation_button.setEnabled(False)
+        sim_layout.addWidget(self.cancel_simulation_button, 2, 4, 1, 2)
+        # Fourth row: phase timings of the next runs, shown below the plot
+        self.profile_sink = None
+        self.profile_checkbox = QCheckBox("Medir fases da simulação", self)
+        self.profile_checkbox.toggled.connect(self.toggle_profiling)
+        sim_layout.addWidget(self.profile_checkbox, 3, 0, 1, 2)
+        # Fifth row: goal seeking, which fills the adjusted input with the value found
+        self.goal_metric_input = QComboBox(self)
+        self.goal_metric_input.addItem("Quitar em até (meses)", "payoff_month")
+        self.goal_metric_input.addItem("Investimento final mínimo", "final_investment")
+        sim_layout.addWidget(self.goal_metric_input, 4, 0)
+        self.goal_target_input = QLineEdit(self)
+        sim_layout.addWidget(self.goal_target_input, 4, 1)
+        sim_layout.addWidget(QLabel("Ajustar:"), 4, 2)
+        self.goal_parameter_input = QComboBox(self)
+        self.goal_parameter_input.addItem("Pagamento inicial", "initial_payment")
+        self.goal_parameter_input.addItem("Tamanho do pagamento", "payment_size")
+        self.goal_parameter_input.addItem("Tamanho do investimento", "investment_size")
+        self.goal_parameter_input.addItem("% Investimento anual", "investment_yearly_percentage")
+        sim_layout.addWidget(self.goal_parameter_input, 4, 3)
+        self.solve_goal_button = QPushButton("Calcular Meta", self)
+        self.solve_goal_button.clicked.connect(self.solve_goal)
+        sim_layout.addWidget(self.solve_goal_button, 4, 4, 1, 2)
+        # Last solution of every (parameter, metric), the starting guess of the next solve
+        self.goal_solutions = {}
         main_layout.addLayout(sim_layout)
 
+        # Editing the inputs during a run restarts it with the new values
+        for sim_input in (
+            self.payment_size_input, self.investment_size_input, self.initial_payment_input,
+            self.profit_tax_input, self.investment_yearly_input,
+        ):
+            sim_input.editingFinished.connect(self.restart_running_simulation)
+
         # Simulation Results
         self.simulation_display = QTextEdit(self)
         self.simulation_display.setReadOnly(True)
         main_layout.addWidget(self.simulation_display)
+        self.trajectory_plot = None
 
         container = QWidget()
         container.setLayout(main_layout)
         self.setCentralWidget(container)
-        self.refresh_balances()
-
-    def refresh_balances(self):
-        df = self.handler.df
-        self.balances_table.setRowCount(0)
-        if df.empty:
-            self.balances_table.setRowCount(1)
-            for col in range(self.balances_table.columnCount()):
-                self.balances_table.setItem(0, col, QTableWidgetItem(""))
-        else:
-            self.balances_table.setRowCount(len(df))
-            for row_idx, row in df.iterrows():
-                self.balances_table.setItem(row_idx, 0, QTableWidgetItem(str(row.get("id", ""))))
-                self.balances_table.setItem(row_idx, 1, QTableWidgetItem(str(row.get("name", ""))))
-                self.balances_table.setItem(row_idx, 2, QTableWidgetItem(str(row.get("value", ""))))
-                self.balances_table.setItem(row_idx, 3, QTableWidgetItem(str(row.get("frequency", ""))))
-                self.balances_table.setItem(row_idx, 4, QTableWidgetItem(str(row.get("frequency_unit", ""))))
-                self.balances_table.setItem(row_idx, 5, QTableWidgetItem(str(row.get("spread_type", ""))))
-                self.balances_table.setItem(row_idx, 6, QTableWidgetItem(str(row.get("expiry", ""))))
-                self.balances_table.setItem(row_idx, 7, QTableWidgetItem(str(row.get("start_month", ""))))
-                self.balances_table.setItem(row_idx, 8, QTableWidgetItem(str(row.get("type", ""))))
-                # 9th column left blank for future actions
 
     def get_balance_from_form(self):
         try:
@@ -177,8 +229,8 @@ class MainWindow(QMainWindow):
         try:
             balance = self.get_balance_from_form()
             self.handler.add_balances([balance])
-            self.refresh_balances()
             self.clear_balance_form()
+            self.restart_running_simulation()
             QMessageBox.information(self, "Sucesso", "Despesa adicionada com sucesso.")
 
         except Exception as e:
@@ -188,8 +240,8 @@ class MainWindow(QMainWindow):
         try:
             balance = self.get_balance_from_form()
             self.handler.update_balances_by_id([balance])
-            self.refresh_balances()
             self.clear_balance_form()
+            self.restart_running_simulation()
             QMessageBox.information(self, "Sucesso", "Despesa atualizada com sucesso.")
 
         except Exception as e:
@@ -200,7 +252,7 @@ class MainWindow(QMainWindow):
             balance_id, ok = QInputDialog.getText(self, "Remover Despesa", "ID da despesa:")
             if ok and balance_id:
                 self.handler.remove_balances_by_id([balance_id])
-                self.refresh_balances()
+                self.restart_running_simulation()
                 QMessageBox.information(self, "Sucesso", "Despesa removida com sucesso.")
 
         except Exception as e:
@@ -236,33 +288,152 @@ class MainWindow(QMainWindow):
             initial_payment = float(self.initial_payment_input.text() or 0)
             profit_tax = float(self.profit_tax_input.text() or 0)
             investment_yearly = float(self.investment_yearly_input.text() or 0)
-            fig = get_payment_simulation_plot(
+            start_date = default_start_date()
+
+            self.simulation_key = trajectory_cache_key(
                 self.handler, payment_size, investment_size,
                 initial_payment=initial_payment,
                 profit_tax=profit_tax,
-                investment_yearly_percentage=investment_yearly
+                investment_yearly_percentage=investment_yearly,
+                start_date=start_date,
             )
-            # Remove previous canvas if exists
-            if hasattr(self, 'plot_canvas') and self.plot_canvas is not None:
-                self.simulation_display.layout().removeWidget(self.plot_canvas)
-                self.plot_canvas.setParent(None)
-                self.plot_canvas = None
-            # Clear text display
-            self.simulation_display.clear()
-            # Embed the matplotlib figure in the QTextEdit area
-            self.plot_canvas = FigureCanvas(fig)
-            layout = self.simulation_display.parentWidget().layout()
-            layout.addWidget(self.plot_canvas)
+            trajectory = self.simulation_cache.get(self.simulation_key)
+            if trajectory is not None:
+                self.simulation_controller.cancel()
+                self.show_simulation_result(trajectory.copy(start_date=start_date), cached=True)
+                return
+
+            inputs = (
+                payment_size, investment_size, initial_payment, profit_tax, investment_yearly,
+                start_date.year, start_date.month,
+            )
+            if inputs != self.incremental_inputs:
+                if self.incremental_simulation is not None:
+                    self.incremental_simulation.close()
+
+                self.incremental_simulation = IncrementalSimulation(
+                    handler=self.handler,
+                    payment_size=payment_size,
+                    investment_size=investment_size,
+                    initial_payment=initial_payment,
+                    profit_tax=profit_tax,
+                    investment_yearly_percentage=investment_yearly,
+                    start_date=start_date,
+                )
+                self.incremental_inputs = inputs
+
+            self.simulation_controller.start(SimulationWorker(
+                self.incremental_simulation, self.incremental_simulation.snapshot()
+            ))
         except Exception as e:
             QMessageBox.critical(self, "Erro", f"Falha na simulação: {e}")
 
+    def solve_goal(self):
+        try:
+            parameter = self.goal_parameter_input.currentData()
+            metric = self.goal_metric_input.currentData()
+            target = float(self.goal_target_input.text())
+            inputs = {
+                "payment_size": self.payment_size_input,
+                "investment_size": self.investment_size_input,
+                "initial_payment": self.initial_payment_input,
+                "investment_yearly_percentage": self.investment_yearly_input,
+            }
+            values = {name: float(sim_input.text() or 0) for name, sim_input in inputs.items()}
+
+            solution = get_goal_solution(
+                self.handler, values["payment_size"], values["investment_size"],
+                parameter=parameter,
+                metric=metric,
+                target=target,
+                initial_payment=values["initial_payment"],
+                profit_tax=float(self.profit_tax_input.text() or 0),
+                investment_yearly_percentage=values["investment_yearly_percentage"],
+                start_date=default_start_date(),
+                guess=self.goal_solutions.get((parameter, metric)),
+            )
+
+            if not solution.solved:
+                QMessageBox.warning(
+                    self, "Meta", f"Nenhum valor de {self.goal_parameter_input.currentText()} atinge a meta."
+                )
+                return
+
+            self.goal_solutions[(parameter, metric)] = solution.value
+            # Rounded towards the side of the bracket that meets the goal
+            scale = 10 ** (4 if parameter == "investment_yearly_percentage" else 2)
+            rounding = math.ceil if solution.value == solution.bracket[1] else math.floor
+            inputs[parameter].setText(str(rounding(solution.value * scale) / scale))
+            self.simulation_status.setText(
+                f"Meta atingida em {solution.evaluation.months} meses "
+                f"({solution.evaluations} simulações)."
+            )
+        except Exception as e:
+            QMessageBox.critical(self, "Erro", f"Falha ao calcular meta: {e}")
+
+    def toggle_profiling(self, checked):
+        if checked:
+            self.profile_sink = instrumentation.MemorySink()
+            instrumentation.attach(self.profile_sink)
+
+        elif self.profile_sink is not None:
+            instrumentation.detach(self.profile_sink)
+            self.profile_sink = None
+
+    def restart_running_simulation(self):
+        if self.simulation_controller.running:
+            self.simulate_payment()
+
+    def cancel_simulation(self):
+        if self.simulation_controller.running:
+            self.simulation_controller.cancel()
+            self.simulation_status.setText("Simulação cancelada.")
+
+    def set_simulation_running(self, running):
+        self.simulation_progress.setVisible(running)
+        self.cancel_simulation_button.setEnabled(running)
+
+    def show_simulation_progress(self, months, payment_size):
+        self.simulation_status.setText(f"Simulando: {months} meses, pagamento {payment_size:.2f}")
+
+    def show_simulation_error(self, message):
+        self.simulation_status.setText("")
+        QMessageBox.critical(self, "Erro", f"Falha na simulação: {message}")
+
+    def show_simulation_result(self, trajectory, cached=False):
+        if not cached:
+            self.simulation_cache.put(self.simulation_key, trajectory.copy())
+
+        self.simulation_status.setText(f"Simulação concluída em {len(trajectory) - 1} meses.")
+        # Clear text display
+        self.simulation_display.clear()
+        if self.trajectory_plot is None:
+            # A single canvas is reused by every run; its lines are updated in place
+            canvas = FigureCanvas(Figure(figsize=(10, 6)))
+            self.trajectory_plot = TrajectoryPlot(canvas.figure, blit=True)
+            layout = self.simulation_display.parentWidget().layout()
+            layout.addWidget(NavigationToolbar(canvas, self))
+            layout.addWidget(canvas)
+
+        self.trajectory_plot.set_trajectory(trajectory)
+
+        if self.profile_sink is not None:
+            self.simulation_display.setPlainText(instrumentation.format_summary(self.profile_sink.summary()))
+            self.profile_sink.clear()
+
     def closeEvent (self, event) -> None:
-        # Save the dataframe to balance.csv before exit
+        self.simulation_controller.shutdown()
+        self.toggle_profiling(False)
+
+        # Save the ledger to config.BALANCE_FILE_PATH before exit
         try:
-            self.handler.df.to_csv('balance.csv', index=False)
+            self.handler.save()
 
         except Exception as e:
-            QMessageBox.warning(self, "Aviso", f"Falha ao salvar balance.csv: {e}")
+            QMessageBox.warning(self, "Aviso", f"Falha ao salvar {self.handler.storage.path}: {e}")
+
+        finally:
+            self.handler.close()
 
         event.accept()
 
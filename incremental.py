@@ -0,0 +1,250 @@
+import threading
+import numpy as np
+import dataclasses as dc
+from datetime import datetime
+from collections.abc import Callable
+
+import instrumentation
+from structs.balance import SpreadType
+from structs.payment import FinancialBreakdown, PaymentStatus
+from structs.calendar import SimulationCalendar, default_start_date
+from structs.trajectory import PaymentTrajectory
+from structs.schedule import CashFlowLedger, EventSchedule
+from balance_handler import BalanceHandler
+from journal import JournalOperation
+from simulate import iter_payment_status
+
+
+@dc.dataclass(kw_only=True, frozen=True)
+class Checkpoint:
+    # State before simulating `month`; the month and period cursors follow from it
+    month: int
+    payment_size: float
+    investment_size: float
+    monthly_breakdown: FinancialBreakdown
+    periodic_breakdowns: dict[SpreadType, FinancialBreakdown]
+
+    @classmethod
+    def from_status (cls, month: int, payment_status: PaymentStatus) -> "Checkpoint":
+        return cls(
+            month=month,
+            payment_size=payment_status.payment_size,
+            investment_size=payment_status.investment_size,
+            monthly_breakdown=payment_status.monthly_breakdown.copy(),
+            periodic_breakdowns={
+                spread: breakdown.copy() for spread, breakdown in payment_status.periodic_breakdowns.items()
+            },
+        )
+
+    def to_status (self, ledger: CashFlowLedger) -> PaymentStatus:
+        payment_status = PaymentStatus(
+            payment_size=self.payment_size,
+            investment_size=self.investment_size,
+            ledger=ledger,
+        )
+
+        payment_status.monthly_breakdown = self.monthly_breakdown.copy()
+        payment_status.periodic_breakdowns = {
+            spread: breakdown.copy() for spread, breakdown in self.periodic_breakdowns.items()
+        }
+
+        return payment_status
+
+def first_divergence (old: EventSchedule, new: EventSchedule) -> int | None:
+    # Breakdowns only change at counters, so comparing the states there finds the first
+    # difference; -1 stands for the initial breakdown.
+    counters = np.union1d(np.union1d(old.counters, new.counters), [-1])
+
+    differs = np.any(old.state_at(counters) != new.state_at(counters), axis=1)
+    if not differs.any():
+        return None
+
+    return int(counters[np.argmax(differs)])
+
+def affected_month (old: CashFlowLedger, new: CashFlowLedger, start_date: datetime) -> int | None:
+    # First month whose checkpoint is stale, -1 when even the initial state changed
+    months = []
+
+    month = first_divergence(old.monthly, new.monthly)
+    if month is not None:
+        months.append(month)
+
+    calendar = SimulationCalendar(start_date=start_date)
+    for spread, schedule in old.periodic.items():
+        period = first_divergence(schedule, new.schedule(spread))
+        if period is not None:
+            # The breakdown of period p is loaded by the month closing period p - 1
+            months.append(calendar.closing_month(spread, period))
+
+    return min(months, default=None)
+
+@dc.dataclass(kw_only=True, frozen=True)
+class LedgerSnapshot:
+    # The ledger compiled on the handler's thread, for a refresh that may run on another
+    ledger: CashFlowLedger
+    version: int
+    # The whole ledger was replaced since the last snapshot, so there is nothing to diff
+    replaced: bool
+
+@dc.dataclass(kw_only=True)
+class IncrementalSimulation:
+    # Keeps a trajectory current with the handler's ledger: snapshot() compiles the ledger on
+    # the handler's thread and resume() re-simulates from the last checkpoint the edits since
+    # the previous snapshot left intact, on any thread. refresh() does both.
+    handler: BalanceHandler
+    payment_size: float
+    investment_size: float
+    initial_payment: float = 0
+    profit_tax: float = 0.0
+    investment_yearly_percentage: float = 0
+    start_date: datetime | None = None
+    checkpoint_interval: int = 12
+
+    trajectory: PaymentTrajectory = dc.field(init=False)
+    checkpoints: list[Checkpoint] = dc.field(init=False, default_factory=list)
+    ledger: CashFlowLedger | None = dc.field(init=False, default=None)
+    # Handler version the trajectory was simulated for, None before the first run
+    version: int | None = dc.field(init=False, default=None)
+    # Month the last refresh resumed from, or None when nothing had to be recomputed
+    resumed_from: int | None = dc.field(init=False, default=None)
+    # False while a stopped run left the trajectory short of its end
+    complete: bool = dc.field(init=False, default=True)
+
+    _replaced: bool = dc.field(init=False, repr=False, default=False)
+    _lock: threading.Lock = dc.field(init=False, repr=False, default_factory=threading.Lock)
+
+    def __post_init__ (self) -> None:
+        self.start_date = self.start_date if self.start_date is not None else default_start_date()
+        self.trajectory = PaymentTrajectory(start_date=self.start_date)
+
+        # Point 0 is the starting status, which no ledger edit can change
+        self.trajectory.append(
+            self.payment_size - self.initial_payment, self.investment_size - self.initial_payment,
+            FinancialBreakdown(),
+        )
+        self.handler.subscribe(self._on_ledger_changed)
+
+    def close (self) -> None:
+        self.handler.unsubscribe(self._on_ledger_changed)
+
+    def _on_ledger_changed (self, operation: JournalOperation | None, rows: list[int]) -> None:
+        # Added, updated and removed rows are found by diffing the compiled ledgers; an import
+        # or append replaces the ledger wholesale and is simulated again from the start
+        if operation is None:
+            self._replaced = True
+
+    def snapshot (self) -> LedgerSnapshot:
+        snapshot = LedgerSnapshot(
+            ledger=(
+                self.ledger if self.handler.version == self.version and self.ledger is not None
+                else CashFlowLedger.from_handler(self.handler)
+            ),
+            version=self.handler.version,
+            replaced=self._replaced,
+        )
+        self._replaced = False
+
+        return snapshot
+
+    def refresh (self) -> PaymentTrajectory:
+        with self._lock:
+            self._resume(self.snapshot())
+
+        return self.trajectory
+
+    def resume (
+        self, snapshot: LedgerSnapshot, *, stop: threading.Event | None = None,
+        progress: Callable[[int, PaymentStatus], None] | None = None,
+    ) -> PaymentTrajectory | None:
+        # A copy of the finished trajectory, or None when stop was set first
+        with self._lock:
+            if not self._resume(snapshot, stop=stop, progress=progress):
+                return None
+
+            return self.trajectory.copy()
+
+    def _resume (
+        self, snapshot: LedgerSnapshot, *, stop: threading.Event | None = None,
+        progress: Callable[[int, PaymentStatus], None] | None = None,
+    ) -> bool:
+        # A snapshot older than the trajectory belongs to a run that was replaced
+        if self.version is not None and snapshot.version < self.version:
+            return False
+
+        if self.version is None or snapshot.replaced:
+            month = -1
+
+        elif snapshot.version == self.version:
+            month = None
+
+        else:
+            month = affected_month(self.ledger, snapshot.ledger, self.start_date)
+
+        self.ledger = snapshot.ledger
+        self.version = snapshot.version
+
+        # Months 0 .. len - 2 were simulated, later edits cannot reach this trajectory; a
+        # stopped run goes on from its last checkpoint
+        if not self.complete:
+            month = len(self.trajectory) - 1 if month is None else min(month, len(self.trajectory) - 1)
+
+        elif month is not None and month >= len(self.trajectory) - 1:
+            month = None
+
+        if month is None:
+            self.resumed_from = None
+            return True
+
+        if month < 0:
+            return self._run(self._initial_checkpoint(), stop, progress)
+
+        idx = max(idx for idx, checkpoint in enumerate(self.checkpoints) if checkpoint.month <= month)
+        return self._run(self.checkpoints[idx], stop, progress)
+
+    def _initial_checkpoint (self) -> Checkpoint:
+        payment_status = PaymentStatus(
+            payment_size=self.payment_size - self.initial_payment,
+            investment_size=self.investment_size - self.initial_payment,
+            ledger=self.ledger,
+        )
+
+        return Checkpoint.from_status(0, payment_status)
+
+    def _run (
+        self, checkpoint: Checkpoint, stop: threading.Event | None,
+        progress: Callable[[int, PaymentStatus], None] | None,
+    ) -> bool:
+        self.resumed_from = checkpoint.month
+        self.checkpoints = [saved for saved in self.checkpoints if saved.month < checkpoint.month]
+        self.checkpoints.append(checkpoint)
+        self.trajectory.truncate(checkpoint.month + 1)
+        self.complete = False
+
+        payment_status = checkpoint.to_status(self.ledger)
+        if not payment_status.payment_size > 0:
+            self.complete = True
+            return True
+
+        month = checkpoint.month
+        with instrumentation.phase("incremental.run") as phase:
+            for status in iter_payment_status(
+                payment_status, start_date=self.start_date, profit_tax=self.profit_tax,
+                investment_yearly_percentage=self.investment_yearly_percentage, month=month,
+            ):
+                if stop is not None and stop.is_set():
+                    phase.iterations = month - checkpoint.month
+                    return False
+
+                self.trajectory.append_status(status)
+                month += 1
+
+                if month % self.checkpoint_interval == 0:
+                    self.checkpoints.append(Checkpoint.from_status(month, status))
+
+                if progress is not None:
+                    progress(month, status)
+
+            phase.iterations = month - checkpoint.month
+
+        self.complete = True
+        return True
@@ -0,0 +1,299 @@
+import sys
+import json
+import time
+import logging
+import functools
+import threading
+import dataclasses as dc
+from pathlib import Path
+from typing import IO
+from collections import Counter
+
+import config
+
+
+# Calls counted while profiling, as (module, class, method, counter name). The methods are only
+# wrapped between attach and the last detach, so a disabled profiler leaves them untouched.
+COUNTED_CALLS = (
+    ("structs.balance", "Balance", "__post_init__", "balance"),
+    ("structs.payment", "PaymentStatus", "__post_init__", "payment_status"),
+    ("structs.payment", "PaymentStatus", "copy", "payment_status.copy"),
+    ("structs.payment", "FinancialBreakdown", "copy", "breakdown.copy"),
+)
+
+
+@dc.dataclass(kw_only=True, frozen=True)
+class PhaseRecord:
+    name: str
+    # Names of the enclosing phases and this one, joined by "/"
+    path: str
+    seconds: float
+    iterations: int
+    # Net memory blocks the phase left allocated, its results included
+    allocated_blocks: int
+    calls: dict[str, int]
+    thread: str
+
+@dc.dataclass(kw_only=True)
+class PhaseSummary:
+    path: str
+    count: int = 0
+    seconds: float = 0.0
+    iterations: int = 0
+    allocated_blocks: int = 0
+    calls: Counter = dc.field(default_factory=Counter)
+
+class Sink:
+    def emit (self, record: PhaseRecord) -> None:
+        raise NotImplementedError
+
+    def close (self) -> None:
+        pass
+
+@dc.dataclass(kw_only=True)
+class LoggingSink (Sink):
+    logger: logging.Logger = dc.field(default_factory=lambda: logging.getLogger("balance.profile"))
+    level: int = logging.INFO
+
+    def emit (self, record: PhaseRecord) -> None:
+        self.logger.log(
+            self.level, "%s: %.3f ms, %d iterations, %d blocks%s",
+            record.path, record.seconds * 1e3, record.iterations, record.allocated_blocks,
+            "".join(f", {count} {name}" for name, count in record.calls.items()),
+        )
+
+@dc.dataclass(kw_only=True)
+class JsonLinesSink (Sink):
+    path: Path
+
+    _file: IO[str] | None = dc.field(init=False, default=None, repr=False)
+    _lock: threading.Lock = dc.field(init=False, default_factory=threading.Lock, repr=False)
+
+    def __post_init__ (self) -> None:
+        self.path = Path(self.path)
+
+    def emit (self, record: PhaseRecord) -> None:
+        line = json.dumps(dc.asdict(record), separators=(",", ":"))
+
+        with self._lock:
+            if self._file is None:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                self._file = open(self.path, "a", encoding="utf-8")
+
+            self._file.write(line + "\n")
+            self._file.flush()
+
+    def close (self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+@dc.dataclass(kw_only=True)
+class MemorySink (Sink):
+    records: list[PhaseRecord] = dc.field(default_factory=list)
+
+    _lock: threading.Lock = dc.field(init=False, default_factory=threading.Lock, repr=False)
+
+    def emit (self, record: PhaseRecord) -> None:
+        with self._lock:
+            self.records.append(record)
+
+    def clear (self) -> None:
+        with self._lock:
+            self.records.clear()
+
+    def summary (self) -> list[PhaseSummary]:
+        with self._lock:
+            records = list(self.records)
+
+        summaries: dict[str, PhaseSummary] = {}
+        for record in records:
+            summary = summaries.setdefault(record.path, PhaseSummary(path=record.path))
+            summary.count += 1
+            summary.seconds += record.seconds
+            summary.iterations += record.iterations
+            summary.allocated_blocks += record.allocated_blocks
+            summary.calls.update(record.calls)
+
+        return list(summaries.values())
+
+def format_summary (summaries: list[PhaseSummary]) -> str:
+    header = ("phase", "calls", "total", "iterations", "blocks", "counted calls")
+    rows = [header, *(
+        (
+            summary.path, str(summary.count), f"{summary.seconds * 1e3:.3f} ms",
+            str(summary.iterations), str(summary.allocated_blocks),
+            ", ".join(f"{name}={count}" for name, count in summary.calls.items()),
+        )
+        for summary in summaries
+    )]
+
+    widths = [max(len(row[column]) for row in rows) for column in range(len(header))]
+    return "\n".join(
+        "  ".join(cell.ljust(width) for cell, width in zip(row, widths)).rstrip() for row in rows
+    )
+
+class Phase:
+    __slots__ = ("profiler", "name", "iterations", "calls", "_path", "_start", "_blocks")
+
+    def __init__ (self, profiler: "Profiler", name: str) -> None:
+        self.profiler = profiler
+        self.name = name
+        self.iterations = 0
+        self.calls: Counter = Counter()
+
+    def __enter__ (self) -> "Phase":
+        stack = self.profiler.stack()
+        self._path = f"{stack[-1]._path}/{self.name}" if stack else self.name
+        stack.append(self)
+
+        self._blocks = sys.getallocatedblocks()
+        self._start = time.perf_counter()
+
+        return self
+
+    def __exit__ (self, *exc_info) -> None:
+        seconds = time.perf_counter() - self._start
+        blocks = sys.getallocatedblocks() - self._blocks
+        self.profiler.stack().pop()
+
+        self.profiler.emit(PhaseRecord(
+            name=self.name,
+            path=self._path,
+            seconds=seconds,
+            iterations=self.iterations,
+            allocated_blocks=blocks,
+            calls=dict(self.calls),
+            thread=threading.current_thread().name,
+        ))
+
+class NullPhase:
+    # Shared by every phase while profiling is off; assignments to it are simply dropped
+    __slots__ = ()
+
+    def __enter__ (self) -> "NullPhase":
+        return self
+
+    def __exit__ (self, *exc_info) -> None:
+        pass
+
+    def __setattr__ (self, name: str, value: object) -> None:
+        pass
+
+NULL_PHASE = NullPhase()
+
+@dc.dataclass(kw_only=True)
+class Profiler:
+    sinks: list[Sink] = dc.field(default_factory=list)
+
+    _local: threading.local = dc.field(init=False, default_factory=threading.local, repr=False)
+
+    def stack (self) -> list[Phase]:
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+
+        return stack
+
+    def count (self, name: str) -> None:
+        # Counted against every open phase, like the time of nested phases
+        for phase in self.stack():
+            phase.calls[name] += 1
+
+    def emit (self, record: PhaseRecord) -> None:
+        for sink in list(self.sinks):
+            sink.emit(record)
+
+_profiler: Profiler | None = None
+_originals: dict[tuple[type, str], object] = {}
+_lock = threading.Lock()
+
+
+def active () -> Profiler | None:
+    return _profiler
+
+def phase (name: str) -> Phase | NullPhase:
+    # The only cost of a disabled profiler: one global lookup per phase, none per iteration
+    profiler = _profiler
+    return NULL_PHASE if profiler is None else Phase(profiler, name)
+
+def _counting (method, name: str):
+    @functools.wraps(method)
+    def counted (*args, **kwargs):
+        profiler = _profiler
+        if profiler is not None:
+            profiler.count(name)
+
+        return method(*args, **kwargs)
+
+    return counted
+
+def _wrap_counted_calls () -> None:
+    import importlib
+
+    for module_name, class_name, method_name, name in COUNTED_CALLS:
+        cls = getattr(importlib.import_module(module_name), class_name)
+        _originals[(cls, method_name)] = cls.__dict__[method_name]
+        setattr(cls, method_name, _counting(cls.__dict__[method_name], name))
+
+def _unwrap_counted_calls () -> None:
+    for (cls, method_name), method in _originals.items():
+        setattr(cls, method_name, method)
+
+    _originals.clear()
+
+def attach (sink: Sink) -> Profiler:
+    global _profiler
+
+    with _lock:
+        if _profiler is None:
+            _wrap_counted_calls()
+            _profiler = Profiler()
+
+        _profiler.sinks.append(sink)
+        return _profiler
+
+def detach (sink: Sink) -> None:
+    global _profiler
+
+    with _lock:
+        if _profiler is None or sink not in _profiler.sinks:
+            return
+
+        _profiler.sinks.remove(sink)
+        sink.close()
+
+        if not _profiler.sinks:
+            _profiler = None
+            _unwrap_counted_calls()
+
+def disable () -> None:
+    profiler = _profiler
+    for sink in list(profiler.sinks if profiler is not None else []):
+        detach(sink)
+
+def sink_for (spec: str) -> Sink:
+    # "log", "memory" or the path of a JSON lines file
+    if spec == "log":
+        return LoggingSink()
+
+    elif spec == "memory":
+        return MemorySink()
+
+    return JsonLinesSink(path=Path(spec))
+
+def configure (spec: str | None) -> list[Sink]:
+    # Comma-separated sink specs; empty, "0" or "off" turns profiling off
+    disable()
+    if not spec or spec in ("0", "off"):
+        return []
+
+    sinks = [sink_for(part.strip()) for part in spec.split(",")]
+    for sink in sinks:
+        attach(sink)
+
+    return sinks
+
+if config.BALANCE_PROFILE:
+    configure(config.BALANCE_PROFILE)
@@ -0,0 +1,161 @@
+import os
+import json
+import threading
+import pandas as pd
+import dataclasses as dc
+from enum import StrEnum
+from pathlib import Path
+from typing import IO
+from collections.abc import Iterator
+
+import config
+from storage import StorageBackend
+
+
+class JournalOperation (StrEnum):
+    ADD = "add"
+    UPDATE = "update"
+    REMOVE = "remove"
+
+def journal_path (path: str | os.PathLike) -> Path:
+    path = Path(path)
+    return path.with_name(f"{path.name}.journal")
+
+def encode_value (value: object) -> object:
+    # numpy scalars coming from the frame are not JSON serializable
+    return value.item() if hasattr(value, "item") else value
+
+@dc.dataclass(kw_only=True)
+class LedgerJournal:
+    # One JSON line per mutation. Compaction moves the live journal aside, so new records
+    # go to a fresh file, then writes the snapshot in the background and drops the old one.
+    path: Path
+    compact_bytes: int = config.BALANCE_JOURNAL_COMPACT_BYTES
+    sync: bool = False
+
+    _file: IO[str] | None = dc.field(init=False, default=None, repr=False)
+    _lock: threading.Lock = dc.field(init=False, default_factory=threading.Lock, repr=False)
+    _compaction: threading.Thread | None = dc.field(init=False, default=None, repr=False)
+    _error: BaseException | None = dc.field(init=False, default=None, repr=False)
+
+    def __post_init__ (self) -> None:
+        self.path = Path(self.path)
+
+    @property
+    def rotated_path (self) -> Path:
+        return self.path.with_name(f"{self.path.name}.old")
+
+    @property
+    def size (self) -> int:
+        if self._file is not None:
+            return self._file.tell()
+
+        return self.path.stat().st_size if self.path.exists() else 0
+
+    @property
+    def compacting (self) -> bool:
+        return self._compaction is not None and self._compaction.is_alive()
+
+    @property
+    def needs_compaction (self) -> bool:
+        return self.size >= self.compact_bytes and not self.compacting
+
+    def records (self) -> Iterator[tuple[JournalOperation, list]]:
+        # A rotated journal is only left behind by an interrupted compaction and comes first
+        for path in (self.rotated_path, self.path):
+            if not path.exists():
+                continue
+
+            with open(path, encoding="utf-8") as file:
+                for line in file:
+                    try:
+                        operation, payload = json.loads(line)
+
+                    except ValueError:
+                        # Torn write at the tail after a crash
+                        break
+
+                    yield JournalOperation(operation), payload
+
+    def append (self, operation: JournalOperation, payload: list) -> None:
+        line = json.dumps([operation.value, payload], default=encode_value, separators=(",", ":"))
+
+        with self._lock:
+            if self._file is None:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                self._file = open(self.path, "a", encoding="utf-8")
+
+            self._file.write(line + "\n")
+            self._file.flush()
+
+            if self.sync:
+                os.fsync(self._file.fileno())
+
+    def _close_file (self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def compact (self, snapshot: pd.DataFrame, storage: StorageBackend, *, wait: bool = False) -> None:
+        # snapshot must not change afterwards; callers pass a copy of their frame.
+        # A failed compaction keeps its rotated journal and is retried here.
+        self._join()
+
+        with self._lock:
+            self._close_file()
+            if self.rotated_path.exists():
+                # Leftover of an interrupted compaction, already covered by this snapshot
+                if self.path.exists():
+                    with open(self.rotated_path, "a", encoding="utf-8") as rotated:
+                        rotated.write(self.path.read_text(encoding="utf-8"))
+
+                    self.path.unlink()
+
+            elif self.path.exists():
+                os.replace(self.path, self.rotated_path)
+
+            self._compaction = threading.Thread(
+                target=self._write_snapshot, args=(snapshot, storage),
+                name="ledger-compaction", daemon=False,
+            )
+            self._compaction.start()
+
+        if wait:
+            self.wait()
+
+    def _write_snapshot (self, snapshot: pd.DataFrame, storage: StorageBackend) -> None:
+        try:
+            storage.save(snapshot)
+            self.rotated_path.unlink(missing_ok=True)
+
+        except BaseException as error:
+            self._error = error
+
+    def _join (self) -> None:
+        if self._compaction is not None:
+            self._compaction.join()
+            self._compaction = None
+
+    def wait (self) -> None:
+        self._join()
+
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+    def reset (self) -> None:
+        # Called once a full snapshot has been written by the caller
+        self.wait()
+
+        with self._lock:
+            self._close_file()
+            self.path.unlink(missing_ok=True)
+            self.rotated_path.unlink(missing_ok=True)
+
+    def close (self) -> None:
+        try:
+            self.wait()
+
+        finally:
+            with self._lock:
+                self._close_file()
@@ -0,0 +1,232 @@
+import numpy as np
+import dataclasses as dc
+from enum import StrEnum
+from datetime import datetime
+from collections.abc import Iterator
+
+import config
+from structs.calendar import default_start_date
+from structs.schedule import CashFlowLedger
+from vectorized import ScenarioSweep, simulate_scenarios
+
+
+DEFAULT_PERCENTILES = (5.0, 50.0, 95.0)
+DEFAULT_SKETCH_SIZE = 512
+
+
+class RateDistribution (StrEnum):
+    CONSTANT = "constant"
+    NORMAL = "normal"
+    LOGNORMAL = "lognormal"
+    BOOTSTRAP = "bootstrap"
+
+@dc.dataclass(kw_only=True)
+class RateModel:
+    distribution: RateDistribution = RateDistribution.CONSTANT
+    mean: float = 0.0
+    std: float = 0.0
+    series: np.ndarray | None = None
+
+    def __post_init__ (self) -> None:
+        if isinstance(self.distribution, str):
+            self.distribution = RateDistribution(self.distribution)
+
+        if self.distribution is RateDistribution.BOOTSTRAP:
+            if self.series is None or len(self.series) == 0:
+                raise ValueError("Bootstrap rate model requires a non-empty return series")
+
+            self.series = np.asarray(self.series, dtype=float)
+
+    def sample (self, rng: np.random.Generator, shape: tuple[int, int]) -> np.ndarray | float:
+        if self.distribution is RateDistribution.CONSTANT:
+            return self.mean
+
+        elif self.distribution is RateDistribution.NORMAL:
+            return rng.normal(self.mean, self.std, shape)
+
+        elif self.distribution is RateDistribution.LOGNORMAL:
+            # Growth factor 1 + rate is lognormal with mean 1 + mean and standard deviation std
+            sigma = np.sqrt(np.log1p((self.std / (1 + self.mean)) ** 2))
+            mu = np.log1p(self.mean) - sigma ** 2 / 2
+            return np.expm1(rng.normal(mu, sigma, shape))
+
+        else:
+            return rng.choice(self.series, size=shape)
+
+@dc.dataclass(kw_only=True)
+class QuantileSketch:
+    # KLL-style mergeable sketch over all months at once: every level keeps up to `size` sorted
+    # values per month plus the number of paths they stand for, and two full levels are compacted
+    # into the next one by keeping every other value. Levels are only compacted with levels of the
+    # same path count, so batches of each size get their own ladder and a partial batch keeps its
+    # real weight. Paths that ended keep their final value, so every month sees every path and an
+    # older level extends by repeating its last month.
+    size: int = DEFAULT_SKETCH_SIZE
+    # Path count of a batch -> its ladder, where level k stands for 2^k batches
+    ladders: dict[int, list[tuple[np.ndarray, int] | None]] = dc.field(default_factory=dict)
+    count: int = 0
+
+    @property
+    def levels (self) -> list[tuple[np.ndarray, int]]:
+        return [level for ladder in self.ladders.values() for level in ladder if level is not None]
+
+    @property
+    def months (self) -> int:
+        return max((values.shape[0] for values, _ in self.levels), default=0)
+
+    @staticmethod
+    def _extend (values: np.ndarray, months: int) -> np.ndarray:
+        if values.shape[0] >= months:
+            return values
+
+        return np.concatenate([values, np.repeat(values[-1:], months - values.shape[0], axis=0)])
+
+    def update (self, batch: np.ndarray) -> None:
+        # batch is (paths, months) with every path frozen at its last value once it ends
+        paths = batch.shape[0]
+        if paths == 0:
+            return
+
+        self.count += paths
+
+        values = np.sort(batch.T, axis=1)
+        if paths > self.size:
+            values = values[:, (2 * np.arange(self.size) + 1) * paths // (2 * self.size)]
+
+        carry = (values, paths)
+        ladder = self.ladders.setdefault(paths, [])
+        for level, stored in enumerate(ladder):
+            if stored is None:
+                ladder[level] = carry
+                return
+
+            months = max(stored[0].shape[0], carry[0].shape[0])
+            merged = np.sort(
+                np.concatenate([self._extend(stored[0], months), self._extend(carry[0], months)], axis=1),
+                axis=1,
+            )
+            carry = (merged[:, level % 2::2], stored[1] + carry[1])
+            ladder[level] = None
+
+        ladder.append(carry)
+
+    def quantiles (self, percentiles: tuple[float, ...]) -> np.ndarray:
+        months = self.months
+        present = self.levels
+        if not present:
+            return np.empty((len(percentiles), 0))
+
+        values = np.concatenate([self._extend(values, months) for values, _ in present], axis=1)
+        # Every value of a level stands for an equal share of its paths
+        weights = np.concatenate([
+            np.full(values.shape[1], count / values.shape[1]) for values, count in present
+        ])
+
+        order = np.argsort(values, axis=1)
+        values = np.take_along_axis(values, order, axis=1)
+        cumulative = np.cumsum(weights[order], axis=1)
+        cumulative = (cumulative - weights[order] / 2) / cumulative[:, -1:]
+
+        return np.stack([
+            np.array([np.interp(p / 100, cumulative[month], values[month]) for month in range(months)])
+            for p in percentiles
+        ])
+
+def forward_fill (trajectories: np.ndarray) -> np.ndarray:
+    filled = np.where(np.isnan(trajectories), 0, np.arange(trajectories.shape[1]))
+    np.maximum.accumulate(filled, axis=1, out=filled)
+
+    return np.take_along_axis(trajectories, filled, axis=1)
+
+@dc.dataclass(kw_only=True)
+class MonteCarloAggregate:
+    percentiles: tuple[float, ...] = DEFAULT_PERCENTILES
+    sketch_size: int = DEFAULT_SKETCH_SIZE
+
+    paths: int = 0
+    paid_off: int = 0
+    payoff_months: np.ndarray = dc.field(default_factory=lambda: np.zeros(0, dtype=np.int64))
+
+    payment_sketch: QuantileSketch = dc.field(init=False)
+    investment_sketch: QuantileSketch = dc.field(init=False)
+
+    def __post_init__ (self) -> None:
+        self.payment_sketch = QuantileSketch(size=self.sketch_size)
+        self.investment_sketch = QuantileSketch(size=self.sketch_size)
+
+    def update (self, sweep: ScenarioSweep) -> None:
+        self.paths += len(sweep)
+        self.paid_off += int(sweep.paid_off.sum())
+
+        counts = np.bincount(sweep.months[sweep.paid_off], minlength=len(self.payoff_months))
+        counts[:len(self.payoff_months)] += self.payoff_months
+        self.payoff_months = counts
+
+        self.payment_sketch.update(forward_fill(sweep.payment_size))
+        self.investment_sketch.update(forward_fill(sweep.investment_size))
+
+    @property
+    def payment_bands (self) -> np.ndarray:
+        return self.payment_sketch.quantiles(self.percentiles)
+
+    @property
+    def investment_bands (self) -> np.ndarray:
+        return self.investment_sketch.quantiles(self.percentiles)
+
+    @property
+    def payoff_probability (self) -> float:
+        return self.paid_off / self.paths if self.paths else 0.0
+
+    def payoff_month_percentiles (self) -> np.ndarray:
+        # Percentiles over the paths that paid off; NaN when none did
+        if self.paid_off == 0:
+            return np.full(len(self.percentiles), np.nan)
+
+        cumulative = np.cumsum(self.payoff_months) / self.paid_off
+        return np.searchsorted(cumulative, np.asarray(self.percentiles) / 100).astype(float)
+
+def iter_monte_carlo (
+    ledger: CashFlowLedger, payment_size: float, investment_size: float, *,
+    paths: int, investment_rate: RateModel, payment_rate: RateModel | None = None,
+    initial_payment: float = 0, profit_tax: float = 0.0,
+    investment_yearly_percentage: float = 0, start_date: datetime | None = None,
+    seed: int | None = None, batch_size: int = 4096, max_months: int | None = 1200,
+    percentiles: tuple[float, ...] = DEFAULT_PERCENTILES, sketch_size: int = DEFAULT_SKETCH_SIZE,
+) -> Iterator[MonteCarloAggregate]:
+    rng = np.random.default_rng(seed)
+    start_date = start_date if start_date is not None else default_start_date()
+    payment_rate = payment_rate or RateModel(mean=config.PAYMENT_INTEREST_RATE)
+
+    def rate_sampler (scenarios: int, months: int) -> tuple[np.ndarray | float, np.ndarray | float]:
+        return (
+            payment_rate.sample(rng, (scenarios, months)),
+            investment_rate.sample(rng, (scenarios, months)),
+        )
+
+    aggregate = MonteCarloAggregate(percentiles=percentiles, sketch_size=sketch_size)
+    for start in range(0, paths, batch_size):
+        sweep = simulate_scenarios(
+            ledger, np.full(min(batch_size, paths - start), payment_size), investment_size,
+            initial_payment=initial_payment,
+            profit_tax=profit_tax,
+            investment_yearly_percentage=investment_yearly_percentage,
+            start_date=start_date,
+            rate_sampler=rate_sampler,
+            max_months=max_months,
+        )
+        aggregate.update(sweep)
+
+        yield aggregate
+
+def run_monte_carlo (
+    ledger: CashFlowLedger, payment_size: float, investment_size: float, **kwargs
+) -> MonteCarloAggregate:
+    # Zero paths return this empty aggregate, so it takes the same percentiles as a real run
+    aggregate = MonteCarloAggregate(
+        percentiles=kwargs.get("percentiles", DEFAULT_PERCENTILES),
+        sketch_size=kwargs.get("sketch_size", DEFAULT_SKETCH_SIZE),
+    )
+    for aggregate in iter_monte_carlo(ledger, payment_size, investment_size, **kwargs):
+        pass
+
+    return aggregate
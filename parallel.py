@@ -0,0 +1,189 @@
+import os
+import pickle
+import dataclasses as dc
+import multiprocessing as mp
+from datetime import datetime
+from multiprocessing import shared_memory
+from collections.abc import Iterable, Iterator
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+
+import config
+from structs.payment import PaymentStatus
+from structs.trajectory import PaymentTrajectory
+from structs.calendar import default_start_date
+from balance_handler import BalanceHandler
+from simulate import SimulationEngine, get_payment_status_list, get_payment_trajectory
+
+
+@dc.dataclass(kw_only=True, frozen=True)
+class Scenario:
+    payment_size: float
+    investment_size: float
+    initial_payment: float = 0
+    profit_tax: float = 0.0
+    investment_yearly_percentage: float = 0
+
+# Per-process state filled once by _init_worker, so tasks only carry their scenarios
+_worker_handler: BalanceHandler | None = None
+_worker_start_date: datetime | None = None
+_worker_engine: SimulationEngine = SimulationEngine.LOOP
+_worker_legacy: bool = False
+
+SimulationResult = PaymentTrajectory | list[PaymentStatus]
+
+def _init_worker (
+    ledger_name: str, ledger_size: int, start_date: datetime, engine: SimulationEngine,
+    legacy: bool, rates: tuple[float, float],
+) -> None:
+    global _worker_handler, _worker_start_date, _worker_engine, _worker_legacy
+
+    ledger = shared_memory.SharedMemory(name=ledger_name)
+    try:
+        _worker_handler = BalanceHandler(dataframe=pickle.loads(ledger.buf[:ledger_size]))
+
+    finally:
+        ledger.close()
+
+    _worker_start_date = start_date
+    _worker_engine = engine
+    _worker_legacy = legacy
+    config.PAYMENT_INTEREST_RATE, config.INVESTMENT_INTERST_RATE = rates
+
+def _run_chunk (chunk: list[tuple[int, Scenario]]) -> list[tuple[int, SimulationResult]]:
+    simulate = get_payment_status_list if _worker_legacy else get_payment_trajectory
+
+    return [
+        (idx, simulate(
+            _worker_handler, scenario.payment_size, scenario.investment_size,
+            initial_payment=scenario.initial_payment,
+            profit_tax=scenario.profit_tax,
+            investment_yearly_percentage=scenario.investment_yearly_percentage,
+            start_date=_worker_start_date,
+            engine=_worker_engine,
+        ))
+        for idx, scenario in chunk
+    ]
+
+@dc.dataclass(kw_only=True)
+class ScenarioRunner:
+    handler: BalanceHandler
+    max_workers: int | None = None
+    chunk_size: int = 16
+    max_pending_chunks: int | None = None
+    engine: SimulationEngine | str = SimulationEngine.LOOP
+    start_date: datetime = dc.field(default_factory=default_start_date)
+    legacy: bool = False
+    mp_context: str | None = None
+
+    _ledger: shared_memory.SharedMemory | None = dc.field(init=False, default=None)
+    _executor: ProcessPoolExecutor | None = dc.field(init=False, default=None)
+    _cancelled: bool = dc.field(init=False, default=False)
+
+    def __post_init__ (self) -> None:
+        self.engine = SimulationEngine(self.engine)
+        self.max_workers = self.max_workers or os.cpu_count() or 1
+
+        if self.max_pending_chunks is None:
+            self.max_pending_chunks = 2 * self.max_workers
+
+    def __enter__ (self) -> "ScenarioRunner":
+        self.start()
+        return self
+
+    def __exit__ (self, *exc_info) -> None:
+        self.close()
+
+    def start (self) -> None:
+        if self._executor is not None:
+            return
+
+        payload = pickle.dumps(self.handler.df, protocol=pickle.HIGHEST_PROTOCOL)
+        self._ledger = shared_memory.SharedMemory(create=True, size=max(len(payload), 1))
+        self._ledger.buf[:len(payload)] = payload
+
+        self._cancelled = False
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            mp_context=mp.get_context(self.mp_context) if self.mp_context else None,
+            initializer=_init_worker,
+            initargs=(
+                self._ledger.name, len(payload), self.start_date, self.engine, self.legacy,
+                (config.PAYMENT_INTEREST_RATE, config.INVESTMENT_INTERST_RATE),
+            ),
+        )
+
+    def cancel (self) -> None:
+        self._cancelled = True
+        self.close(wait=False)
+
+    def close (self, wait: bool = True) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait, cancel_futures=True)
+            self._executor = None
+
+        if self._ledger is not None:
+            self._ledger.close()
+            self._ledger.unlink()
+            self._ledger = None
+
+    def _chunks (self, scenarios: Iterable[Scenario]) -> Iterator[list[tuple[int, Scenario]]]:
+        chunk = []
+        for item in enumerate(scenarios):
+            chunk.append(item)
+
+            if len(chunk) == self.chunk_size:
+                yield chunk
+                chunk = []
+
+        if chunk:
+            yield chunk
+
+    def run (
+        self, scenarios: Iterable[Scenario], *, ordered: bool = True
+    ) -> Iterator[tuple[int, SimulationResult]]:
+        self.start()
+
+        chunks = self._chunks(scenarios)
+        pending: set[Future] = set()
+        completed: dict[int, SimulationResult] = {}
+        next_idx = 0
+        exhausted = False
+
+        try:
+            while not self._cancelled:
+                while not (exhausted or self._cancelled) and len(pending) < self.max_pending_chunks:
+                    chunk = next(chunks, None)
+                    if chunk is None:
+                        exhausted = True
+
+                    else:
+                        pending.add(self._executor.submit(_run_chunk, chunk))
+
+                if not pending:
+                    break
+
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future.cancelled():
+                        continue
+
+                    for idx, simulation in future.result():
+                        if not ordered:
+                            yield idx, simulation
+
+                        else:
+                            completed[idx] = simulation
+
+                while next_idx in completed:
+                    yield next_idx, completed.pop(next_idx)
+                    next_idx += 1
+
+        finally:
+            for future in pending:
+                future.cancel()
+
+            if self._cancelled or pending:
+                self.close(wait=False)
+
+    def map (self, scenarios: Iterable[Scenario]) -> list[SimulationResult]:
+        return [simulation for _, simulation in self.run(scenarios)]
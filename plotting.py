@@ -0,0 +1,167 @@
+import numpy as np
+from matplotlib.axes import Axes
+from matplotlib.figure import Figure
+
+import instrumentation
+from structs.trajectory import PaymentTrajectory
+
+
+# Points drawn per horizontal pixel of the axes; more than that cannot be told apart
+POINTS_PER_PIXEL = 2
+MIN_POINTS = 16
+
+# (trajectory attribute, label, line style)
+TRAJECTORY_SERIES = (
+    ("payment_size", "Pagamento", "-"),
+    ("investment_size", "Investimento", "-"),
+    ("extra_credit", "Crédito Líquido", "--"),
+)
+
+
+def lttb (x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    # Largest-triangle-three-buckets: keeps the first and last points and, from each bucket
+    # in between, the point spanning the largest triangle with the previous pick and the
+    # average of the next bucket, so peaks and turns survive the downsampling.
+    size = len(x)
+    if threshold >= size or threshold < 3:
+        return np.arange(size)
+
+    edges = np.linspace(1, size - 1, threshold - 1).astype(np.int64)
+    averages_x = np.add.reduceat(x[1:size - 1], edges[:-1] - 1) / np.diff(edges)
+    averages_y = np.add.reduceat(y[1:size - 1], edges[:-1] - 1) / np.diff(edges)
+    # The last bucket looks ahead to the final point
+    averages_x = np.append(averages_x[1:], x[-1])
+    averages_y = np.append(averages_y[1:], y[-1])
+
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0], selected[-1] = 0, size - 1
+
+    previous = 0
+    for bucket in range(threshold - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        areas = np.abs(
+            (x[previous] - averages_x[bucket]) * (y[start:end] - y[previous])
+            - (x[previous] - x[start:end]) * (averages_y[bucket] - y[previous])
+        )
+
+        previous = start + int(np.argmax(areas))
+        selected[bucket + 1] = previous
+
+    return selected
+
+class TrajectoryPlot:
+    # Persistent plotting surface: one figure and one line per series reused across runs.
+    # Lines only hold a downsampled copy of the visible window, re-sampled from the full
+    # series whenever the x limits change, so zooming in brings back every month.
+    def __init__ (self, figure: Figure | None = None, *, blit: bool = False) -> None:
+        self.figure = figure if figure is not None else Figure(figsize=(10, 6))
+        self.ax: Axes = self.figure.add_subplot()
+        # Blitted lines are animated, which leaves them out of savefig; only for live canvases
+        self.blit = blit
+
+        self.lines = {
+            name: self.ax.plot([], [], label=label, linestyle=linestyle, animated=blit)[0]
+            for name, label, linestyle in TRAJECTORY_SERIES
+        }
+        self.ax.set_xlabel("Mês")
+        self.ax.set_ylabel("Valor")
+        self.ax.set_title("Evolução do Pagamento, Investimento e Crédito Líquido ao Longo do Tempo")
+        self.ax.legend()
+        self.ax.grid(True)
+        self.figure.tight_layout()
+
+        self.months = np.empty(0)
+        self.series: dict[str, np.ndarray] = {name: np.empty(0) for name in self.lines}
+        self._background = None
+        self._updating = False
+
+        # Callback registries keep bound methods weakly; the closures keep this plot alive
+        # as long as its figure
+        self.ax.callbacks.connect("xlim_changed", lambda ax: self._on_xlim_changed())
+        self.figure.canvas.mpl_connect("draw_event", lambda event: self._on_draw())
+
+    def set_trajectory (self, trajectory: PaymentTrajectory, *, keep_view: bool = False) -> None:
+        # keep_view is for progress updates of the same run, which keep a toolbar zoom or pan;
+        # a new trajectory always starts from limits fitted to its data
+        with instrumentation.phase("plot.update") as phase:
+            phase.iterations = len(trajectory)
+            self._set_trajectory(trajectory, keep_view)
+
+    def _set_trajectory (self, trajectory: PaymentTrajectory, keep_view: bool) -> None:
+        self.months = np.arange(len(trajectory), dtype=float)
+        self.series = {name: np.asarray(getattr(trajectory, name), dtype=float) for name in self.lines}
+
+        limits = (self.ax.get_xlim(), self.ax.get_ylim())
+
+        # Limits come from the full series, not from their downsampled copies
+        self._updating = True
+        try:
+            # Zooming and panning set the limits, which turns autoscaling off until re-enabled
+            if not keep_view:
+                self.ax.set_autoscale_on(True)
+
+            self.ax.ignore_existing_data_limits = True
+            for values in self.series.values():
+                finite = np.isfinite(values)
+                self.ax.update_datalim(np.column_stack((self.months[finite], values[finite])))
+
+            self.ax.autoscale_view()
+
+        finally:
+            self._updating = False
+
+        self._resample()
+
+        if self.blit and self._background is not None and limits == (self.ax.get_xlim(), self.ax.get_ylim()):
+            self._blit()
+
+        else:
+            self.figure.canvas.draw_idle()
+
+    def points_budget (self) -> int:
+        return max(int(self.ax.bbox.width * POINTS_PER_PIXEL), MIN_POINTS)
+
+    def _resample (self) -> None:
+        if len(self.months) == 0:
+            for line in self.lines.values():
+                line.set_data([], [])
+
+            return
+
+        # Months are consecutive integers, so the visible window is a slice; one extra point
+        # on each side keeps the lines running to the edges of the axes
+        low, high = self.ax.get_xlim()
+        start = int(np.clip(np.floor(low), 0, len(self.months) - 1))
+        end = int(np.clip(np.ceil(high) + 2, start + 1, len(self.months)))
+        months = self.months[start:end]
+
+        budget = self.points_budget()
+        for name, line in self.lines.items():
+            values = self.series[name][start:end]
+            selected = lttb(months, values, budget)
+            line.set_data(months[selected], values[selected])
+
+    def _on_xlim_changed (self) -> None:
+        # Pans and zooms redraw afterwards, so the new line data is picked up by that draw
+        if not self._updating:
+            self._resample()
+
+    def _on_draw (self) -> None:
+        if not self.blit:
+            return
+
+        # Animated lines are skipped by the full draw: keep the background, then add them
+        canvas = self.figure.canvas
+        self._background = canvas.copy_from_bbox(self.ax.bbox)
+        for line in self.lines.values():
+            self.ax.draw_artist(line)
+
+    def _blit (self) -> None:
+        # Limits did not move, so only the lines have to be painted over the saved background
+        canvas = self.figure.canvas
+        canvas.restore_region(self._background)
+        for line in self.lines.values():
+            self.ax.draw_artist(line)
+
+        canvas.blit(self.ax.bbox)
+        canvas.flush_events()
@@ -0,0 +1,248 @@
+import numpy as np
+import pandas as pd
+import dataclasses as dc
+from datetime import datetime
+from collections.abc import Mapping
+from typing import TYPE_CHECKING
+
+import instrumentation
+from structs.balance import SpreadType
+from structs.trajectory import PaymentTrajectory
+from structs.balance_table import SPREAD_TYPES, BalanceTable
+from structs.calendar import PERIODIC_SPREADS, SimulationCalendar, default_start_date
+from structs.schedule import BREAKDOWN_FIELDS, balance_values, first_counter, schedule_events
+from storage import BALANCE_COLUMNS
+from vectorized import BreakdownSampler, ScenarioSweep, simulate_batch
+
+if TYPE_CHECKING:
+    from balance_handler import BalanceHandler
+
+
+# Column of a combined ledger holding the portfolio (owner) every balance belongs to
+PORTFOLIO_COLUMN = "portfolio"
+# Events are keyed by portfolio * COUNTER_SPAN + counter, so one sorted array holds every portfolio
+COUNTER_SPAN = 1 << 31
+# Running portfolios x months per simulated block; each cell carries a whole breakdown
+MAX_BLOCK_CELLS = 1 << 20
+# Below this many portfolios left, summing their events one portfolio at a time is faster
+SEQUENTIAL_PORTFOLIOS = 64
+SUMMARY_COLUMNS = ("months", "paid_off", "payoff_month", "final_payment", "final_investment")
+
+
+@dc.dataclass(kw_only=True)
+class PortfolioSchedule:
+    # EventSchedule of many independent ledgers. For every portfolio, cumulative holds its
+    # initial breakdown followed by the breakdown after each of its counters, in counter order.
+    keys: np.ndarray
+    cumulative: np.ndarray
+    # First key and first cumulative row of every portfolio
+    first_event: np.ndarray
+    offsets: np.ndarray
+
+    @classmethod
+    def from_arrays (
+        cls, values: np.ndarray, start: np.ndarray, expiry: np.ndarray, first_counter: int,
+        portfolios: np.ndarray, n_portfolios: int,
+    ) -> "PortfolioSchedule":
+        start, expiry, initially, activated, removed = schedule_events(start, expiry, first_counter)
+
+        counters = np.minimum(np.concatenate([start[activated], expiry[removed]]), COUNTER_SPAN - 1)
+        owners = np.concatenate([portfolios[activated], portfolios[removed]])
+        keys, inverse = np.unique(owners * COUNTER_SPAN + counters.astype(np.int64), return_inverse=True)
+
+        deltas = np.zeros((len(keys), len(BREAKDOWN_FIELDS)))
+        np.add.at(deltas, inverse, np.concatenate([values[activated], -values[removed]]))
+
+        initial = np.zeros((n_portfolios, len(BREAKDOWN_FIELDS)))
+        np.add.at(initial, portfolios[initially], values[initially])
+
+        key_portfolios = keys // COUNTER_SPAN
+        first_event = np.searchsorted(key_portfolios, np.arange(n_portfolios + 1))
+        offsets = first_event + np.arange(n_portfolios + 1)
+
+        cumulative = np.empty((len(keys) + n_portfolios, len(BREAKDOWN_FIELDS)))
+        cumulative[offsets[:-1]] = initial
+        cumulative[np.arange(len(keys)) + key_portfolios + 1] = deltas
+
+        # Summed portfolio by portfolio: one running sum over all of them would leak the
+        # rounding of every earlier portfolio into the later ones. Every step adds one event
+        # to all portfolios that still have one, and the few longest finish on their own.
+        events = np.diff(first_event)
+        pending = np.flatnonzero(events)
+        step = 1
+        while len(pending) > SEQUENTIAL_PORTFOLIOS:
+            rows = offsets[pending] + step
+            cumulative[rows] += cumulative[rows - 1]
+
+            step += 1
+            pending = pending[events[pending] >= step]
+
+        for portfolio in pending.tolist():
+            segment = cumulative[offsets[portfolio] + step - 1:offsets[portfolio + 1]]
+            np.cumsum(segment, axis=0, out=segment)
+
+        return cls(keys=keys, cumulative=cumulative, first_event=first_event, offsets=offsets)
+
+    def state_at (self, portfolios: np.ndarray, counter: np.ndarray) -> np.ndarray:
+        # (portfolios, counters, 4) breakdowns
+        keys = portfolios[:, None] * COUNTER_SPAN + np.minimum(counter, COUNTER_SPAN - 1)[None, :]
+        events = np.searchsorted(self.keys, keys, side="right") - self.first_event[portfolios, None]
+
+        return self.cumulative[self.offsets[portfolios, None] + events]
+
+    @property
+    def is_empty (self) -> bool:
+        return len(self.keys) == 0 and not self.cumulative.any()
+
+@dc.dataclass(kw_only=True)
+class PortfolioLedger:
+    # CashFlowLedger of every portfolio in a combined ledger, compiled in one pass
+    portfolios: np.ndarray
+    monthly: PortfolioSchedule
+    yearly: PortfolioSchedule
+    quarterly: PortfolioSchedule
+    semiannual: PortfolioSchedule
+
+    def __len__ (self) -> int:
+        return len(self.portfolios)
+
+    @classmethod
+    def from_frame (
+        cls, df: pd.DataFrame, *, portfolios: list[str] | None = None, column: str = PORTFOLIO_COLUMN,
+    ) -> "PortfolioLedger":
+        # Portfolios are sorted unless given, and listing them keeps portfolios without balances
+        missing = [name for name in (*BALANCE_COLUMNS[1:], column) if name not in df.columns]
+        if missing:
+            raise ValueError(f"Portfolio ledger is missing columns {', '.join(missing)}")
+
+        owners = df[column].astype(str).to_numpy(dtype=object)
+        if portfolios is None:
+            keys, codes = np.unique(owners, return_inverse=True)
+
+        else:
+            keys = np.array(portfolios, dtype=object)
+            codes = pd.Index(keys).get_indexer(owners)
+            if (codes < 0).any():
+                raise ValueError(f"Unknown portfolio {owners[np.argmax(codes < 0)]}")
+
+        with instrumentation.phase("ledger.compile_portfolios") as phase:
+            phase.iterations = len(df)
+
+            table = BalanceTable.from_frame(df)
+            values = balance_values(table)
+            start, expiry = table.start_counters(), table.expiry_counters()
+
+            schedules = {}
+            for code, spread in enumerate(SPREAD_TYPES):
+                rows = table.spread_type == code
+                schedules[spread.value] = PortfolioSchedule.from_arrays(
+                    values[rows], start[rows], expiry[rows], first_counter(spread),
+                    codes[rows].astype(np.int64), len(keys),
+                )
+
+        return cls(portfolios=keys, **schedules)
+
+    @classmethod
+    def from_handlers (cls, handlers: Mapping[str, "BalanceHandler"]) -> "PortfolioLedger":
+        frames = [handler.df.assign(**{PORTFOLIO_COLUMN: name}) for name, handler in handlers.items()]
+        df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(
+            columns=[*BALANCE_COLUMNS, PORTFOLIO_COLUMN]
+        )
+
+        return cls.from_frame(df, portfolios=[str(name) for name in handlers])
+
+    @classmethod
+    def from_csv (cls, path: str, *, column: str = PORTFOLIO_COLUMN) -> "PortfolioLedger":
+        try:
+            df = pd.read_csv(path, dtype={"id": str, "name": str, column: str})
+
+        except FileNotFoundError:
+            raise ValueError(f"Balance file {path} not found")
+
+        return cls.from_frame(df, column=column)
+
+    def schedule (self, spread: SpreadType) -> PortfolioSchedule:
+        return getattr(self, spread.value)
+
+    def breakdown_sampler (self, start_date: datetime) -> BreakdownSampler:
+        calendar = SimulationCalendar(start_date=start_date)
+        periodic = [
+            (spread, self.schedule(spread)) for spread in PERIODIC_SPREADS if not self.schedule(spread).is_empty
+        ]
+
+        def sample (rows: np.ndarray, months: np.ndarray) -> np.ndarray:
+            # Periodic balances only reach the months their period closes, so only those look them up
+            breakdown = self.monthly.state_at(rows, months)
+            for spread, schedule in periodic:
+                due = calendar.is_due(spread, months)
+                breakdown[:, due] += schedule.state_at(rows, calendar.periods_before(spread, months[due]))
+
+            return breakdown
+
+        return sample
+
+@dc.dataclass(kw_only=True)
+class PortfolioSimulation:
+    # One scenario row per portfolio, in ledger order; rows that paid off early are NaN-padded
+    portfolios: np.ndarray
+    sweep: ScenarioSweep
+
+    def __len__ (self) -> int:
+        return len(self.portfolios)
+
+    def row (self, portfolio: str) -> int:
+        matches = np.flatnonzero(self.portfolios == portfolio)
+        if len(matches) == 0:
+            raise ValueError(f"Unknown portfolio {portfolio}")
+
+        return int(matches[0])
+
+    def summary (self) -> pd.DataFrame:
+        return pd.DataFrame({
+            PORTFOLIO_COLUMN: self.portfolios,
+            **{name: getattr(self.sweep, name) for name in SUMMARY_COLUMNS},
+        })
+
+    def trajectory (self, portfolio: str) -> PaymentTrajectory:
+        if self.sweep.total_breakdown is None:
+            raise ValueError("Portfolio trajectories need a simulation run with keep_breakdown")
+
+        row = self.row(portfolio)
+        horizon = int(self.sweep.months[row]) + 1
+
+        return PaymentTrajectory.from_arrays(
+            self.sweep.payment_size[row, :horizon],
+            self.sweep.investment_size[row, :horizon],
+            self.sweep.total_breakdown[row, :horizon],
+            start_date=self.sweep.start_date,
+        )
+
+def simulate_portfolios (
+    ledger: PortfolioLedger, payment_size: np.ndarray | float, investment_size: np.ndarray | float, *,
+    initial_payment: np.ndarray | float = 0, profit_tax: np.ndarray | float = 0.0,
+    investment_yearly_percentage: np.ndarray | float = 0, start_date: datetime | None = None,
+    keep_trajectories: bool = True, keep_breakdown: bool = False, max_months: int | None = None,
+) -> PortfolioSimulation:
+    # Parameters are scalars shared by every portfolio or arrays in ledger order
+    if len(ledger) == 0:
+        raise ValueError("Portfolio ledger has no portfolios")
+
+    start_date = start_date if start_date is not None else default_start_date()
+    parameters = [
+        np.broadcast_to(np.asarray(param, dtype=float), len(ledger))
+        for param in (payment_size, investment_size, initial_payment, profit_tax, investment_yearly_percentage)
+    ]
+
+    sweep = simulate_batch(
+        ledger.breakdown_sampler(start_date), *parameters[:2],
+        initial_payment=parameters[2],
+        profit_tax=parameters[3],
+        investment_yearly_percentage=parameters[4],
+        start_date=start_date,
+        keep_trajectories=keep_trajectories,
+        keep_breakdown=keep_breakdown,
+        max_months=max_months,
+        max_block_cells=MAX_BLOCK_CELLS,
+    )
+
+    return PortfolioSimulation(portfolios=ledger.portfolios, sweep=sweep)
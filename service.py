@@ -0,0 +1,541 @@
+import json
+import time
+import logging
+import threading
+import numpy as np
+import dataclasses as dc
+from enum import StrEnum
+from pathlib import Path
+from datetime import datetime
+from collections import deque
+from collections.abc import Callable
+from concurrent.futures import Future, ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import config
+from cache import SimulationCache, cache_key
+from storage import storage_for
+from journal import journal_path
+from balance_handler import BalanceHandler
+from structs.schedule import CashFlowLedger
+from structs.calendar import default_start_date
+from structs.trajectory import TRAJECTORY_COLUMNS
+from solver import GoalParameter
+from simulate import SimulationEngine, get_goal_solution, get_payment_sweep, get_payment_trajectory
+
+
+logger = logging.getLogger(__name__)
+
+SERVICE_HOST = "127.0.0.1"
+SERVICE_PORT = 8765
+# Simulations running at once, and waiting behind them before requests are turned away
+SERVICE_WORKERS = 4
+MAX_PENDING_REQUESTS = 256
+# How long a summary run waits for others to share its vectorized pass, and how many join one
+BATCH_WINDOW_SECONDS = 0.002
+MAX_BATCH_SIZE = 256
+REQUEST_TIMEOUT_SECONDS = 60.0
+# Latencies kept per request kind for the percentiles
+LATENCY_WINDOW = 1024
+
+SWEEP_PARAMETERS = (
+    "payment_size", "investment_size", "initial_payment", "profit_tax", "investment_yearly_percentage"
+)
+SUMMARY_COLUMNS = ("months", "paid_off", "final_payment", "final_investment")
+
+
+class RequestKind (StrEnum):
+    RUN = "run"
+    SWEEP = "sweep"
+    SOLVE = "solve"
+
+class ServiceBusy (RuntimeError):
+    pass
+
+def number (payload: dict, name: str, default: float | None = None) -> float | None:
+    value = payload.get(name, default)
+    if value is None:
+        return None
+
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise ValueError(f"{name} must be a number, got {value!r}")
+
+    return float(value)
+
+def numbers (payload: dict, name: str, default: float) -> np.ndarray:
+    values = payload.get(name, default)
+    values = values if isinstance(values, list) else [values]
+    if not values:
+        raise ValueError(f"{name} must not be empty")
+
+    return np.array([number({name: value}, name) for value in values], dtype=float)
+
+def start_date (payload: dict) -> datetime:
+    value = payload.get("start_date")
+    if value is None:
+        return default_start_date()
+
+    try:
+        return datetime.fromisoformat(value)
+
+    except (TypeError, ValueError):
+        raise ValueError(f"invalid start_date {value!r}, expected YYYY-MM-DD")
+
+def plan_parameters (payload: dict) -> dict:
+    # Request fields follow the CLI options: investment_yearly is the yearly percentage
+    return {
+        "payment_size": number(payload, "payment_size", config.DEBIT_SIZE),
+        "investment_size": number(payload, "investment_size", config.INVESTMENT_SIZE),
+        "initial_payment": number(payload, "initial_payment", 0.0),
+        "profit_tax": number(payload, "profit_tax", 0.0),
+        "investment_yearly_percentage": number(payload, "investment_yearly", 0.0),
+    }
+
+def summary_result (months: int, paid_off: bool, final_payment: float, final_investment: float) -> dict:
+    return dict(zip(SUMMARY_COLUMNS, (int(months), bool(paid_off), float(final_payment), float(final_investment))))
+
+@dc.dataclass(kw_only=True)
+class LatencyStats:
+    requests: int = 0
+    errors: int = 0
+    coalesced: int = 0
+    latencies: deque = dc.field(default_factory=lambda: deque(maxlen=LATENCY_WINDOW))
+
+    def summary (self, uptime: float) -> dict:
+        latencies = np.array(self.latencies, dtype=float) * 1000
+        percentiles = np.percentile(latencies, [50, 95, 99]) if len(latencies) else [None] * 3
+
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "coalesced": self.coalesced,
+            "per_second": self.requests / uptime if uptime > 0 else 0.0,
+            "mean_ms": float(latencies.mean()) if len(latencies) else None,
+            **{
+                f"p{quantile}_ms": float(value) if value is not None else None
+                for quantile, value in zip((50, 95, 99), percentiles)
+            },
+        }
+
+@dc.dataclass(kw_only=True)
+class ServiceMetrics:
+    started: float = dc.field(default_factory=time.perf_counter)
+    kinds: dict[RequestKind, LatencyStats] = dc.field(
+        default_factory=lambda: {kind: LatencyStats() for kind in RequestKind}
+    )
+    busy: int = 0
+    pending: int = 0
+    batches: int = 0
+    batched: int = 0
+
+    _lock: threading.Lock = dc.field(init=False, default_factory=threading.Lock, repr=False)
+
+    def record (self, kind: RequestKind, seconds: float, failed: bool) -> None:
+        with self._lock:
+            stats = self.kinds[kind]
+            stats.requests += 1
+            stats.errors += int(failed)
+            stats.latencies.append(seconds)
+
+    def count (self, name: str, kind: RequestKind | None = None, amount: int = 1) -> None:
+        with self._lock:
+            target = self.kinds[kind] if kind is not None else self
+            setattr(target, name, getattr(target, name) + amount)
+
+    def snapshot (self) -> dict:
+        with self._lock:
+            uptime = time.perf_counter() - self.started
+            return {
+                "uptime_seconds": uptime,
+                "pending": self.pending,
+                "busy": self.busy,
+                "batches": self.batches,
+                "batched_runs": self.batched,
+                "mean_batch_size": self.batched / self.batches if self.batches else None,
+                "requests": {kind.value: stats.summary(uptime) for kind, stats in self.kinds.items()},
+            }
+
+@dc.dataclass(kw_only=True)
+class WarmLedger:
+    # A ledger kept loaded between requests, reloaded once its file or journal changes on disk
+    path: Path
+    handler: BalanceHandler
+    signature: tuple
+
+    _compiled: tuple[int, CashFlowLedger] | None = dc.field(init=False, default=None, repr=False)
+    _lock: threading.Lock = dc.field(init=False, default_factory=threading.Lock, repr=False)
+
+    @staticmethod
+    def file_signature (path: Path) -> tuple:
+        journal = journal_path(path)
+        files = (path, journal, journal.with_name(f"{journal.name}.old"))
+
+        return tuple(
+            (file.stat().st_mtime_ns, file.stat().st_size) if file.exists() else None for file in files
+        )
+
+    @classmethod
+    def load (cls, path: Path) -> "WarmLedger":
+        signature = cls.file_signature(path)
+        handler = BalanceHandler(storage=storage_for(path))
+
+        # Requests only read the ledger, so the journal is replayed and let go
+        handler.close()
+        handler.journal = None
+
+        return cls(path=path, handler=handler, signature=signature)
+
+    @property
+    def ledger (self) -> CashFlowLedger:
+        with self._lock:
+            if self._compiled is None or self._compiled[0] != self.handler.version:
+                self._compiled = (self.handler.version, CashFlowLedger.from_handler(self.handler))
+
+            return self._compiled[1]
+
+@dc.dataclass(kw_only=True)
+class LedgerPool:
+    # Ledger of requests that name none; BALANCE_FILE_PATH when unset
+    default_path: str | None = None
+    ledgers: dict[Path, WarmLedger] = dc.field(default_factory=dict)
+
+    _lock: threading.Lock = dc.field(init=False, default_factory=threading.Lock, repr=False)
+
+    def get (self, path: str | None) -> WarmLedger:
+        path = path if path is not None else self.default_path
+        path = Path(path if path is not None else config.BALANCE_FILE_PATH).resolve()
+        signature = WarmLedger.file_signature(path)
+
+        with self._lock:
+            warm = self.ledgers.get(path)
+            if warm is None or warm.signature != signature:
+                if not any(signature):
+                    raise ValueError(f"Balance file {path} not found")
+
+                warm = self.ledgers[path] = WarmLedger.load(path)
+
+            return warm
+
+@dc.dataclass(kw_only=True)
+class PendingRun:
+    parameters: dict
+    future: Future
+
+@dc.dataclass(kw_only=True)
+class SimulationService:
+    # Serves simulations from warm ledgers. Identical requests in flight share one computation,
+    # and summary runs on the same ledger and calendar month are batched into one vectorized sweep.
+    workers: int = SERVICE_WORKERS
+    max_pending: int = MAX_PENDING_REQUESTS
+    batch_window: float = BATCH_WINDOW_SECONDS
+    max_batch: int = MAX_BATCH_SIZE
+
+    ledgers: LedgerPool = dc.field(default_factory=LedgerPool)
+    cache: SimulationCache = dc.field(default_factory=SimulationCache)
+    metrics: ServiceMetrics = dc.field(default_factory=ServiceMetrics)
+
+    _executor: ThreadPoolExecutor = dc.field(init=False, repr=False)
+    _inflight: dict[str, Future] = dc.field(init=False, default_factory=dict, repr=False)
+    _batches: dict[tuple, list[PendingRun]] = dc.field(init=False, default_factory=dict, repr=False)
+    _lock: threading.Lock = dc.field(init=False, default_factory=threading.Lock, repr=False)
+
+    def __post_init__ (self) -> None:
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="simulation")
+
+    def __enter__ (self) -> "SimulationService":
+        return self
+
+    def __exit__ (self, *exc_info) -> None:
+        self.close()
+
+    def close (self) -> None:
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+    def submit (self, kind: RequestKind | str, payload: dict) -> Future:
+        # Validates the request and returns the future of its JSON-ready result
+        kind = RequestKind(kind)
+        if not isinstance(payload, dict):
+            raise ValueError("request body must be a JSON object")
+
+        warm = self.ledgers.get(payload.get("ledger"))
+        prepare = {
+            RequestKind.RUN: self._prepare_run,
+            RequestKind.SWEEP: self._prepare_sweep,
+            RequestKind.SOLVE: self._prepare_solve,
+        }[kind]
+        key, launch = prepare(warm, payload)
+
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                self.metrics.count("coalesced", kind)
+                return future
+
+            if self.metrics.pending >= self.max_pending:
+                self.metrics.count("busy")
+                raise ServiceBusy(f"{self.metrics.pending} requests already pending")
+
+            future = launch()
+            self._inflight[key] = future
+            self.metrics.count("pending")
+
+        future.add_done_callback(lambda _: self._settle(key))
+        return future
+
+    def request (self, kind: RequestKind | str, payload: dict, timeout: float | None = REQUEST_TIMEOUT_SECONDS) -> dict:
+        started = time.perf_counter()
+        failed = True
+        try:
+            result = self.submit(kind, payload).result(timeout=timeout)
+            failed = False
+            return result
+
+        finally:
+            self.metrics.record(RequestKind(kind), time.perf_counter() - started, failed)
+
+    def _settle (self, key: str) -> None:
+        with self._lock:
+            self._inflight.pop(key, None)
+            self.metrics.count("pending", amount=-1)
+
+    def _pooled (self, compute: Callable[[], dict]) -> Callable[[], Future]:
+        return lambda: self._executor.submit(compute)
+
+    def _prepare_run (self, warm: WarmLedger, payload: dict) -> tuple[str, Callable[[], Future]]:
+        parameters = plan_parameters(payload)
+        start = start_date(payload)
+        engine = SimulationEngine(payload.get("engine", SimulationEngine.LOOP))
+        summary = bool(payload.get("summary", False))
+
+        # Every engine gives the same summary, so summaries share one key whatever the engine
+        key = cache_key(
+            warm.handler.ledger_hash, RequestKind.RUN.value, **parameters,
+            start_month=start.month, engine=None if summary else engine.value,
+        )
+
+        if summary:
+            return key, lambda: self._enqueue_run(warm, start, parameters)
+
+        def compute () -> dict:
+            trajectory = get_payment_trajectory(
+                warm.handler, **parameters, start_date=start, engine=engine, ledger=warm.ledger, cache=self.cache
+            )
+            result = summary_result(
+                len(trajectory) - 1, not trajectory.payment_size[-1] > 0,
+                trajectory.payment_size[-1], trajectory.investment_size[-1],
+            )
+            result["trajectory"] = {name: trajectory.column(name).tolist() for name in TRAJECTORY_COLUMNS}
+
+            return result
+
+        return key, self._pooled(compute)
+
+    def _prepare_sweep (self, warm: WarmLedger, payload: dict) -> tuple[str, Callable[[], Future]]:
+        parameters = {
+            "payment_size": numbers(payload, "payment_size", config.DEBIT_SIZE),
+            "investment_size": numbers(payload, "investment_size", config.INVESTMENT_SIZE),
+            "initial_payment": numbers(payload, "initial_payment", 0.0),
+            "profit_tax": numbers(payload, "profit_tax", 0.0),
+            "investment_yearly_percentage": numbers(payload, "investment_yearly", 0.0),
+        }
+        start = start_date(payload)
+        grid = bool(payload.get("grid", False))
+
+        key = cache_key(
+            warm.handler.ledger_hash, RequestKind.SWEEP.value,
+            **{name: values.tolist() for name, values in parameters.items()}, start_month=start.month, grid=grid,
+        )
+
+        def compute () -> dict:
+            sweep = get_payment_sweep(
+                warm.handler, **parameters, start_date=start, grid=grid, keep_trajectories=False, ledger=warm.ledger
+            )
+            columns = {
+                **{name: sweep.parameters[name].tolist() for name in SWEEP_PARAMETERS},
+                **{name: getattr(sweep, name).tolist() for name in SUMMARY_COLUMNS},
+            }
+
+            return {"scenarios": [dict(zip(columns, row)) for row in zip(*columns.values())]}
+
+        return key, self._pooled(compute)
+
+    def _prepare_solve (self, warm: WarmLedger, payload: dict) -> tuple[str, Callable[[], Future]]:
+        parameters = plan_parameters(payload)
+        start = start_date(payload)
+        goals = {
+            name: number(payload, name) for name in ("payoff_within", "final_investment")
+            if payload.get(name) is not None
+        }
+        if len(goals) != 1:
+            raise ValueError("solve needs exactly one of payoff_within and final_investment")
+
+        metric = "payoff_month" if "payoff_within" in goals else "final_investment"
+        target = goals.popitem()[1]
+        search = {name: number(payload, name) for name in ("low", "high", "guess", "tolerance")}
+        parameter = GoalParameter(payload.get("parameter"))
+
+        key = cache_key(
+            warm.handler.ledger_hash, RequestKind.SOLVE.value, **parameters, **search,
+            parameter=parameter.value, metric=metric, target=target, start_month=start.month,
+        )
+
+        def compute () -> dict:
+            solution = get_goal_solution(
+                warm.handler, **parameters, parameter=parameter, metric=metric, target=target,
+                start_date=start, ledger=warm.ledger, **search,
+            )
+            evaluation = solution.evaluation
+
+            return {
+                "parameter": solution.parameter.value,
+                "metric": solution.metric.value,
+                "target": target,
+                "value": solution.value,
+                **{
+                    name: getattr(evaluation, name) if evaluation else None
+                    for name in ("months", "paid_off", "final_payment", "final_investment")
+                },
+                "evaluations": solution.evaluations,
+                "converged": solution.converged,
+            }
+
+        return key, self._pooled(compute)
+
+    def _enqueue_run (self, warm: WarmLedger, start: datetime, parameters: dict) -> Future:
+        # Called under the service lock; the first run of a batch schedules its flush.
+        # A reloaded ledger is a new WarmLedger whose handler may restart at the same version,
+        # so batches key on the warm ledger itself; its flush timer keeps it alive meanwhile.
+        key = (id(warm), start.month)
+        run = PendingRun(parameters=parameters, future=Future())
+
+        batch = self._batches.setdefault(key, [])
+        batch.append(run)
+        if len(batch) >= self.max_batch:
+            self._flush_locked(key, warm, start)
+
+        elif len(batch) == 1:
+            timer = threading.Timer(self.batch_window, self._flush, args=(key, warm, start))
+            timer.daemon = True
+            timer.start()
+
+        return run.future
+
+    def _flush (self, key: tuple, warm: WarmLedger, start: datetime) -> None:
+        with self._lock:
+            self._flush_locked(key, warm, start)
+
+    def _flush_locked (self, key: tuple, warm: WarmLedger, start: datetime) -> None:
+        batch = self._batches.pop(key, None)
+        if not batch:
+            return
+
+        self.metrics.count("batches")
+        self.metrics.count("batched", amount=len(batch))
+        try:
+            self._executor.submit(self._run_batch, warm, start, batch)
+
+        except RuntimeError as e:
+            # The service closed while the batch waited
+            for run in batch:
+                run.future.set_exception(e)
+
+    def _run_batch (self, warm: WarmLedger, start: datetime, batch: list[PendingRun]) -> None:
+        # One vectorized pass whose scenarios are the batched runs, paired rather than crossed
+        try:
+            sweep = get_payment_sweep(
+                warm.handler,
+                **{name: np.array([run.parameters[name] for run in batch]) for name in SWEEP_PARAMETERS},
+                start_date=start, keep_trajectories=False, ledger=warm.ledger,
+            )
+
+        except Exception as e:
+            for run in batch:
+                run.future.set_exception(e)
+
+            return
+
+        for index, run in enumerate(batch):
+            run.future.set_result(summary_result(
+                sweep.months[index], sweep.paid_off[index], sweep.final_payment[index], sweep.final_investment[index]
+            ))
+
+class ServiceRequestHandler (BaseHTTPRequestHandler):
+    server: "ServiceServer"
+
+    def reply (self, status: int, payload: dict) -> None:
+        body = json.dumps(payload, separators=(",", ":")).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET (self) -> None:
+        if self.path == "/health":
+            self.reply(200, {"status": "ok"})
+
+        elif self.path == "/metrics":
+            metrics = self.server.service.metrics.snapshot()
+            metrics["cache"] = dc.asdict(self.server.service.cache.stats)
+            metrics["ledgers"] = len(self.server.service.ledgers.ledgers)
+            self.reply(200, metrics)
+
+        else:
+            self.reply(404, {"error": f"unknown path {self.path}"})
+
+    def do_POST (self) -> None:
+        kind = self.path.strip("/")
+        if kind not in tuple(RequestKind):
+            self.reply(404, {"error": f"unknown path {self.path}"})
+            return
+
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            payload = json.loads(self.rfile.read(length) or b"{}")
+            result = self.server.service.request(kind, payload, timeout=self.server.timeout_seconds)
+
+        except ServiceBusy as e:
+            self.reply(503, {"error": str(e)})
+
+        except TimeoutError:
+            self.reply(504, {"error": "simulation timed out"})
+
+        except ValueError as e:
+            self.reply(400, {"error": str(e)})
+
+        except Exception as e:
+            logger.exception("%s request failed", kind)
+            self.reply(500, {"error": str(e)})
+
+        else:
+            self.reply(200, result)
+
+    def log_message (self, format: str, *args) -> None:
+        logger.debug(format, *args)
+
+class ServiceServer (ThreadingHTTPServer):
+    daemon_threads = True
+    # Bursts of clients are what batching feeds on, so the listen backlog is sized for them
+    request_queue_size = 128
+
+    def __init__ (
+        self, service: SimulationService, host: str = SERVICE_HOST, port: int = SERVICE_PORT,
+        timeout_seconds: float = REQUEST_TIMEOUT_SECONDS,
+    ) -> None:
+        super().__init__((host, port), ServiceRequestHandler)
+        self.service = service
+        self.timeout_seconds = timeout_seconds
+
+    @property
+    def url (self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+def start_service (
+    service: SimulationService, host: str = SERVICE_HOST, port: int = SERVICE_PORT
+) -> ServiceServer:
+    # Serves on a background thread, as tests and embedding tools need; port 0 picks a free port
+    server = ServiceServer(service, host, port)
+    threading.Thread(target=server.serve_forever, name="simulation-service", daemon=True).start()
+
+    return server
@@ -1,39 +1,180 @@
+import sys
 import pprint
-import matplotlib.pyplot as plt
+import numpy as np
+from enum import StrEnum
 from datetime import datetime
-from dateutil.relativedelta import relativedelta
+from typing import TYPE_CHECKING
+from collections.abc import Iterator, Mapping
 
 import config
-from structs.balance import Balance
+import instrumentation
+from structs.balance import SpreadType
 from structs.payment import PaymentStatus
+from structs.calendar import PERIODIC_SPREADS, SimulationCalendar, default_start_date
+from structs.trajectory import PaymentTrajectory
 from balance_handler import BalanceHandler
+from structs.schedule import CashFlowLedger
+from cache import SimulationCache, cache_key
+from fast_forward import FastForwardSimulation, fast_forward
+from portfolio import PortfolioLedger, PortfolioSimulation, simulate_portfolios
+from solver import GoalMetric, GoalParameter, GoalSolution, solve_goal
+from monte_carlo import MonteCarloAggregate, RateModel, run_monte_carlo
+from vectorized import (
+    ScenarioSweep, payment_status_list, scenario_grid, simulate_cash_flows, simulate_scenarios,
+)
 
+# matplotlib is only imported by the plotting functions, headless callers never load it
+if TYPE_CHECKING:
+    from matplotlib.figure import Figure
 
-def get_payment_status_list (
-    handler: BalanceHandler, payment_size: float, investment_size: float, *,
-    initial_payment: float = 0, profit_tax: float = 0.0,
-    investment_yearly_percentage: float = 0,
-) -> list[PaymentStatus]:
-    monthly_balances = handler.df[handler.monthly_balances_flag]
-    yearly_balances = handler.df[handler.yearly_balances_flag]
-    inactive_monthly_balances = handler.df[handler.inactive_monthly_balances_flag]
-    inactive_yearly_balances = handler.df[handler.inactive_yearly_balances_flag]
 
-    payment_status = PaymentStatus(
+class SimulationEngine (StrEnum):
+    LOOP = "loop"
+    VECTORIZED = "vectorized"
+    FAST_FORWARD = "fast_forward"
+
+def get_initial_payment_status (
+    handler: BalanceHandler, payment_size: float, investment_size: float, *,
+    initial_payment: float = 0, ledger: CashFlowLedger | None = None,
+) -> PaymentStatus:
+    return PaymentStatus(
         payment_size=payment_size - initial_payment,
         investment_size=investment_size - initial_payment,
-        monthly_balances=[Balance(**row) for row in monthly_balances.to_dict(orient="records")],
-        yearly_balances=[Balance(**row) for row in yearly_balances.to_dict(orient="records")],
-        inactive_monthly_balances=[Balance(**row) for row in inactive_monthly_balances.to_dict(orient="records")],
-        inactive_yearly_balances=[Balance(**row) for row in inactive_yearly_balances.to_dict(orient="records")],
+        ledger=ledger if ledger is not None else CashFlowLedger.from_handler(handler),
     )
 
-    simulation = [payment_status.copy()]
+def get_payment_sweep (
+    handler: BalanceHandler, payment_size: np.ndarray | float, investment_size: np.ndarray | float, *,
+    initial_payment: np.ndarray | float = 0, profit_tax: np.ndarray | float = 0.0,
+    investment_yearly_percentage: np.ndarray | float = 0, start_date: datetime | None = None,
+    grid: bool = False, keep_trajectories: bool = True, ledger: CashFlowLedger | None = None,
+) -> ScenarioSweep:
+    parameters = {
+        "payment_size": payment_size,
+        "investment_size": investment_size,
+        "initial_payment": initial_payment,
+        "profit_tax": profit_tax,
+        "investment_yearly_percentage": investment_yearly_percentage,
+    }
+
+    if grid:
+        parameters = scenario_grid(**parameters)
+
+    ledger = ledger if ledger is not None else CashFlowLedger.from_handler(handler)
+    with instrumentation.phase("simulate.sweep") as phase:
+        sweep = simulate_scenarios(
+            ledger, **parameters,
+            start_date=start_date,
+            keep_trajectories=keep_trajectories,
+        )
+        phase.iterations = int(sweep.months.sum())
 
-    month_it = 0
-    year_it = 0
-    curr_date = datetime.now()
+    return sweep
+
+def get_portfolio_simulation (
+    portfolios: PortfolioLedger | Mapping[str, BalanceHandler],
+    payment_size: np.ndarray | float, investment_size: np.ndarray | float, *,
+    initial_payment: np.ndarray | float = 0, profit_tax: np.ndarray | float = 0.0,
+    investment_yearly_percentage: np.ndarray | float = 0, start_date: datetime | None = None,
+    keep_trajectories: bool = True, keep_breakdown: bool = False, max_months: int | None = None,
+) -> PortfolioSimulation:
+    # Every portfolio in one batched pass instead of one handler and simulation per portfolio;
+    # array parameters follow the order of the portfolio ledger
+    ledger = portfolios if isinstance(portfolios, PortfolioLedger) else PortfolioLedger.from_handlers(portfolios)
+    with instrumentation.phase("simulate.portfolios") as phase:
+        simulation = simulate_portfolios(
+            ledger, payment_size, investment_size,
+            initial_payment=initial_payment,
+            profit_tax=profit_tax,
+            investment_yearly_percentage=investment_yearly_percentage,
+            start_date=start_date,
+            keep_trajectories=keep_trajectories,
+            keep_breakdown=keep_breakdown,
+            max_months=max_months,
+        )
+        phase.iterations = int(simulation.sweep.months.sum())
+
+    return simulation
+
+def get_payment_monte_carlo (
+    handler: BalanceHandler, payment_size: float, investment_size: float, *,
+    paths: int, investment_rate: RateModel, payment_rate: RateModel | None = None,
+    initial_payment: float = 0, profit_tax: float = 0.0,
+    investment_yearly_percentage: float = 0, start_date: datetime | None = None,
+    seed: int | None = None, batch_size: int = 4096, max_months: int | None = 1200,
+) -> MonteCarloAggregate:
+    return run_monte_carlo(
+        CashFlowLedger.from_handler(handler), payment_size, investment_size,
+        paths=paths,
+        investment_rate=investment_rate,
+        payment_rate=payment_rate,
+        initial_payment=initial_payment,
+        profit_tax=profit_tax,
+        investment_yearly_percentage=investment_yearly_percentage,
+        start_date=start_date,
+        seed=seed,
+        batch_size=batch_size,
+        max_months=max_months,
+    )
+
+def get_payment_fast_forward (
+    handler: BalanceHandler, payment_size: float, investment_size: float, *,
+    initial_payment: float = 0, profit_tax: float = 0.0,
+    investment_yearly_percentage: float = 0, start_date: datetime | None = None,
+    max_months: int | None = None,
+) -> FastForwardSimulation:
+    # Payoff month and final sizes without per-month points; call to_trajectory() for those
+    return fast_forward(
+        CashFlowLedger.from_handler(handler), payment_size, investment_size,
+        initial_payment=initial_payment,
+        profit_tax=profit_tax,
+        investment_yearly_percentage=investment_yearly_percentage,
+        start_date=start_date,
+        max_months=max_months,
+    )
+
+def get_goal_solution (
+    handler: BalanceHandler, payment_size: float, investment_size: float, *,
+    parameter: GoalParameter | str, metric: GoalMetric | str, target: float,
+    initial_payment: float = 0, profit_tax: float = 0.0,
+    investment_yearly_percentage: float = 0, start_date: datetime | None = None,
+    low: float | None = None, high: float | None = None, guess: float | None = None,
+    tolerance: float | None = None, ledger: CashFlowLedger | None = None,
+) -> GoalSolution:
+    # The ledger is compiled once and every evaluation fast-forwards over it
+    ledger = ledger if ledger is not None else CashFlowLedger.from_handler(handler)
+    with instrumentation.phase("simulate.solve") as phase:
+        solution = solve_goal(
+            ledger, payment_size, investment_size,
+            parameter=parameter,
+            metric=metric,
+            target=target,
+            initial_payment=initial_payment,
+            profit_tax=profit_tax,
+            investment_yearly_percentage=investment_yearly_percentage,
+            start_date=start_date,
+            low=low,
+            high=high,
+            guess=guess,
+            tolerance=tolerance,
+        )
+        phase.iterations = solution.evaluations
+
+    return solution
+
+def iter_payment_status (
+    payment_status: PaymentStatus, *, start_date: datetime | None = None,
+    profit_tax: float = 0.0, investment_yearly_percentage: float = 0, month: int = 0,
+) -> Iterator[PaymentStatus]:
+    # Advances payment_status in place and yields it after every simulated month. A non-zero
+    # month resumes there, with payment_status holding the state left by the month before it.
+    calendar = SimulationCalendar.starting(start_date)
+
+    month_it = month
+    periods = {spread: int(calendar.periods_before(spread, month)) for spread in PERIODIC_SPREADS}
     while payment_status.payment_size > 0:
+        previous_payment_size = payment_status.payment_size
+
         payment_status.payment_size += payment_status.payment_size * config.PAYMENT_INTEREST_RATE
         investment_earnings = (
             payment_status.investment_size * config.INVESTMENT_INTERST_RATE
@@ -43,69 +184,198 @@ def get_payment_status_list (
 
         month_breakdown = payment_status.monthly_breakdown.copy()
 
-        if curr_date.month == 12:
-            month_breakdown += payment_status.yearly_breakdown
-            payment_status.make_yearly_payment(investment_yearly_percentage)
+        due = calendar.due_at(month_it)
+        if due:
+            for spread in due:
+                month_breakdown += payment_status.periodic_breakdowns[spread]
+
+            if SpreadType.YEARLY in due:
+                payment_status.make_yearly_payment(investment_yearly_percentage)
 
-            year_it += 1
-            payment_status.update_curr_year(year_it)
+            for spread in due:
+                periods[spread] += 1
+                payment_status.update_curr_period(spread, periods[spread])
 
         month_breakdown.debit += (investment_earnings + month_breakdown.credit) * profit_tax
         month_breakdown.investment += investment_earnings
 
         payment_status.update_status(month_breakdown)
-        simulation.append(payment_status.copy())
+        yield payment_status
 
-        if simulation[-2].payment_size <= payment_status.payment_size:
+        if previous_payment_size <= payment_status.payment_size:
             break
 
-        curr_date = curr_date + relativedelta(months=1)
         month_it += 1
 
+def trajectory_cache_key (
+    handler: BalanceHandler, payment_size: float, investment_size: float, *,
+    initial_payment: float = 0, profit_tax: float = 0.0,
+    investment_yearly_percentage: float = 0, start_date: datetime,
+    engine: SimulationEngine | str = SimulationEngine.LOOP,
+) -> str:
+    # Only the calendar month of start_date reaches the simulation
+    return cache_key(
+        handler.ledger_hash, "trajectory",
+        payment_size=payment_size,
+        investment_size=investment_size,
+        initial_payment=initial_payment,
+        profit_tax=profit_tax,
+        investment_yearly_percentage=investment_yearly_percentage,
+        start_month=start_date.month,
+        engine=SimulationEngine(engine).value,
+    )
+
+def get_payment_trajectory (
+    handler: BalanceHandler, payment_size: float, investment_size: float, *,
+    initial_payment: float = 0, profit_tax: float = 0.0,
+    investment_yearly_percentage: float = 0, start_date: datetime | None = None,
+    engine: SimulationEngine | str = SimulationEngine.LOOP, ledger: CashFlowLedger | None = None,
+    cache: SimulationCache | None = None,
+) -> PaymentTrajectory:
+    start_date = start_date if start_date is not None else default_start_date()
+    engine = SimulationEngine(engine)
+
+    if cache is not None:
+        key = trajectory_cache_key(
+            handler, payment_size, investment_size,
+            initial_payment=initial_payment,
+            profit_tax=profit_tax,
+            investment_yearly_percentage=investment_yearly_percentage,
+            start_date=start_date,
+            engine=engine,
+        )
+
+        trajectory = cache.get(key)
+        if trajectory is None:
+            trajectory = get_payment_trajectory(
+                handler, payment_size, investment_size,
+                initial_payment=initial_payment,
+                profit_tax=profit_tax,
+                investment_yearly_percentage=investment_yearly_percentage,
+                start_date=start_date,
+                engine=engine,
+                ledger=ledger,
+            ).copy()
+            cache.put(key, trajectory)
+
+        # Callers may append to the trajectory, so the cached one is never handed out
+        return trajectory.copy(start_date=start_date)
+
+    ledger = ledger if ledger is not None else CashFlowLedger.from_handler(handler)
+    with instrumentation.phase(f"simulate.{engine.value}") as phase:
+        if engine is SimulationEngine.FAST_FORWARD:
+            trajectory = fast_forward(
+                ledger, payment_size, investment_size,
+                initial_payment=initial_payment,
+                profit_tax=profit_tax,
+                investment_yearly_percentage=investment_yearly_percentage,
+                start_date=start_date,
+            ).to_trajectory()
+
+        elif engine is SimulationEngine.VECTORIZED:
+            trajectory = simulate_cash_flows(
+                ledger, payment_size, investment_size,
+                initial_payment=initial_payment,
+                profit_tax=profit_tax,
+                investment_yearly_percentage=investment_yearly_percentage,
+                start_date=start_date,
+            )
+
+        else:
+            payment_status = get_initial_payment_status(
+                handler, payment_size, investment_size, initial_payment=initial_payment, ledger=ledger
+            )
+
+            trajectory = PaymentTrajectory(start_date=start_date)
+            trajectory.append_status(payment_status)
+            for status in iter_payment_status(
+                payment_status, start_date=start_date, profit_tax=profit_tax,
+                investment_yearly_percentage=investment_yearly_percentage,
+            ):
+                trajectory.append_status(status)
+
+        phase.iterations = len(trajectory) - 1
+
+    return trajectory
+
+def get_payment_status_list (
+    handler: BalanceHandler, payment_size: float, investment_size: float, *,
+    initial_payment: float = 0, profit_tax: float = 0.0,
+    investment_yearly_percentage: float = 0, start_date: datetime | None = None,
+    engine: SimulationEngine | str = SimulationEngine.LOOP, ledger: CashFlowLedger | None = None,
+) -> list[PaymentStatus]:
+    # Legacy output: a full PaymentStatus copy per month. Prefer get_payment_trajectory.
+    start_date = start_date if start_date is not None else default_start_date()
+    ledger = ledger if ledger is not None else CashFlowLedger.from_handler(handler)
+
+    engine = SimulationEngine(engine)
+    if engine is SimulationEngine.FAST_FORWARD:
+        trajectory = fast_forward(
+            ledger, payment_size, investment_size,
+            initial_payment=initial_payment,
+            profit_tax=profit_tax,
+            investment_yearly_percentage=investment_yearly_percentage,
+            start_date=start_date,
+        ).to_trajectory()
+
+        return payment_status_list(trajectory, ledger)
+
+    elif engine is SimulationEngine.VECTORIZED:
+        trajectory = simulate_cash_flows(
+            ledger, payment_size, investment_size,
+            initial_payment=initial_payment,
+            profit_tax=profit_tax,
+            investment_yearly_percentage=investment_yearly_percentage,
+            start_date=start_date,
+        )
+
+        return payment_status_list(trajectory, ledger)
+
+    payment_status = get_initial_payment_status(
+        handler, payment_size, investment_size, initial_payment=initial_payment, ledger=ledger
+    )
+
+    with instrumentation.phase("simulate.status_list") as phase:
+        simulation = [payment_status.copy()]
+        for status in iter_payment_status(
+            payment_status, start_date=start_date, profit_tax=profit_tax,
+            investment_yearly_percentage=investment_yearly_percentage,
+        ):
+            simulation.append(status.copy())
+
+        phase.iterations = len(simulation) - 1
+
     return simulation
 
 def get_payment_simulation_plot (
     handler: BalanceHandler, payment_size: float, investment_size: float, *,
     initial_payment: float = 0, profit_tax: float = 0.0,
     investment_yearly_percentage: float = 0,
-) -> plt.Figure:
-    payment_status = get_payment_status_list(
+    engine: SimulationEngine | str = SimulationEngine.LOOP, cache: SimulationCache | None = None,
+) -> "Figure":
+    trajectory = get_payment_trajectory(
         handler, payment_size, investment_size,
         initial_payment=initial_payment,
         profit_tax=profit_tax,
         investment_yearly_percentage=investment_yearly_percentage,
+        engine=engine,
+        cache=cache,
     )
 
-    # pp = pprint.PrettyPrinter(indent=2)
-    # # Convert each payment status to a dictionary for easier reading
-    # pretty_list = [s.__dict__ for s in payment_status]
-    # pp.pprint(pretty_list)
-
-    months = list(range(len(payment_status)))
-    payments = [s.payment_size for s in payment_status]
-    investments = [s.investment_size for s in payment_status]
-    net_credits = [s.total_breakdown.extra_credit for s in payment_status]
-    fig, ax = plt.subplots(figsize=(10, 6))
-    ax.plot(months, payments, label="Pagamento", marker='o')
-    ax.plot(months, investments, label="Investimento", marker='o')
-    ax.plot(months, net_credits, label="Crédito Líquido", marker='o', linestyle='--')
-    ax.set_xlabel("Mês")
-    ax.set_ylabel("Valor")
-    ax.set_title("Evolução do Pagamento, Investimento e Crédito Líquido ao Longo do Tempo")
-    ax.legend()
-    ax.grid(True)
-    fig.tight_layout()
+    return plot_payment_trajectory(trajectory)
+
+def plot_payment_trajectory (trajectory: PaymentTrajectory) -> "Figure":
+    import matplotlib.pyplot as plt
+    from plotting import TrajectoryPlot
+
+    with instrumentation.phase("simulate.plot"):
+        fig = plt.figure(figsize=(10, 6))
+        TrajectoryPlot(fig).set_trajectory(trajectory)
 
     return fig
 
 if __name__ == "__main__":
-    handler = BalanceHandler()
-    fig = get_payment_simulation_plot(
-        handler, config.DEBIT_SIZE, config.INVESTMENT_SIZE,
-        initial_payment=0.0,
-        profit_tax=0.0,
-        investment_yearly_percentage=0.0,
-    )
-    fig.show()
+    # Kept for `python simulate.py`; the CLI in cli.py starts faster
+    from cli import main
 
-    input()
+    sys.exit(main())
@@ -0,0 +1,131 @@
+import threading
+from PyQt5.QtCore import QObject, QThread, pyqtSignal, pyqtSlot
+
+import instrumentation
+from structs.payment import PaymentStatus
+from structs.trajectory import PaymentTrajectory
+from incremental import IncrementalSimulation, LedgerSnapshot
+
+
+# Months between two progress signals, so long runs do not flood the UI event loop
+PROGRESS_INTERVAL = 12
+
+
+class SimulationWorker (QObject):
+    progress = pyqtSignal(int, float)
+    finished = pyqtSignal(object)
+    failed = pyqtSignal(str)
+    cancelled = pyqtSignal()
+
+    def __init__ (self, simulation: IncrementalSimulation, snapshot: LedgerSnapshot) -> None:
+        super().__init__()
+
+        # The ledger is compiled on the UI thread, so the worker never touches the handler;
+        # the simulation resumes from its last checkpoint before the edits in the snapshot
+        self.simulation = simulation
+        self.snapshot = snapshot
+
+        self._stop = threading.Event()
+
+    def cancel (self) -> None:
+        self._stop.set()
+
+    def _on_month (self, month: int, payment_status: PaymentStatus) -> None:
+        if month % PROGRESS_INTERVAL == 0:
+            self.progress.emit(month, payment_status.payment_size)
+
+    @pyqtSlot()
+    def run (self) -> None:
+        try:
+            with instrumentation.phase("worker.simulate") as phase:
+                trajectory = self.simulation.resume(self.snapshot, stop=self._stop, progress=self._on_month)
+                if trajectory is None:
+                    self.cancelled.emit()
+                    return
+
+                phase.iterations = len(trajectory) - 1
+
+            self.progress.emit(len(trajectory) - 1, float(trajectory.payment_size[-1]))
+            self.finished.emit(trajectory)
+
+        except Exception as e:
+            self.failed.emit(str(e))
+
+class SimulationController (QObject):
+    # Owns at most one live run: starting another cancels it, and signals still queued
+    # from a replaced worker are dropped, so only the latest result reaches the UI.
+    progress = pyqtSignal(int, float)
+    finished = pyqtSignal(object)
+    failed = pyqtSignal(str)
+    running_changed = pyqtSignal(bool)
+
+    def __init__ (self, parent: QObject | None = None) -> None:
+        super().__init__(parent)
+
+        self._worker: SimulationWorker | None = None
+        # Replaced threads are kept alive until they finish winding down
+        self._threads: set[QThread] = set()
+
+    @property
+    def running (self) -> bool:
+        return self._worker is not None
+
+    def start (self, worker: SimulationWorker) -> None:
+        self._discard_worker()
+
+        thread = QThread(self)
+        worker.moveToThread(thread)
+        thread.started.connect(worker.run)
+
+        worker.progress.connect(self._on_progress)
+        worker.finished.connect(self._on_finished)
+        worker.failed.connect(self._on_failed)
+        for signal in (worker.finished, worker.failed, worker.cancelled):
+            signal.connect(thread.quit)
+
+        thread.finished.connect(worker.deleteLater)
+        thread.finished.connect(lambda thread=thread: self._threads.discard(thread))
+        thread.finished.connect(thread.deleteLater)
+
+        self._worker = worker
+        self._threads.add(thread)
+        thread.start()
+
+        self.running_changed.emit(True)
+
+    def cancel (self) -> None:
+        if self._discard_worker():
+            self.running_changed.emit(False)
+
+    def shutdown (self) -> None:
+        self._discard_worker()
+        for thread in list(self._threads):
+            thread.wait()
+
+    def _discard_worker (self) -> bool:
+        if self._worker is None:
+            return False
+
+        self._worker.cancel()
+        self._worker = None
+
+        return True
+
+    @pyqtSlot(int, float)
+    def _on_progress (self, months: int, payment_size: float) -> None:
+        if self.sender() is self._worker:
+            self.progress.emit(months, payment_size)
+
+    @pyqtSlot(object)
+    def _on_finished (self, trajectory: PaymentTrajectory) -> None:
+        if self.sender() is self._worker:
+            self._worker = None
+            self.running_changed.emit(False)
+            self.finished.emit(trajectory)
+
+    @pyqtSlot(str)
+    def _on_failed (self, message: str) -> None:
+        if self.sender() is self._worker:
+            self._worker = None
+            self.running_changed.emit(False)
+            self.failed.emit(message)
@@ -0,0 +1,258 @@
+import numpy as np
+import dataclasses as dc
+from enum import StrEnum
+from datetime import datetime
+
+from structs.calendar import default_start_date
+from structs.schedule import CashFlowLedger
+from fast_forward import FastForwardSimulation, fast_forward
+
+
+# Doublings of the upper bound tried before giving up on an unbounded parameter
+MAX_EXPANSIONS = 40
+DEFAULT_MAX_EVALUATIONS = 64
+
+
+class GoalParameter (StrEnum):
+    PAYMENT_SIZE = "payment_size"
+    INVESTMENT_SIZE = "investment_size"
+    INITIAL_PAYMENT = "initial_payment"
+    INVESTMENT_YEARLY_PERCENTAGE = "investment_yearly_percentage"
+
+class GoalMetric (StrEnum):
+    # Paid off within `target` months
+    PAYOFF_MONTH = "payoff_month"
+    # Investment of at least `target` when the simulation ends
+    FINAL_INVESTMENT = "final_investment"
+
+# Money is solved to the cent, percentages to a hundredth of a percentage point
+DEFAULT_TOLERANCE = {
+    GoalParameter.PAYMENT_SIZE: 0.01,
+    GoalParameter.INVESTMENT_SIZE: 0.01,
+    GoalParameter.INITIAL_PAYMENT: 0.01,
+    GoalParameter.INVESTMENT_YEARLY_PERCENTAGE: 1e-4,
+}
+
+@dc.dataclass(kw_only=True, frozen=True)
+class GoalEvaluation:
+    value: float
+    # Non-positive when the goal is met: payment left at the target month, or investment missing
+    residual: float
+    months: int
+    paid_off: bool
+    final_payment: float
+    final_investment: float
+
+    @property
+    def met (self) -> bool:
+        return self.residual <= 0
+
+@dc.dataclass(kw_only=True)
+class GoalSolution:
+    parameter: GoalParameter
+    metric: GoalMetric
+    target: float
+    # Smallest value of the bracket meeting the goal or, when the goal holds at the bottom of the
+    # bracket and is lost further up, the largest one; None when no value in it meets the goal
+    value: float | None
+    evaluation: GoalEvaluation | None
+    bracket: tuple[float, float]
+    evaluations: int
+    converged: bool
+
+    @property
+    def solved (self) -> bool:
+        return self.value is not None
+
+def default_bracket (
+    parameter: GoalParameter, payment_size: float, investment_size: float
+) -> tuple[float, float, bool]:
+    # (low, high, whether high may keep doubling)
+    if parameter is GoalParameter.INITIAL_PAYMENT:
+        # Paying the whole debt upfront leaves nothing to pay off
+        return 0.0, max(payment_size, 0.0), False
+
+    elif parameter is GoalParameter.INVESTMENT_YEARLY_PERCENTAGE:
+        return 0.0, 1.0, False
+
+    elif parameter is GoalParameter.PAYMENT_SIZE:
+        return 0.0, max(payment_size, 1.0), True
+
+    return 0.0, max(investment_size, 1.0), True
+
+@dc.dataclass(kw_only=True)
+class GoalSolver:
+    # Every evaluation is a fast-forward run over the same compiled ledger
+    ledger: CashFlowLedger
+    parameters: dict[str, float]
+    parameter: GoalParameter
+    metric: GoalMetric
+    target: float
+    start_date: datetime
+    max_evaluations: int = DEFAULT_MAX_EVALUATIONS
+
+    evaluations: int = dc.field(init=False, default=0)
+    _cache: dict[float, GoalEvaluation] = dc.field(init=False, repr=False, default_factory=dict)
+
+    def evaluate (self, value: float) -> GoalEvaluation:
+        if value in self._cache:
+            return self._cache[value]
+
+        self.evaluations += 1
+        payoff = self.metric is GoalMetric.PAYOFF_MONTH
+        simulation: FastForwardSimulation = fast_forward(
+            self.ledger, **{**self.parameters, self.parameter.value: value},
+            start_date=self.start_date,
+            # Whether the debt is paid off by the target month needs nothing past it
+            max_months=int(self.target) if payoff else None,
+        )
+
+        evaluation = self._cache[value] = GoalEvaluation(
+            value=value,
+            residual=(
+                simulation.payment_size if payoff else self.target - simulation.investment_size
+            ),
+            months=simulation.months,
+            paid_off=simulation.paid_off,
+            final_payment=simulation.payment_size,
+            final_investment=simulation.investment_size,
+        )
+
+        return evaluation
+
+    @property
+    def exhausted (self) -> bool:
+        return self.evaluations >= self.max_evaluations
+
+    def bracket (
+        self, low: float, high: float, expandable: bool, tolerance: float, guess: float | None = None,
+    ) -> tuple[GoalEvaluation, GoalEvaluation] | None:
+        # A pair of values on either side of the goal, or None when both ends of the bracket agree.
+        # A guess, such as the previous solution, is widened geometrically until it brackets the
+        # goal, so a solve after a small edit starts next to the answer.
+        if guess is not None and low < guess < high:
+            step = tolerance * 4
+            while not self.exhausted:
+                near_low = self.evaluate(max(guess - step, low))
+                near_high = self.evaluate(min(guess + step, high))
+                if near_low.met != near_high.met:
+                    return near_low, near_high
+
+                if near_low.value == low and near_high.value == high:
+                    break
+
+                step *= 16
+
+        lower, upper = self.evaluate(low), self.evaluate(high)
+        # The upper bound of an unbounded parameter doubles until the goal changes
+        while expandable and lower.met == upper.met and not self.exhausted:
+            if upper.value > high * 2 ** MAX_EXPANSIONS:
+                break
+
+            lower, upper = upper, self.evaluate(upper.value * 2)
+
+        return (lower, upper) if lower.met != upper.met else None
+
+    def refine (
+        self, lower: GoalEvaluation, upper: GoalEvaluation, tolerance: float
+    ) -> tuple[GoalEvaluation, GoalEvaluation]:
+        # Illinois false position on the residual, falling back to bisection whenever a step fails
+        # to halve the bracket, until it is narrower than the tolerance
+        lower_residual, upper_residual = lower.residual, upper.residual
+        bisect = False
+        moved_lower = None
+        while upper.value - lower.value > tolerance and not self.exhausted:
+            width = upper.value - lower.value
+            with np.errstate(divide="ignore", invalid="ignore"):
+                secant = lower.value - lower_residual * width / (upper_residual - lower_residual)
+
+            value = secant if not bisect and np.isfinite(secant) else lower.value + width / 2
+            # Stay strictly inside, so every step narrows the bracket
+            value = min(max(value, lower.value + tolerance / 4), upper.value - tolerance / 4)
+
+            evaluation = self.evaluate(float(value))
+            # An end kept twice in a row has its residual halved, so the next step leaves it
+            if evaluation.met == lower.met:
+                lower, lower_residual = evaluation, evaluation.residual
+                if moved_lower:
+                    upper_residual /= 2
+
+                moved_lower = True
+
+            else:
+                upper, upper_residual = evaluation, evaluation.residual
+                if moved_lower is False:
+                    lower_residual /= 2
+
+                moved_lower = False
+
+            bisect = upper.value - lower.value > width / 2
+
+        return lower, upper
+
+def solve_goal (
+    ledger: CashFlowLedger, payment_size: float, investment_size: float, *,
+    parameter: GoalParameter | str, metric: GoalMetric | str, target: float,
+    initial_payment: float = 0, profit_tax: float = 0.0,
+    investment_yearly_percentage: float = 0, start_date: datetime | None = None,
+    low: float | None = None, high: float | None = None, guess: float | None = None,
+    tolerance: float | None = None, max_evaluations: int = DEFAULT_MAX_EVALUATIONS,
+) -> GoalSolution:
+    parameter = GoalParameter(parameter)
+    metric = GoalMetric(metric)
+    if metric is GoalMetric.PAYOFF_MONTH and target < 0:
+        raise ValueError(f"Payoff target must be a non-negative number of months, got {target}")
+
+    default_low, default_high, expandable = default_bracket(parameter, payment_size, investment_size)
+    low = default_low if low is None else low
+    high = default_high if high is None else high
+    # Only the default upper bound of an unbounded parameter is grown
+    expandable = expandable and high == default_high
+    if not low < high:
+        raise ValueError(f"Empty bracket [{low}, {high}] for {parameter.value}")
+
+    solver = GoalSolver(
+        ledger=ledger,
+        parameters=dict(
+            payment_size=payment_size,
+            investment_size=investment_size,
+            initial_payment=initial_payment,
+            profit_tax=profit_tax,
+            investment_yearly_percentage=investment_yearly_percentage,
+        ),
+        parameter=parameter,
+        metric=metric,
+        target=target,
+        start_date=start_date if start_date is not None else default_start_date(),
+        max_evaluations=max_evaluations,
+    )
+
+    tolerance = tolerance if tolerance is not None else DEFAULT_TOLERANCE[parameter]
+    pair = solver.bracket(low, high, expandable, tolerance, guess)
+    if pair is None:
+        # The goal is met everywhere in the bracket, or nowhere
+        bottom = solver.evaluate(low)
+        return GoalSolution(
+            parameter=parameter,
+            metric=metric,
+            target=target,
+            value=low if bottom.met else None,
+            evaluation=bottom if bottom.met else None,
+            bracket=(low, high),
+            evaluations=solver.evaluations,
+            converged=bottom.met,
+        )
+
+    lower, upper = solver.refine(*pair, tolerance)
+    best = lower if lower.met else upper
+
+    return GoalSolution(
+        parameter=parameter,
+        metric=metric,
+        target=target,
+        value=best.value,
+        evaluation=best,
+        bracket=(lower.value, upper.value),
+        evaluations=solver.evaluations,
+        converged=upper.value - lower.value <= tolerance,
+    )
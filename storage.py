@@ -0,0 +1,397 @@
+import os
+import struct
+import numpy as np
+import pandas as pd
+import dataclasses as dc
+from pathlib import Path
+from pandas.api.extensions import ExtensionArray, ExtensionDtype, take
+from pandas.api.indexers import check_array_indexer
+from pandas.api.types import is_integer, is_scalar, pandas_dtype
+
+from structs.balance import BalanceType, FrequencyType, SpreadType
+
+
+BALANCE_COLUMNS = (
+    "id", "name", "value", "frequency", "frequency_unit",
+    "spread_type", "expiry", "start_month", "type"
+)
+
+# Columnar file layout, every section 8-byte aligned:
+#   header | value, frequency, expiry, start_month as float64
+#   | frequency_unit, spread_type, type as uint8 codes | id, name offsets as int64
+#   | id, name as NUL-joined UTF-8
+# Version 1 files have no offsets section, their offsets are found from the separators.
+MAGIC = b"BLNC"
+VERSION = 2
+READ_VERSIONS = (1, 2)
+HEADER = struct.Struct("<4sIQQQ")
+
+NUMERIC_COLUMNS = ("value", "frequency", "expiry", "start_month")
+ENUM_COLUMNS = {
+    "frequency_unit": tuple(unit.value for unit in FrequencyType),
+    "spread_type": tuple(spread.value for spread in SpreadType),
+    "type": tuple(balance_type.value for balance_type in BalanceType),
+}
+STRING_COLUMNS = ("id", "name")
+
+
+def empty_ledger () -> pd.DataFrame:
+    return pd.DataFrame(columns=list(BALANCE_COLUMNS))
+
+def aligned (size: int) -> int:
+    return -(-size // 8) * 8
+
+def write_atomic (path: Path, chunks: list[bytes]) -> None:
+    # A reader keeps its mapping of the old file until it drops it
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f".{path.name}.tmp")
+    with open(tmp_path, "wb") as file:
+        for chunk in chunks:
+            file.write(chunk)
+
+        file.flush()
+        os.fsync(file.fileno())
+
+    os.replace(tmp_path, path)
+
+def string_offsets (data: np.ndarray, rows: int) -> np.ndarray:
+    # Start of every NUL-joined string, plus the end of the last one past its missing separator
+    if rows == 0:
+        return np.zeros(1, dtype=np.int64)
+
+    separators = np.flatnonzero(data == 0)
+    if len(separators) != rows - 1:
+        raise ValueError("Balance strings cannot contain NUL characters")
+
+    return np.concatenate(([0], separators + 1, [len(data) + 1])).astype(np.int64)
+
+class EncodedStringDtype (ExtensionDtype):
+    name = "encoded_string"
+    type = str
+    kind = "O"
+    na_value = np.nan
+
+    @classmethod
+    def construct_array_type (cls) -> "type[EncodedStringArray]":
+        return EncodedStringArray
+
+    def _get_common_dtype (self, dtypes: list) -> ExtensionDtype | None:
+        # Rows appended to a mapped ledger are encoded too, rather than decoding the ledger
+        if all(isinstance(dtype, (EncodedStringDtype, pd.StringDtype)) for dtype in dtypes):
+            return self
+
+        return None
+
+class EncodedStringArray (ExtensionArray):
+    # Strings over a UTF-8 buffer: string i is data[starts[i]:ends[i]] and a negative start
+    # marks a missing one. Strings are decoded when read, and writes append to a new buffer
+    # instead of changing this one, so copies and mapped files stay valid.
+    def __init__ (self, data: np.ndarray, starts: np.ndarray, ends: np.ndarray) -> None:
+        self._data = data
+        self._starts = starts
+        self._ends = ends
+        # Every string decoded, once something needs them all
+        self._strings: np.ndarray | None = None
+
+    @classmethod
+    def from_offsets (cls, data: np.ndarray, offsets: np.ndarray) -> "EncodedStringArray":
+        return cls(data, offsets[:-1], offsets[1:] - 1)
+
+    @classmethod
+    def _from_sequence (cls, scalars, *, dtype=None, copy: bool = False) -> "EncodedStringArray":
+        values = np.asarray(scalars, dtype=object)
+        missing = pd.isna(values)
+        strings = np.where(missing, "", values).tolist()
+        try:
+            text = "\0".join(strings)
+
+        except TypeError:
+            text = "\0".join(map(str, strings))
+
+        data = np.frombuffer(text.encode(), dtype=np.uint8)
+        array = cls.from_offsets(data, string_offsets(data, len(strings)))
+        array._starts[missing] = -1
+
+        return array
+
+    @classmethod
+    def _from_factorized (cls, values: np.ndarray, original: "EncodedStringArray") -> "EncodedStringArray":
+        return cls._from_sequence(values)
+
+    @property
+    def dtype (self) -> EncodedStringDtype:
+        return EncodedStringDtype()
+
+    @property
+    def nbytes (self) -> int:
+        return self._data.nbytes + self._starts.nbytes + self._ends.nbytes
+
+    def __len__ (self) -> int:
+        return len(self._starts)
+
+    def __getitem__ (self, item):
+        if is_integer(item):
+            if self._strings is not None:
+                return self._strings[item]
+
+            start = self._starts[item]
+            return str(self._data[start:self._ends[item]], "utf-8") if start >= 0 else np.nan
+
+        item = check_array_indexer(self, item)
+        array = type(self)(self._data, self._starts[item], self._ends[item])
+        if self._strings is not None:
+            array._strings = self._strings[item]
+
+        return array
+
+    def __setitem__ (self, key, value) -> None:
+        key = check_array_indexer(self, key)
+        rows = np.atleast_1d(np.arange(len(self))[key])
+        if not isinstance(value, EncodedStringArray):
+            value = type(self)._from_sequence([value] * len(rows) if is_scalar(value) else list(value))
+
+        if len(rows) == len(self) and np.array_equal(rows, np.arange(len(self))):
+            # Written as a whole, as pandas does when it puts an edited column back
+            self._data, self._starts, self._ends = value._data, value._starts, value._ends
+            self._strings = value._strings
+            return
+
+        shift = len(self._data)
+        self._data = np.concatenate((self._data, value._data))
+        self._starts = self._starts.copy()
+        self._ends = self._ends.copy()
+        self._starts[rows] = np.where(value._starts < 0, -1, value._starts + shift)
+        self._ends[rows] = value._ends + shift
+
+        if self._strings is not None:
+            self._strings = self._strings.copy()
+            self._strings[rows] = value.decoded()
+
+    def __iter__ (self):
+        return iter(self.decoded())
+
+    def __eq__ (self, other):
+        if isinstance(other, (pd.Series, pd.Index, pd.DataFrame)):
+            return NotImplemented
+
+        return self.decoded() == (other if is_scalar(other) else np.asarray(other, dtype=object))
+
+    def __array__ (self, dtype=None, copy=None) -> np.ndarray:
+        # A copy unless told otherwise, so callers writing to it leave the decoded strings alone
+        return self.decoded().astype(dtype if dtype is not None else object, copy=copy is not False)
+
+    def decoded (self) -> np.ndarray:
+        if self._strings is None:
+            present = self._starts >= 0
+            data, offsets = self._joined(present)
+
+            self._strings = np.full(len(self), np.nan, dtype=object)
+            if len(offsets) > 1:
+                self._strings[present] = str(data, "utf-8").split("\0")
+
+        return self._strings
+
+    def encoded (self) -> tuple[np.ndarray, np.ndarray]:
+        # NUL-joined bytes and offsets, as saved
+        if self.isna().any():
+            raise ValueError("Balance strings cannot be missing")
+
+        return self._joined(slice(None))
+
+    def _joined (self, rows: np.ndarray | slice) -> tuple[np.ndarray, np.ndarray]:
+        # The strings at rows NUL-joined, gathered byte by byte without decoding any of them;
+        # strings still joined as they were saved are sliced straight from the buffer
+        starts, ends = self._starts[rows], self._ends[rows]
+        if len(starts) == 0:
+            return self._data[:0], np.zeros(1, dtype=np.int64)
+
+        if np.array_equal(starts[1:], ends[:-1] + 1):
+            return self._data[starts[0]:ends[-1]], np.append(starts, ends[-1] + 1) - starts[0]
+
+        lengths = ends - starts
+        offsets = np.concatenate(([0], np.cumsum(lengths + 1)))
+        byte = np.arange(lengths.sum())
+        row = np.repeat(np.arange(len(starts)), lengths)
+
+        joined = np.zeros(offsets[-1] - 1, dtype=np.uint8)
+        joined[byte + row] = self._data[byte + (starts - offsets[:-1] + np.arange(len(starts)))[row]]
+
+        return joined, offsets
+
+    def tolist (self) -> list:
+        return self.decoded().tolist()
+
+    def isna (self) -> np.ndarray:
+        return self._starts < 0
+
+    def astype (self, dtype, copy: bool = True):
+        dtype = pandas_dtype(dtype)
+        if isinstance(dtype, EncodedStringDtype):
+            return self.copy() if copy else self
+
+        if isinstance(dtype, ExtensionDtype):
+            return dtype.construct_array_type()._from_sequence(self.decoded(), dtype=dtype)
+
+        return self.decoded().astype(dtype, copy=copy)
+
+    def take (self, indices, *, allow_fill: bool = False, fill_value=None) -> "EncodedStringArray":
+        if allow_fill and not pd.isna(fill_value):
+            return type(self)._from_sequence(take(self.decoded(), indices, allow_fill=True, fill_value=fill_value))
+
+        array = type(self)(
+            self._data,
+            take(self._starts, indices, allow_fill=allow_fill, fill_value=-1),
+            take(self._ends, indices, allow_fill=allow_fill, fill_value=-1),
+        )
+        if self._strings is not None:
+            array._strings = take(self._strings, indices, allow_fill=allow_fill, fill_value=np.nan)
+
+        return array
+
+    def copy (self) -> "EncodedStringArray":
+        # Buffers are never written in place, so a copy can share them
+        array = type(self)(self._data, self._starts, self._ends)
+        array._strings = self._strings
+
+        return array
+
+    @classmethod
+    def _concat_same_type (cls, to_concat) -> "EncodedStringArray":
+        to_concat = list(to_concat)
+        if all(array._data is to_concat[0]._data for array in to_concat):
+            # Slices of one ledger concatenated back together keep pointing into its buffer
+            shifts = np.zeros(len(to_concat), dtype=np.int64)
+            data = to_concat[0]._data
+
+        else:
+            shifts = np.cumsum([0] + [len(array._data) for array in to_concat[:-1]])
+            data = np.concatenate([array._data for array in to_concat])
+
+        concatenated = cls(
+            data,
+            np.concatenate([
+                np.where(array._starts < 0, -1, array._starts + shift) for array, shift in zip(to_concat, shifts)
+            ]),
+            np.concatenate([array._ends + shift for array, shift in zip(to_concat, shifts)]),
+        )
+        if all(array._strings is not None for array in to_concat):
+            concatenated._strings = np.concatenate([array._strings for array in to_concat])
+
+        return concatenated
+
+class StorageBackend:
+    path: Path
+
+    def load (self) -> pd.DataFrame | None:
+        raise NotImplementedError
+
+    def save (self, df: pd.DataFrame) -> None:
+        raise NotImplementedError
+
+@dc.dataclass(kw_only=True)
+class CsvStorage (StorageBackend):
+    path: Path
+
+    def __post_init__ (self) -> None:
+        self.path = Path(self.path)
+
+    def load (self) -> pd.DataFrame | None:
+        try:
+            return pd.read_csv(self.path, dtype={"id": str, "name": str})
+
+        except FileNotFoundError:
+            return None
+
+    def save (self, df: pd.DataFrame) -> None:
+        write_atomic(self.path, [df.to_csv(index=False).encode()])
+
+@dc.dataclass(kw_only=True)
+class ColumnarStorage (StorageBackend):
+    path: Path
+    # Imported on first load when the columnar file does not exist yet
+    legacy_csv: Path | None = None
+
+    def __post_init__ (self) -> None:
+        self.path = Path(self.path)
+        if self.legacy_csv is None:
+            self.legacy_csv = self.path.with_suffix(".csv")
+
+    def load (self) -> pd.DataFrame | None:
+        if not self.path.exists():
+            return CsvStorage(path=self.legacy_csv).load() if self.legacy_csv.exists() else None
+
+        # Copy-on-write mapping: pages are shared with the file until the frame is edited, and
+        # no column is decoded row by row to open it
+        buffer = np.memmap(self.path, dtype=np.uint8, mode="c")
+        magic, version, rows, id_size, name_size = HEADER.unpack(buffer[:HEADER.size].tobytes())
+        if magic != MAGIC or version not in READ_VERSIONS:
+            raise ValueError(f"{self.path} is not a balance ledger of version {', '.join(map(str, READ_VERSIONS))}")
+
+        columns = {}
+        offset = aligned(HEADER.size)
+        for column in NUMERIC_COLUMNS:
+            columns[column] = buffer[offset:offset + 8 * rows].view(np.float64)
+            offset += 8 * rows
+
+        for column, values in ENUM_COLUMNS.items():
+            # Fewer than 128 members, so the codes read the same as int8
+            columns[column] = pd.Categorical.from_codes(
+                buffer[offset:offset + rows].view(np.int8), categories=list(values)
+            )
+            offset = offset + rows
+
+        offset = aligned(offset)
+        offsets = {}
+        if version >= 2:
+            for column in STRING_COLUMNS:
+                offsets[column] = buffer[offset:offset + 8 * (rows + 1)].view(np.int64)
+                offset += 8 * (rows + 1)
+
+        for column, size in zip(STRING_COLUMNS, (id_size, name_size)):
+            data = np.asarray(buffer[offset:offset + size])
+            columns[column] = EncodedStringArray.from_offsets(
+                data, offsets[column] if column in offsets else string_offsets(data, rows)
+            )
+            offset = aligned(offset + size)
+
+        return pd.DataFrame({column: columns[column] for column in BALANCE_COLUMNS}, copy=False)
+
+    def save (self, df: pd.DataFrame) -> None:
+        rows = len(df)
+        chunks = []
+
+        for column in NUMERIC_COLUMNS:
+            chunks.append(
+                pd.to_numeric(df[column], errors="coerce").to_numpy(dtype=np.float64).tobytes()
+            )
+
+        codes = []
+        for column, values in ENUM_COLUMNS.items():
+            column_codes = pd.Categorical(df[column], categories=values).codes
+            if (column_codes < 0).any():
+                raise ValueError(f"Unknown {column} value in balance ledger")
+
+            codes.append(column_codes.astype(np.uint8).tobytes())
+
+        chunks.append(b"".join(codes).ljust(aligned(3 * rows), b"\0"))
+
+        strings = []
+        for column in STRING_COLUMNS:
+            array = df[column].array
+            if not isinstance(array, EncodedStringArray):
+                array = EncodedStringArray._from_sequence(df[column].astype(str))
+
+            strings.append(array.encoded())
+
+        chunks.extend(offsets.astype(np.int64).tobytes() for _, offsets in strings)
+        chunks.extend(text.tobytes().ljust(aligned(len(text)), b"\0") for text, _ in strings)
+        header = HEADER.pack(MAGIC, VERSION, rows, len(strings[0][0]), len(strings[1][0]))
+
+        write_atomic(self.path, [header.ljust(aligned(HEADER.size), b"\0"), *chunks])
+
+def storage_for (path: str | os.PathLike) -> StorageBackend:
+    path = Path(path)
+    if path.suffix.lower() == ".csv":
+        return CsvStorage(path=path)
+
+    return ColumnarStorage(path=path)
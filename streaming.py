@@ -0,0 +1,107 @@
+import dataclasses as dc
+from enum import StrEnum
+from datetime import datetime
+from collections.abc import Callable, Iterable, Iterator
+
+from structs.payment import PaymentStatus
+from structs.trajectory import TrajectoryPoint
+from structs.calendar import default_start_date
+from structs.schedule import CashFlowLedger
+from balance_handler import BalanceHandler
+from simulate import get_initial_payment_status, iter_payment_status
+
+
+# Checked on every month before it is yielded; True ends the stream after that month
+StopPredicate = Callable[[TrajectoryPoint], bool]
+
+
+class StopReason (StrEnum):
+    PAID_OFF = "paid_off"
+    # The payment did not shrink over the last month, so it never would
+    STALLED = "stalled"
+    PREDICATE = "predicate"
+    # The consumer stopped iterating before the stream ended
+    ABANDONED = "abandoned"
+
+def max_horizon (months: int) -> StopPredicate:
+    return lambda point: point.month >= months
+
+def investment_below (threshold: float) -> StopPredicate:
+    return lambda point: point.investment_size < threshold
+
+def extra_credit_below (threshold: float = 0.0) -> StopPredicate:
+    # Month 0 has no cash flows yet, so it never triggers
+    return lambda point: point.month > 0 and point.total_breakdown.extra_credit < threshold
+
+@dc.dataclass(kw_only=True)
+class PaymentStream:
+    # Months are simulated as they are consumed and only the current one is kept, so memory
+    # stays constant and abandoning the iteration skips every later month. Single use.
+    payment_status: PaymentStatus
+    start_date: datetime
+    profit_tax: float = 0.0
+    investment_yearly_percentage: float = 0
+    stop: tuple[StopPredicate, ...] = ()
+
+    # Last month yielded, why the stream ended and, for StopReason.PREDICATE, which predicate fired
+    month: int = dc.field(init=False, default=-1)
+    reason: StopReason | None = dc.field(init=False, default=None)
+    stopped_by: StopPredicate | None = dc.field(init=False, default=None)
+
+    _started: bool = dc.field(init=False, repr=False, default=False)
+
+    def __iter__ (self) -> Iterator[TrajectoryPoint]:
+        if self._started:
+            raise ValueError("Payment stream was already consumed")
+
+        self._started = True
+        self.reason = StopReason.ABANDONED
+
+        status = self.payment_status
+        if (yield from self._emit(0, status)):
+            return
+
+        months = iter_payment_status(
+            status, start_date=self.start_date, profit_tax=self.profit_tax,
+            investment_yearly_percentage=self.investment_yearly_percentage,
+        )
+        for month, status in enumerate(months, start=1):
+            if (yield from self._emit(month, status)):
+                return
+
+        self.reason = StopReason.STALLED if status.payment_size > 0 else StopReason.PAID_OFF
+
+    def _emit (self, month: int, status: PaymentStatus) -> Iterator[TrajectoryPoint]:
+        # Every month gets a new total_breakdown, so the point can share it
+        point = TrajectoryPoint(
+            month=month,
+            payment_size=status.payment_size,
+            investment_size=status.investment_size,
+            total_breakdown=status.total_breakdown,
+        )
+        self.month = month
+
+        # Predicates run before the yield, so the reason is set even if this is the last month read
+        self.stopped_by = next((predicate for predicate in self.stop if predicate(point)), None)
+        if self.stopped_by is not None:
+            self.reason = StopReason.PREDICATE
+
+        yield point
+        return self.stopped_by is not None
+
+def stream_payment_trajectory (
+    handler: BalanceHandler, payment_size: float, investment_size: float, *,
+    initial_payment: float = 0, profit_tax: float = 0.0,
+    investment_yearly_percentage: float = 0, start_date: datetime | None = None,
+    stop: Iterable[StopPredicate] = (), ledger: CashFlowLedger | None = None,
+) -> PaymentStream:
+    # The payoff and stalled-payment rules always apply; stop predicates can only end it sooner
+    return PaymentStream(
+        payment_status=get_initial_payment_status(
+            handler, payment_size, investment_size, initial_payment=initial_payment, ledger=ledger
+        ),
+        start_date=start_date if start_date is not None else default_start_date(),
+        profit_tax=profit_tax,
+        investment_yearly_percentage=investment_yearly_percentage,
+        stop=tuple(stop),
+    )
@@ -15,13 +15,46 @@ class BalanceType (StrEnum):
     def is_payment (self) -> bool:
         return self is BalanceType.PAYMENT
 
+# New spreads and units go last: stored ledgers encode enums by position
 class SpreadType (StrEnum):
     MONTHLY = "monthly"
     YEARLY = "yearly"
+    QUARTERLY = "quarterly"
+    SEMIANNUAL = "semiannual"
+
+    @property
+    def per_year (self) -> int:
+        return SPREADS_PER_YEAR[self]
+
+    @property
+    def months (self) -> int:
+        # Months between two charges
+        return 12 // self.per_year
 
 class FrequencyType (StrEnum):
     MONTH = "/month"
     YEAR = "/year"
+    WEEK = "/week"
+    QUARTER = "/quarter"
+    HALF_YEAR = "/half-year"
+
+    @property
+    def per_year (self) -> int:
+        return FREQUENCIES_PER_YEAR[self]
+
+SPREADS_PER_YEAR = {
+    SpreadType.MONTHLY: 12,
+    SpreadType.YEARLY: 1,
+    SpreadType.QUARTERLY: 4,
+    SpreadType.SEMIANNUAL: 2,
+}
+FREQUENCIES_PER_YEAR = {
+    FrequencyType.MONTH: 12,
+    FrequencyType.YEAR: 1,
+    FrequencyType.WEEK: 52,
+    FrequencyType.QUARTER: 4,
+    FrequencyType.HALF_YEAR: 2,
+}
 
 @dc.dataclass(kw_only=True)
 class Balance:
@@ -40,7 +73,7 @@ class Balance:
 
     def __post_init__ (self, expiry: int | None, start_month: int | None) -> None:
         self._expiry = expiry if expiry is not None else np.inf
-        self._start_month = self.start_month if start_month is not None else 0
+        self._start_month = start_month if start_month is not None else 0
 
         if isinstance(self.frequency_unit, str):
             self.frequency_unit = FrequencyType(self.frequency_unit)
@@ -66,17 +99,13 @@ class Balance:
 
     @property
     def balance_ratio (self) -> float:
-        if (
-            (self.spread_type is SpreadType.MONTHLY and self.frequency_unit is FrequencyType.MONTH)
-            or (self.spread_type is SpreadType.YEARLY and self.frequency_unit is FrequencyType.YEAR)
-        ):
-            return self.frequency
-
-        elif self.frequency_unit is FrequencyType.YEAR:
-            return self.frequency / 12
+        # Occurrences per charge; multiplying or dividing by whole ratios keeps the month and
+        # year conversions exact
+        unit, spread = self.frequency_unit.per_year, self.spread_type.per_year
+        if unit >= spread:
+            return self.frequency * (unit / spread)
 
-        else:
-            return self.frequency * 12
+        return self.frequency / (spread / unit)
 
     @property
     def balance_value (self) -> float:
@@ -0,0 +1,193 @@
+import numpy as np
+import pandas as pd
+import dataclasses as dc
+from collections.abc import Iterator
+
+from structs.balance import Balance, BalanceType, FrequencyType, SpreadType
+from structs.payment import FinancialBreakdown
+from storage import BALANCE_COLUMNS, EncodedStringDtype
+
+
+# Enum codes are positions in these tuples, as in the columnar storage format
+FREQUENCY_UNITS = tuple(FrequencyType)
+SPREAD_TYPES = tuple(SpreadType)
+BALANCE_TYPES = tuple(BalanceType)
+# Start of a balance in force from the start, and expiry of one that never expires
+ALWAYS = np.iinfo(np.int32).min
+NEVER = np.iinfo(np.int32).max
+# FinancialBreakdown field of every balance type
+TYPE_FIELDS = {
+    BalanceType.CREDIT: "credit",
+    BalanceType.EXPENSE: "debit",
+    BalanceType.INVESTMENT: "investment",
+    BalanceType.PAYMENT: "payment",
+}
+
+
+def enum_codes (column: pd.Series, members: tuple) -> np.ndarray:
+    values = pd.Index([member.value for member in members])
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        # One lookup per category, then gathered by code; missing values keep code -1
+        codes = np.append(values.get_indexer(column.cat.categories), -1)[column.cat.codes.to_numpy()]
+
+    else:
+        codes = values.get_indexer(column)
+
+    if (codes < 0).any():
+        raise ValueError(f"Unknown {column.name} value {column[codes < 0].iloc[0]!r}")
+
+    return codes.astype(np.int8)
+
+def strings (column: pd.Series) -> pd.api.extensions.ExtensionArray:
+    # Encoded strings of a mapped ledger stay encoded, each decoded when read
+    return column.array if isinstance(column.dtype, EncodedStringDtype) else column.astype(str).array
+
+def counters (values: np.ndarray, missing: float) -> np.ndarray:
+    # Starts and expiries only take effect at whole counters, so they are kept rounded up
+    with np.errstate(invalid="ignore"):
+        rounded = np.ceil(np.where(np.isnan(values), missing, values))
+
+    return np.clip(rounded, ALWAYS + 1, NEVER).astype(np.int32)
+
+@dc.dataclass(kw_only=True)
+class BalanceTable:
+    # Struct of arrays with one entry per balance: int8 enum codes, int32 start and expiry
+    # counters and each balance value precomputed. start is ALWAYS for balances starting at
+    # month 0 and expiry NEVER for those without one.
+    id: pd.api.extensions.ExtensionArray
+    name: pd.api.extensions.ExtensionArray
+    value: np.ndarray
+    frequency: np.ndarray
+    frequency_unit: np.ndarray
+    spread_type: np.ndarray
+    type: np.ndarray
+    start: np.ndarray
+    expiry: np.ndarray
+
+    balance_value: np.ndarray = dc.field(init=False)
+
+    def __post_init__ (self) -> None:
+        # Same ratios as Balance.balance_ratio, one lookup per code
+        unit_per_year = np.array([unit.per_year for unit in FREQUENCY_UNITS], dtype=float)[self.frequency_unit]
+        spread_per_year = np.array([spread.per_year for spread in SPREAD_TYPES], dtype=float)[self.spread_type]
+
+        ratio = np.where(
+            unit_per_year >= spread_per_year,
+            self.frequency * (unit_per_year / spread_per_year),
+            self.frequency / (spread_per_year / unit_per_year),
+        )
+        self.balance_value = self.value * ratio
+
+    def __len__ (self) -> int:
+        return len(self.id)
+
+    @classmethod
+    def from_frame (cls, df: pd.DataFrame) -> "BalanceTable":
+        start_month = pd.to_numeric(df["start_month"], errors="coerce").to_numpy(dtype=float)
+
+        return cls(
+            # String arrays are shared with the frame rather than copied into Python objects
+            id=strings(df["id"]),
+            name=strings(df["name"]),
+            value=pd.to_numeric(df["value"], errors="coerce").to_numpy(dtype=float),
+            frequency=pd.to_numeric(df["frequency"], errors="coerce").to_numpy(dtype=float),
+            frequency_unit=enum_codes(df["frequency_unit"], FREQUENCY_UNITS),
+            spread_type=enum_codes(df["spread_type"], SPREAD_TYPES),
+            type=enum_codes(df["type"], BALANCE_TYPES),
+            # A missing start counts from month 0 but, as in the handler partitions, only an
+            # explicit 0 is in force from the start
+            start=np.where(start_month == 0, ALWAYS, counters(start_month, 0)).astype(np.int32),
+            expiry=counters(pd.to_numeric(df["expiry"], errors="coerce").to_numpy(dtype=float), np.inf),
+        )
+
+    @classmethod
+    def from_balances (cls, balances: list[Balance]) -> "BalanceTable":
+        return cls.from_frame(pd.DataFrame([balance.to_csv() for balance in balances], columns=list(BALANCE_COLUMNS)))
+
+    def start_counters (self) -> np.ndarray:
+        # float64 counters with the sentinels back as infinities, as schedule_events expects
+        return np.where(self.start == ALWAYS, -np.inf, self.start)
+
+    def expiry_counters (self) -> np.ndarray:
+        return np.where(self.expiry == NEVER, np.inf, self.expiry)
+
+    def breakdown (self, rows: np.ndarray | None = None) -> FinancialBreakdown:
+        # Summed balance values per type, as add_finance over every balance in rows
+        types = self.type if rows is None else self.type[rows]
+        values = self.balance_value if rows is None else self.balance_value[rows]
+        totals = np.bincount(types, weights=values, minlength=len(BALANCE_TYPES))
+
+        return FinancialBreakdown(**{
+            TYPE_FIELDS[balance_type]: float(total) for balance_type, total in zip(BALANCE_TYPES, totals)
+        })
+
+    def row (self, index: int) -> "BalanceRow":
+        if not -len(self) <= index < len(self):
+            raise IndexError(f"Balance row {index} out of range")
+
+        return BalanceRow(table=self, index=index % len(self))
+
+    def __iter__ (self) -> Iterator["BalanceRow"]:
+        for index in range(len(self)):
+            yield BalanceRow(table=self, index=index)
+
+@dc.dataclass(kw_only=True, frozen=True, slots=True)
+class BalanceRow:
+    # Read-only view of one table entry, for callers that need a single balance
+    table: BalanceTable = dc.field(repr=False)
+    index: int
+
+    @property
+    def id (self) -> str:
+        return self.table.id[self.index]
+
+    @property
+    def name (self) -> str:
+        return self.table.name[self.index]
+
+    @property
+    def value (self) -> float:
+        return float(self.table.value[self.index])
+
+    @property
+    def frequency (self) -> float:
+        return float(self.table.frequency[self.index])
+
+    @property
+    def frequency_unit (self) -> FrequencyType:
+        return FREQUENCY_UNITS[self.table.frequency_unit[self.index]]
+
+    @property
+    def spread_type (self) -> SpreadType:
+        return SPREAD_TYPES[self.table.spread_type[self.index]]
+
+    @property
+    def type (self) -> BalanceType:
+        return BALANCE_TYPES[self.table.type[self.index]]
+
+    @property
+    def start_month (self) -> int:
+        start = int(self.table.start[self.index])
+        return 0 if start == ALWAYS else start
+
+    @property
+    def expiry (self) -> int | float:
+        expiry = int(self.table.expiry[self.index])
+        return np.inf if expiry == NEVER else expiry
+
+    @property
+    def balance_value (self) -> float:
+        return float(self.table.balance_value[self.index])
+
+    def to_balance (self) -> Balance:
+        return Balance(
+            id=self.id,
+            name=self.name,
+            value=self.value,
+            frequency=self.frequency,
+            frequency_unit=self.frequency_unit,
+            spread_type=self.spread_type,
+            expiry=self.expiry,
+            start_month=self.start_month,
+            type=self.type,
+        )
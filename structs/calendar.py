@@ -0,0 +1,73 @@
+import numpy as np
+import dataclasses as dc
+from datetime import datetime
+
+import config
+from structs.balance import SpreadType
+
+
+# Spreads charged once per period, in the order their breakdowns are added when several fall due
+# together. A period ends on its last month: March, June, September and December for quarters.
+PERIODIC_SPREADS = (SpreadType.YEARLY, SpreadType.SEMIANNUAL, SpreadType.QUARTERLY)
+
+
+def default_start_date () -> datetime:
+    # A configured start date makes every run reproducible; otherwise the simulation starts today
+    if config.SIMULATION_START_DATE:
+        try:
+            return datetime.fromisoformat(config.SIMULATION_START_DATE)
+
+        except ValueError:
+            raise ValueError(f"Invalid SIMULATION_START_DATE {config.SIMULATION_START_DATE}, expected YYYY-MM-DD")
+
+    return datetime.now()
+
+@dc.dataclass(kw_only=True, frozen=True)
+class SimulationCalendar:
+    # Only the calendar month of start_date reaches the simulation, so every month-indexed
+    # vector repeats yearly and the spreads due in a month come from a 12-entry table.
+    start_date: datetime
+
+    due: tuple[tuple[SpreadType, ...], ...] = dc.field(init=False, repr=False, compare=False)
+
+    def __post_init__ (self) -> None:
+        due = [
+            tuple(spread for spread in PERIODIC_SPREADS if self.is_due(spread, month))
+            for month in range(12)
+        ]
+        object.__setattr__(self, "due", tuple(due))
+
+    @classmethod
+    def starting (cls, start_date: datetime | None = None) -> "SimulationCalendar":
+        return cls(start_date=start_date if start_date is not None else default_start_date())
+
+    @property
+    def offset (self) -> int:
+        return self.start_date.month - 1
+
+    def month_of_year (self, months: np.ndarray | int) -> np.ndarray | int:
+        # 0 for January through 11 for December
+        return (self.offset + months) % 12
+
+    def is_due (self, spread: SpreadType, months: np.ndarray | int) -> np.ndarray | bool:
+        period = spread.months
+        return (self.offset + months) % period == period - 1
+
+    def periods_before (self, spread: SpreadType, months: np.ndarray | int) -> np.ndarray | int:
+        # Counter of a periodic schedule when `months` is simulated: the periods closed before it
+        period = spread.months
+        return (self.offset + months) // period - self.offset // period
+
+    def next_due (self, spread: SpreadType, month: int) -> int:
+        period = spread.months
+        return month + (period - 1 - (self.offset + month) % period) % period
+
+    def closing_month (self, spread: SpreadType, counter: int) -> int:
+        # Month whose closing moves the schedule to `counter`, -1 for the initial state
+        if counter <= 0:
+            return -1
+
+        return self.next_due(spread, 0) + spread.months * (counter - 1)
+
+    def due_at (self, month: int) -> tuple[SpreadType, ...]:
+        return self.due[month % 12]
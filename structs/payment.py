@@ -1,6 +1,10 @@
 import dataclasses as dc
+from typing import TYPE_CHECKING
 
-from structs.balance import Balance, BalanceType
+from structs.balance import Balance, BalanceType, SpreadType
+
+if TYPE_CHECKING:
+    from structs.schedule import CashFlowLedger
 
 
 @dc.dataclass(kw_only=True)
@@ -44,7 +48,7 @@ class FinancialBreakdown:
 
     def __sub__ (self, other: "FinancialBreakdown") -> "FinancialBreakdown":
         return FinancialBreakdown(
-            credit=self.credit - other.debit,
+            credit=self.credit - other.credit,
             debit=self.debit - other.debit,
             investment=self.investment - other.investment,
             payment=self.payment - other.payment,
@@ -63,56 +67,38 @@ class PaymentStatus:
     payment_size: float
     investment_size: float
 
-    monthly_balances: list[Balance]
-    yearly_balances: list[Balance]
-    inactive_monthly_balances: list[Balance]
-    inactive_yearly_balances: list[Balance]
+    ledger: "CashFlowLedger"
 
     monthly_breakdown: FinancialBreakdown = dc.field(init=False)
-    yearly_breakdown: FinancialBreakdown = dc.field(init=False)
+    # Breakdown of every periodic spread, charged in the months its period closes
+    periodic_breakdowns: dict[SpreadType, FinancialBreakdown] = dc.field(init=False)
 
     total_breakdown: FinancialBreakdown = dc.field(init=False)
 
     def __post_init__ (self) -> None:
-        self.monthly_balances.sort(key=lambda balance: balance._expiry, reverse=True)
-        self.yearly_balances.sort(key=lambda balance: balance._expiry, reverse=True)
-
-        self.inactive_monthly_balances.sort(key=lambda balance: balance._start_month, reverse=True)
-        self.inactive_yearly_balances.sort(key=lambda balance: balance._start_month, reverse=True)
-
-        self.monthly_breakdown = self.compute_active_metric(self.monthly_balances)
-        self.yearly_breakdown = self.compute_active_metric(self.yearly_balances)
+        self.monthly_breakdown = self.ledger.monthly.initial_breakdown()
+        self.periodic_breakdowns = {
+            spread: schedule.initial_breakdown() for spread, schedule in self.ledger.periodic.items()
+        }
         self.total_breakdown = FinancialBreakdown()
 
-    @classmethod
-    def compute_active_metric (cls, metric: list[Balance]) -> FinancialBreakdown:
-        metric_breakdown = FinancialBreakdown()
-
-        for balance in metric:
-            metric_breakdown.add_finance(balance)
-
-        return metric_breakdown
-
-    @classmethod
-    def update_metric (cls, metric: list[Balance], occ: int, attr: str) -> FinancialBreakdown:
-        metric_breakdown = FinancialBreakdown()
-
-        while len(metric) > 0 and occ == metric[-1].__getattribute__(attr):
-            metric_breakdown.add_finance(metric.pop())
-
-        return metric_breakdown
+    @property
+    def yearly_breakdown (self) -> FinancialBreakdown:
+        return self.periodic_breakdowns[SpreadType.YEARLY]
 
-    def update_curr_year (self, new_year: int) -> None:
-        removal_breakdown = self.update_metric(self.yearly_balances, new_year, "_expiry")
-        activation_breakdown = self.update_metric(self.inactive_yearly_balances, new_year, "_start_month")
+    @yearly_breakdown.setter
+    def yearly_breakdown (self, breakdown: FinancialBreakdown) -> None:
+        self.periodic_breakdowns[SpreadType.YEARLY] = breakdown
 
-        self.yearly_breakdown += activation_breakdown - removal_breakdown
+    def update_curr_period (self, spread: SpreadType, new_period: int) -> None:
+        delta = self.ledger.schedule(spread).delta_at(new_period)
+        if delta is not None:
+            self.periodic_breakdowns[spread] += delta
 
     def update_curr_month (self, new_month: int) -> None:
-        removal_breakdown = self.update_metric(self.monthly_balances, new_month, "_expiry")
-        activation_breakdown = self.update_metric(self.inactive_monthly_balances, new_month, "_start_month")
-
-        self.monthly_breakdown += activation_breakdown - removal_breakdown
+        delta = self.ledger.monthly.delta_at(new_month)
+        if delta is not None:
+            self.monthly_breakdown += delta
 
     def update_status (self, total_breakdown: FinancialBreakdown) -> None:
         self.payment_size -= total_breakdown.payment
@@ -127,14 +113,13 @@ class PaymentStatus:
         cpy = PaymentStatus(
             payment_size=self.payment_size,
             investment_size=self.investment_size,
-            monthly_balances=self.monthly_balances.copy(),
-            yearly_balances=self.yearly_balances.copy(),
-            inactive_monthly_balances=self.inactive_monthly_balances.copy(),
-            inactive_yearly_balances=self.inactive_yearly_balances.copy(),
+            ledger=self.ledger,
         )
 
         cpy.total_breakdown = self.total_breakdown.copy()
         cpy.monthly_breakdown = self.monthly_breakdown.copy()
-        cpy.yearly_breakdown = self.yearly_breakdown.copy()
+        cpy.periodic_breakdowns = {
+            spread: breakdown.copy() for spread, breakdown in self.periodic_breakdowns.items()
+        }
 
         return cpy
@@ -0,0 +1,150 @@
+import numpy as np
+import dataclasses as dc
+from typing import TYPE_CHECKING
+
+from structs.balance import SpreadType
+from structs.balance_table import BALANCE_TYPES, SPREAD_TYPES, TYPE_FIELDS, BalanceTable
+from structs.calendar import PERIODIC_SPREADS, SimulationCalendar
+import instrumentation
+from structs.payment import FinancialBreakdown
+
+if TYPE_CHECKING:
+    from balance_handler import BalanceHandler
+
+
+# Column order of every breakdown matrix built from a schedule
+BREAKDOWN_FIELDS = ("credit", "debit", "investment", "payment")
+CREDIT, DEBIT, INVESTMENT, PAYMENT = range(len(BREAKDOWN_FIELDS))
+
+
+def balance_values (table: BalanceTable) -> np.ndarray:
+    # (balances, 4): every balance value in the column of its type
+    columns = np.array([BREAKDOWN_FIELDS.index(TYPE_FIELDS[balance_type]) for balance_type in BALANCE_TYPES])
+
+    values = np.zeros((len(table), len(BREAKDOWN_FIELDS)))
+    values[np.arange(len(table)), columns[table.type]] = table.balance_value
+
+    return values
+
+def first_counter (spread: SpreadType) -> int:
+    # Monthly events apply from month 0, periodic ones once the first period closes
+    return 0 if spread is SpreadType.MONTHLY else 1
+
+def breakdown_from_row (row: np.ndarray) -> FinancialBreakdown:
+    return FinancialBreakdown(**dict(zip(BREAKDOWN_FIELDS, row.tolist())))
+
+def schedule_events (
+    start: np.ndarray, expiry: np.ndarray, first_counter: int
+) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    # A start or expiry between two checks takes effect at the next check, and anything
+    # before the first check is folded into the initial breakdown. Returns the rounded start
+    # and expiry counters and the masks of balances in force initially, activated at their
+    # start and removed at their expiry.
+    with np.errstate(invalid="ignore"):
+        start = np.ceil(np.where(np.isnan(start), 0, start))
+        expiry = np.ceil(np.where(np.isnan(expiry), np.inf, expiry))
+
+        live = (expiry > start) & (expiry >= first_counter)
+        initially = live & (start < first_counter)
+        activated = live & ~initially
+        removed = live & np.isfinite(expiry)
+
+    return start, expiry, initially, activated, removed
+
+@dc.dataclass(kw_only=True)
+class EventSchedule:
+    # Breakdown in force before the first check plus, for every counter at which it changes,
+    # the summed delta of all balances starting or expiring there.
+    initial: np.ndarray
+    counters: np.ndarray
+    deltas: np.ndarray
+
+    cumulative: np.ndarray = dc.field(init=False, repr=False)
+    _deltas_by_counter: dict[int, FinancialBreakdown] = dc.field(init=False, repr=False)
+
+    def __post_init__ (self) -> None:
+        self.cumulative = np.cumsum(np.vstack([self.initial, self.deltas]), axis=0)
+        self._deltas_by_counter = {
+            counter: breakdown_from_row(delta)
+            for counter, delta in zip(self.counters.tolist(), self.deltas)
+        }
+
+    @classmethod
+    def from_arrays (
+        cls, values: np.ndarray, start: np.ndarray, expiry: np.ndarray, first_counter: int
+    ) -> "EventSchedule":
+        start, expiry, initially, activated, removed = schedule_events(start, expiry, first_counter)
+
+        counters = np.concatenate([start[activated], expiry[removed]]).astype(np.int64)
+        unique_counters, inverse = np.unique(counters, return_inverse=True)
+
+        deltas = np.zeros((len(unique_counters), len(BREAKDOWN_FIELDS)))
+        np.add.at(deltas, inverse, np.concatenate([values[activated], -values[removed]]))
+
+        return cls(
+            initial=values[initially].sum(axis=0),
+            counters=unique_counters,
+            deltas=deltas,
+        )
+
+    @property
+    def is_empty (self) -> bool:
+        return len(self.counters) == 0 and not self.initial.any()
+
+    def initial_breakdown (self) -> FinancialBreakdown:
+        return breakdown_from_row(self.initial)
+
+    def delta_at (self, counter: int) -> FinancialBreakdown | None:
+        return self._deltas_by_counter.get(counter)
+
+    def state_at (self, counter: np.ndarray) -> np.ndarray:
+        return self.cumulative[np.searchsorted(self.counters, counter, side="right")]
+
+@dc.dataclass(kw_only=True)
+class CashFlowLedger:
+    # One schedule per spread, named after it. Monthly counters are months; a periodic
+    # schedule counts the periods closed, so its starts and expiries are in its own periods.
+    monthly: EventSchedule
+    yearly: EventSchedule
+    quarterly: EventSchedule
+    semiannual: EventSchedule
+
+    @classmethod
+    def from_handler (cls, handler: "BalanceHandler") -> "CashFlowLedger":
+        with instrumentation.phase("ledger.compile") as phase:
+            phase.iterations = len(handler.df)
+            return cls.from_table(handler.table)
+
+    @classmethod
+    def from_table (cls, table: BalanceTable) -> "CashFlowLedger":
+        values = balance_values(table)
+        start, expiry = table.start_counters(), table.expiry_counters()
+
+        schedules = {}
+        for code, spread in enumerate(SPREAD_TYPES):
+            rows = table.spread_type == code
+            schedules[spread.value] = EventSchedule.from_arrays(
+                values[rows], start[rows], expiry[rows], first_counter(spread)
+            )
+
+        return cls(**schedules)
+
+    def schedule (self, spread: SpreadType) -> EventSchedule:
+        return getattr(self, spread.value)
+
+    @property
+    def periodic (self) -> dict[SpreadType, EventSchedule]:
+        return {spread: self.schedule(spread) for spread in PERIODIC_SPREADS}
+
+    def cash_flows (self, calendar: SimulationCalendar, months: np.ndarray) -> np.ndarray:
+        # (months, 4) cash-flow matrix: the summed breakdown of every balance charged in each
+        # month. Periodic schedules only reach the months their period closes.
+        breakdown = self.monthly.state_at(months)
+        for spread, schedule in self.periodic.items():
+            if schedule.is_empty:
+                continue
+
+            due = calendar.is_due(spread, months)
+            breakdown[due] += schedule.state_at(calendar.periods_before(spread, months[due]))
+
+        return breakdown
@@ -0,0 +1,133 @@
+import numpy as np
+import pandas as pd
+import dataclasses as dc
+from datetime import datetime
+from collections.abc import Iterator
+
+from structs.payment import FinancialBreakdown, PaymentStatus
+
+
+TRAJECTORY_COLUMNS = ("payment_size", "investment_size", "credit", "debit", "investment", "payment")
+BREAKDOWN_COLUMNS = TRAJECTORY_COLUMNS[2:]
+
+
+@dc.dataclass(kw_only=True, frozen=True)
+class TrajectoryPoint:
+    month: int
+    payment_size: float
+    investment_size: float
+    total_breakdown: FinancialBreakdown
+
+@dc.dataclass(kw_only=True)
+class PaymentTrajectory:
+    start_date: datetime | None = None
+    capacity: dc.InitVar[int] = 64
+
+    _data: np.ndarray = dc.field(init=False, repr=False)
+    _size: int = dc.field(init=False, default=0)
+
+    def __post_init__ (self, capacity: int) -> None:
+        self._data = np.empty((len(TRAJECTORY_COLUMNS), max(capacity, 1)))
+
+    @classmethod
+    def from_arrays (
+        cls, payment_size: np.ndarray, investment_size: np.ndarray, total_breakdown: np.ndarray, *,
+        start_date: datetime | None = None,
+    ) -> "PaymentTrajectory":
+        trajectory = cls(start_date=start_date, capacity=len(payment_size))
+        trajectory._data[0, :len(payment_size)] = payment_size
+        trajectory._data[1, :len(payment_size)] = investment_size
+        trajectory._data[2:, :len(payment_size)] = np.asarray(total_breakdown).T
+        trajectory._size = len(payment_size)
+
+        return trajectory
+
+    def copy (self, *, start_date: datetime | None = None) -> "PaymentTrajectory":
+        return PaymentTrajectory.from_arrays(
+            self.payment_size, self.investment_size, self.total_breakdown,
+            start_date=start_date if start_date is not None else self.start_date,
+        )
+
+    def _reserve (self, size: int) -> None:
+        if size <= self._data.shape[1]:
+            return
+
+        data = np.empty((len(TRAJECTORY_COLUMNS), max(size, 2 * self._data.shape[1])))
+        data[:, :self._size] = self._data[:, :self._size]
+        self._data = data
+
+    def append (
+        self, payment_size: float, investment_size: float, total_breakdown: FinancialBreakdown
+    ) -> None:
+        self._reserve(self._size + 1)
+        self._data[:, self._size] = (
+            payment_size, investment_size,
+            total_breakdown.credit, total_breakdown.debit,
+            total_breakdown.investment, total_breakdown.payment,
+        )
+        self._size += 1
+
+    def append_status (self, payment_status: PaymentStatus) -> None:
+        self.append(
+            payment_status.payment_size, payment_status.investment_size,
+            payment_status.total_breakdown,
+        )
+
+    def append_point (self, point: TrajectoryPoint) -> None:
+        self.append(point.payment_size, point.investment_size, point.total_breakdown)
+
+    def truncate (self, size: int) -> None:
+        self._size = min(self._size, max(size, 0))
+
+    def __len__ (self) -> int:
+        return self._size
+
+    def __getitem__ (self, month: int) -> TrajectoryPoint:
+        if month < 0:
+            month += self._size
+
+        if not 0 <= month < self._size:
+            raise IndexError(f"Month {month} outside trajectory of {self._size} months")
+
+        column = self._data[:, month].tolist()
+        return TrajectoryPoint(
+            month=month,
+            payment_size=column[0],
+            investment_size=column[1],
+            total_breakdown=FinancialBreakdown(**dict(zip(BREAKDOWN_COLUMNS, column[2:]))),
+        )
+
+    def __iter__ (self) -> Iterator[TrajectoryPoint]:
+        for month in range(self._size):
+            yield self[month]
+
+    def column (self, name: str) -> np.ndarray:
+        return self._data[TRAJECTORY_COLUMNS.index(name), :self._size]
+
+    @property
+    def payment_size (self) -> np.ndarray:
+        return self.column("payment_size")
+
+    @property
+    def investment_size (self) -> np.ndarray:
+        return self.column("investment_size")
+
+    @property
+    def total_breakdown (self) -> np.ndarray:
+        return self._data[2:, :self._size].T
+
+    @property
+    def extra_credit (self) -> np.ndarray:
+        return (
+            self.column("credit") - self.column("debit")
+            - self.column("payment") - self.column("investment")
+        )
+
+    def to_numpy (self) -> np.ndarray:
+        return self._data[:, :self._size].T.copy()
+
+    def to_dataframe (self) -> pd.DataFrame:
+        df = pd.DataFrame(self.to_numpy(), columns=list(TRAJECTORY_COLUMNS))
+        df.index.name = "month"
+
+        return df
@@ -0,0 +1,43 @@
+import pickle
+
+import numpy as np
+import pytest
+
+import cache
+from cache import SimulationCache, cache_key
+
+
+KEY = cache_key("ledger", "run", payment_size=1.0)
+
+
+def stored (tmp_path, key: str, data: bytes) -> SimulationCache:
+    results = SimulationCache(disk_path=tmp_path)
+    (tmp_path / f"{key}.pkl").write_bytes(data)
+
+    return results
+
+def test_disk_tier_survives_a_new_cache (tmp_path) -> None:
+    SimulationCache(disk_path=tmp_path).put(KEY, np.arange(5))
+    results = SimulationCache(disk_path=tmp_path)
+
+    np.testing.assert_array_equal(results.get(KEY), np.arange(5))
+    assert results.stats.disk_hits == 1
+
+@pytest.mark.parametrize("data", [
+    # A class whose module is gone raises ModuleNotFoundError rather than UnpicklingError
+    b"cgone_module\nThing\n)\x81.",
+    pickle.dumps(list(range(100)))[:20],
+    b"not a pickle",
+    b"",
+])
+def test_unreadable_files_are_misses_and_removed (tmp_path, data: bytes) -> None:
+    results = stored(tmp_path, KEY, data)
+
+    assert results.get(KEY) is None
+    assert results.stats.misses == 1
+    assert not (tmp_path / f"{KEY}.pkl").exists()
+
+def test_keys_change_with_the_format_version (monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(cache, "CACHE_FORMAT_VERSION", cache.CACHE_FORMAT_VERSION + 1)
+
+    assert cache_key("ledger", "run", payment_size=1.0) != KEY
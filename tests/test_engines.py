@@ -0,0 +1,44 @@
+import numpy as np
+from datetime import datetime
+
+import pytest
+
+import config
+from balance_handler import BalanceHandler
+from benchmarks.ledger import TimingProfile, horizon_payment_size, synthetic_ledger
+from structs.schedule import CashFlowLedger
+from simulate import SimulationEngine, get_payment_trajectory
+
+
+HORIZON = 60
+
+
+@pytest.fixture(autouse=True)
+def rates (monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(config, "BALANCE_JOURNAL", False)
+    monkeypatch.setattr(config, "PAYMENT_INTEREST_RATE", 0.0)
+    monkeypatch.setattr(config, "INVESTMENT_INTERST_RATE", 0.008)
+
+@pytest.mark.parametrize("start_month", [1, 6, 12])
+@pytest.mark.parametrize("seed", range(30))
+def test_engines_agree (seed: int, start_month: int) -> None:
+    profile = tuple(TimingProfile)[seed % len(TimingProfile)]
+    handler = BalanceHandler(dataframe=synthetic_ledger(40, seed=seed, horizon=HORIZON, profile=profile))
+    start_date = datetime(2025, start_month, 1)
+    ledger = CashFlowLedger.from_handler(handler)
+    payment_size = horizon_payment_size(ledger, HORIZON, start_date)
+
+    trajectories = [
+        get_payment_trajectory(
+            handler, payment_size, 400.0 + seed, initial_payment=seed * 10.0, profit_tax=0.15,
+            investment_yearly_percentage=0.1, start_date=start_date, engine=engine, ledger=ledger,
+        )
+        for engine in SimulationEngine
+    ]
+    loop = trajectories[0]
+
+    # The initial payment shortens the payoff, but never to nothing
+    assert 1 < len(loop) <= HORIZON + 1
+    for trajectory in trajectories[1:]:
+        assert len(trajectory) == len(loop)
+        np.testing.assert_allclose(trajectory.to_numpy(), loop.to_numpy(), rtol=1e-9, atol=1e-6)
@@ -0,0 +1,149 @@
+import threading
+import numpy as np
+import dataclasses as dc
+from datetime import datetime
+
+import pytest
+
+import config
+from balance_handler import BalanceHandler
+from benchmarks.ledger import horizon_payment_size, synthetic_balances, synthetic_ledger
+from incremental import IncrementalSimulation
+from structs.balance import BalanceType, FrequencyType, SpreadType
+from structs.schedule import CashFlowLedger
+from simulate import get_payment_trajectory
+
+
+START_DATE = datetime(2025, 3, 1)
+HORIZON = 120
+PARAMETERS = dict(initial_payment=0.0, profit_tax=0.15, investment_yearly_percentage=0.1, start_date=START_DATE)
+
+
+@pytest.fixture(autouse=True)
+def rates (monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(config, "BALANCE_JOURNAL", False)
+    monkeypatch.setattr(config, "PAYMENT_INTEREST_RATE", 0.0)
+    monkeypatch.setattr(config, "INVESTMENT_INTERST_RATE", 0.008)
+
+@pytest.fixture
+def handler () -> BalanceHandler:
+    return BalanceHandler(dataframe=synthetic_ledger(80, seed=4, horizon=HORIZON))
+
+@pytest.fixture
+def simulation (handler: BalanceHandler):
+    payment_size = horizon_payment_size(CashFlowLedger.from_handler(handler), HORIZON, START_DATE)
+    simulation = IncrementalSimulation(handler=handler, payment_size=payment_size, investment_size=800.0, **PARAMETERS)
+    simulation.refresh()
+
+    yield simulation
+    simulation.close()
+
+def monthly_from (month: int, balance_type: BalanceType, seed: int = 0):
+    # A monthly balance first charged in `month`, so the months before it are left intact
+    balance = synthetic_balances(1, seed=seed, prefix=f"at{month}")[0]
+
+    return dc.replace(
+        balance, value=250.0, frequency=1.0, frequency_unit=FrequencyType.MONTH, spread_type=SpreadType.MONTHLY,
+        type=balance_type, start_month=month, expiry=None,
+    )
+
+def checkpoint_before (simulation: IncrementalSimulation, month: int) -> int:
+    return month // simulation.checkpoint_interval * simulation.checkpoint_interval
+
+def assert_matches_full_run (simulation: IncrementalSimulation) -> None:
+    expected = get_payment_trajectory(
+        simulation.handler, simulation.payment_size, simulation.investment_size, **PARAMETERS
+    )
+
+    assert simulation.complete
+    assert len(simulation.trajectory) == len(expected)
+    np.testing.assert_allclose(simulation.trajectory.to_numpy(), expected.to_numpy())
+
+def test_first_refresh_is_a_full_run (simulation: IncrementalSimulation) -> None:
+    assert simulation.resumed_from == 0
+    assert len(simulation.trajectory) == HORIZON + 1
+    assert_matches_full_run(simulation)
+
+@pytest.mark.parametrize("month", [1, 17, 58, 103])
+@pytest.mark.parametrize("balance_type", [BalanceType.EXPENSE, BalanceType.CREDIT])
+def test_add_resumes_from_the_checkpoint_before_it (
+    simulation: IncrementalSimulation, month: int, balance_type: BalanceType
+) -> None:
+    simulation.handler.add_balances([monthly_from(month, balance_type)])
+    simulation.refresh()
+
+    assert simulation.resumed_from == checkpoint_before(simulation, month)
+    assert_matches_full_run(simulation)
+
+@pytest.mark.parametrize("months", [(5, 90), (90, 5), (40, 41, 100)])
+def test_edits_since_the_last_refresh_resume_from_the_earliest (
+    simulation: IncrementalSimulation, months: tuple[int, ...]
+) -> None:
+    handler = simulation.handler
+    for seed, month in enumerate(months):
+        handler.add_balances([monthly_from(month, BalanceType.EXPENSE, seed)])
+
+    simulation.refresh()
+    assert simulation.resumed_from == checkpoint_before(simulation, min(months))
+    assert_matches_full_run(simulation)
+
+    # Updating and then removing the latest balance only reaches back to its own month
+    late = monthly_from(months[-1], BalanceType.EXPENSE, len(months) - 1)
+    handler.update_balances_by_id([dc.replace(late, value=40.0, start_month=months[-1], expiry=None)])
+    simulation.refresh()
+    assert simulation.resumed_from == checkpoint_before(simulation, months[-1])
+    assert_matches_full_run(simulation)
+
+    handler.remove_balances_by_id([late.id])
+    simulation.refresh()
+    assert simulation.resumed_from == checkpoint_before(simulation, months[-1])
+    assert_matches_full_run(simulation)
+
+def test_edits_past_the_end_change_nothing (simulation: IncrementalSimulation) -> None:
+    simulation.handler.add_balances([monthly_from(HORIZON + 30, BalanceType.EXPENSE)])
+    simulation.refresh()
+
+    assert simulation.resumed_from is None
+    assert_matches_full_run(simulation)
+
+def test_replaced_ledger_restarts_from_the_beginning (simulation: IncrementalSimulation) -> None:
+    # append_frame replaces the frame wholesale, so even a late balance restarts the run
+    frame = synthetic_ledger(3, seed=8)
+    frame["id"] = "appended" + frame["id"]
+    frame["start_month"] = 100.0
+    simulation.handler.append_frame(frame)
+    simulation.refresh()
+
+    assert simulation.resumed_from == 0
+    assert_matches_full_run(simulation)
+
+    # A later edit resumes from its checkpoint again
+    simulation.handler.add_balances([monthly_from(70, BalanceType.EXPENSE)])
+    simulation.refresh()
+
+    assert simulation.resumed_from == 60
+    assert_matches_full_run(simulation)
+
+def test_stopped_run_goes_on_from_its_last_checkpoint (simulation: IncrementalSimulation) -> None:
+    stop = threading.Event()
+    simulation.handler.add_balances([monthly_from(8, BalanceType.EXPENSE)])
+
+    def halt (month: int, _) -> None:
+        if month == 50:
+            stop.set()
+
+    assert simulation.resume(simulation.snapshot(), stop=stop, progress=halt) is None
+    assert not simulation.complete
+
+    trajectory = simulation.resume(simulation.snapshot())
+    assert simulation.resumed_from == 48
+    assert_matches_full_run(simulation)
+    np.testing.assert_allclose(trajectory.to_numpy(), simulation.trajectory.to_numpy())
+
+def test_stale_snapshots_are_ignored (simulation: IncrementalSimulation) -> None:
+    stale = simulation.snapshot()
+    simulation.handler.add_balances([monthly_from(30, BalanceType.EXPENSE)])
+    simulation.refresh()
+
+    assert simulation.resume(stale) is None
+    assert_matches_full_run(simulation)
@@ -0,0 +1,78 @@
+import dataclasses as dc
+
+import pytest
+
+import config
+from balance_handler import BalanceHandler
+from benchmarks.ledger import synthetic_balances, synthetic_ledger
+from journal import LedgerJournal, journal_path
+from storage import ColumnarStorage
+
+
+# Small enough that a few edits fill the journal and compaction runs while editing goes on
+COMPACT_BYTES = 4096
+
+
+@pytest.fixture(autouse=True)
+def no_default_journal (monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(config, "BALANCE_JOURNAL", False)
+
+def journaled (path) -> BalanceHandler:
+    return BalanceHandler(
+        storage=ColumnarStorage(path=path), journal=LedgerJournal(path=journal_path(path), compact_bytes=COMPACT_BYTES)
+    )
+
+def edit (handler: BalanceHandler, round: int) -> None:
+    prefix = f"r{round}"
+    handler.add_balances(synthetic_balances(20, seed=round, prefix=prefix))
+    handler.update_balances_by_id([
+        dc.replace(balance, id=f"b{row}", name=f"{prefix} {row}", expiry=None, start_month=None)
+        for row, balance in zip(range(150 + round, 300, 13), synthetic_balances(12, seed=100 + round))
+    ])
+    handler.remove_balances_by_id([f"b{row}" for row in range(round * 10, round * 10 + 5)] + [f"{prefix}b3"])
+
+def test_compaction_during_edits_keeps_every_edit (tmp_path) -> None:
+    path = tmp_path / "ledger.bal"
+    ColumnarStorage(path=path).save(synthetic_ledger(300, seed=9))
+    reference = BalanceHandler(dataframe=synthetic_ledger(300, seed=9))
+
+    handler = journaled(path)
+    snapshots = []
+    compact = handler.journal.compact
+    handler.journal.compact = lambda snapshot, storage: (
+        snapshots.append((snapshot, snapshot.to_dict("list"))), compact(snapshot, storage)
+    )
+
+    for round in range(12):
+        edit(handler, round)
+        edit(reference, round)
+
+    handler.close()
+
+    assert len(snapshots) > 1
+    # Snapshots are copies, left as they were by every later edit
+    assert all(snapshot.to_dict("list") == taken for snapshot, taken in snapshots)
+    assert journaled(path).ledger_hash == reference.ledger_hash
+
+def test_replay_compacts_while_editing_continues (tmp_path) -> None:
+    path = tmp_path / "ledger.bal"
+    ColumnarStorage(path=path).save(synthetic_ledger(300, seed=9))
+    reference = BalanceHandler(dataframe=synthetic_ledger(300, seed=9))
+
+    for session in range(3):
+        # Every reopen replays the journal left behind and folds it into a snapshot in the background
+        handler = journaled(path)
+        assert handler.ledger_hash == reference.ledger_hash
+
+        for round in range(session * 4, session * 4 + 4):
+            edit(handler, round)
+            edit(reference, round)
+
+        handler.close()
+
+    reopened = journaled(path)
+    assert reopened.ledger_hash == reference.ledger_hash
+
+    reopened.save()
+    assert not journal_path(path).exists()
+    assert BalanceHandler(storage=ColumnarStorage(path=path)).ledger_hash == reference.ledger_hash
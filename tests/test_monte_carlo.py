@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+
+from balance_handler import BalanceHandler
+from benchmarks.ledger import synthetic_ledger
+from structs.schedule import CashFlowLedger
+from monte_carlo import QuantileSketch, RateModel, run_monte_carlo
+
+
+PERCENTILES = (5.0, 25.0, 50.0, 75.0, 95.0)
+
+
+def sketch_of (data: np.ndarray, batch_size: int) -> QuantileSketch:
+    sketch = QuantileSketch()
+    for start in range(0, len(data), batch_size):
+        sketch.update(data[start:start + batch_size])
+
+    return sketch
+
+@pytest.mark.parametrize("paths, batch_size", [
+    (4096 + 10, 4096),
+    (10_000, 4096),
+    (50_000, 4096),
+    (3_000, 4096),
+    (20_000, 700),
+    (9_999, 1_000),
+])
+def test_quantiles_match_percentile_with_partial_batches (paths: int, batch_size: int) -> None:
+    data = np.random.default_rng(paths).normal(size=(paths, 3))
+    sketch = sketch_of(data, batch_size)
+
+    assert sketch.count == paths
+    assert sum(count for _, count in sketch.levels) == paths
+    np.testing.assert_allclose(sketch.quantiles(PERCENTILES), np.percentile(data, PERCENTILES, axis=0), atol=0.02)
+
+def test_partial_batch_keeps_its_weight () -> None:
+    # 100 ones among 4196 paths are 2.4% of them, so no band below the 97th percentile sees one
+    data = np.concatenate([np.zeros((4096, 2)), np.ones((100, 2))])
+    bands = sketch_of(data, 4096).quantiles((50.0, 75.0, 95.0))
+
+    np.testing.assert_array_equal(bands, 0.0)
+
+def test_ended_paths_extend_with_their_last_value () -> None:
+    sketch = QuantileSketch()
+    sketch.update(np.full((10, 2), 5.0))
+    sketch.update(np.full((10, 4), 1.0))
+
+    assert sketch.quantiles((50.0,)).shape == (1, 4)
+    np.testing.assert_allclose(sketch.quantiles((90.0,))[0, 2:], 5.0)
+
+@pytest.mark.parametrize("paths", [0, 10])
+def test_run_keeps_the_requested_percentiles (paths: int) -> None:
+    ledger = CashFlowLedger.from_handler(BalanceHandler(dataframe=synthetic_ledger(10, seed=1)))
+    aggregate = run_monte_carlo(
+        ledger, 2000.0, 500.0, paths=paths, investment_rate=RateModel(mean=0.008), seed=1,
+        percentiles=PERCENTILES, sketch_size=64,
+    )
+
+    assert aggregate.paths == paths
+    assert aggregate.percentiles == PERCENTILES
+    assert aggregate.payment_sketch.size == aggregate.investment_sketch.size == 64
+    assert aggregate.payoff_month_percentiles().shape == (len(PERCENTILES),)
@@ -0,0 +1,193 @@
+import json
+import urllib.error
+import urllib.request
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import config
+from balance_handler import BalanceHandler
+from benchmarks.ledger import horizon_payment_size, synthetic_ledger
+from service import SimulationService, start_service
+from storage import ColumnarStorage
+from structs.schedule import CashFlowLedger
+from simulate import get_payment_sweep, get_payment_trajectory
+
+
+START_DATE = datetime(2025, 1, 1)
+HORIZON = 24
+
+
+@pytest.fixture(autouse=True)
+def rates (monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(config, "BALANCE_JOURNAL", False)
+    monkeypatch.setattr(config, "PAYMENT_INTEREST_RATE", 0.0)
+    monkeypatch.setattr(config, "INVESTMENT_INTERST_RATE", 0.008)
+
+@pytest.fixture
+def ledger_path (tmp_path):
+    path = tmp_path / "ledger.bal"
+    ColumnarStorage(path=path).save(synthetic_ledger(40, seed=5, horizon=HORIZON))
+
+    return path
+
+@pytest.fixture
+def payment_size (ledger_path) -> float:
+    handler = BalanceHandler(storage=ColumnarStorage(path=ledger_path))
+    return horizon_payment_size(CashFlowLedger.from_handler(handler), HORIZON, START_DATE)
+
+def served (**options):
+    service = SimulationService(**options)
+    return service, start_service(service, port=0)
+
+def post (server, path: str, payload: dict) -> tuple[int, dict]:
+    request = urllib.request.Request(
+        f"{server.url}/{path}", data=json.dumps(payload).encode(), method="POST",
+        headers={"Content-Type": "application/json"},
+    )
+    try:
+        with urllib.request.urlopen(request, timeout=30) as response:
+            return response.status, json.loads(response.read())
+
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read())
+
+def get (server, path: str) -> tuple[int, dict]:
+    try:
+        with urllib.request.urlopen(f"{server.url}/{path}", timeout=30) as response:
+            return response.status, json.loads(response.read())
+
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read())
+
+@pytest.fixture
+def server ():
+    service, server = served()
+    yield server
+
+    server.shutdown()
+    service.close()
+
+def plan (ledger_path, payment_size: float, **extra) -> dict:
+    return {
+        "ledger": str(ledger_path), "payment_size": payment_size, "investment_size": 500.0,
+        "profit_tax": 0.15, "investment_yearly": 0.1, "start_date": START_DATE.date().isoformat(), **extra,
+    }
+
+def test_run_returns_the_trajectory (server, ledger_path, payment_size: float) -> None:
+    status, result = post(server, "run", plan(ledger_path, payment_size))
+    trajectory = get_payment_trajectory(
+        BalanceHandler(storage=ColumnarStorage(path=ledger_path)), payment_size=payment_size,
+        investment_size=500.0, initial_payment=0.0, profit_tax=0.15, investment_yearly_percentage=0.1,
+        start_date=START_DATE,
+    )
+
+    assert status == 200
+    assert result["months"] == len(trajectory) - 1 == HORIZON
+    assert result["paid_off"]
+    assert result["trajectory"]["investment_size"] == pytest.approx(trajectory.investment_size.tolist())
+
+def test_sweep_returns_a_scenario_per_payment (server, ledger_path, payment_size: float) -> None:
+    payments = [payment_size, payment_size * 2]
+    status, result = post(server, "sweep", plan(ledger_path, payments))
+
+    assert status == 200
+    assert [scenario["payment_size"] for scenario in result["scenarios"]] == payments
+    assert result["scenarios"][0]["months"] == HORIZON
+    assert result["scenarios"][1]["months"] > HORIZON
+
+def test_solve_finds_the_payment (server, ledger_path, payment_size: float) -> None:
+    status, result = post(server, "solve", {
+        **plan(ledger_path, payment_size), "parameter": "payment_size", "payoff_within": HORIZON,
+        "low": 0.0, "high": payment_size * 4,
+    })
+
+    assert status == 200
+    assert result["parameter"] == "payment_size"
+    assert result["converged"]
+    assert result["months"] <= HORIZON
+
+def test_bad_requests (server, ledger_path, payment_size: float) -> None:
+    assert post(server, "run", plan(ledger_path, "lots"))[0] == 400
+    assert post(server, "run", plan(ledger_path.with_name("missing.bal"), payment_size))[0] == 400
+    assert post(server, "solve", plan(ledger_path, payment_size))[0] == 400
+    assert post(server, "simulate", plan(ledger_path, payment_size))[0] == 404
+    assert get(server, "nothing")[0] == 404
+    assert get(server, "health") == (200, {"status": "ok"})
+
+def test_full_service_is_busy (ledger_path, payment_size: float) -> None:
+    service, server = served(max_pending=0)
+    try:
+        status, result = post(server, "run", plan(ledger_path, payment_size))
+
+    finally:
+        server.shutdown()
+        service.close()
+
+    assert status == 503
+    assert "pending" in result["error"]
+
+def test_identical_requests_coalesce (ledger_path, payment_size: float) -> None:
+    # A long batch window keeps the first summary run in flight while the second arrives
+    service, server = served(batch_window=0.5)
+    payload = plan(ledger_path, payment_size, summary=True)
+    try:
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            replies = list(pool.map(lambda _: post(server, "run", payload), range(2)))
+
+        metrics = get(server, "metrics")[1]
+
+    finally:
+        server.shutdown()
+        service.close()
+
+    assert replies[0] == replies[1]
+    assert replies[0][0] == 200
+    assert metrics["requests"]["run"]["coalesced"] == 1
+    assert metrics["batched_runs"] == 1
+
+def test_batched_summaries_match_single_runs (ledger_path, payment_size: float) -> None:
+    service, server = served(batch_window=0.5)
+    payloads = [plan(ledger_path, payment_size * scale, summary=True) for scale in (1.0, 1.5, 3.0)]
+    try:
+        with ThreadPoolExecutor(max_workers=len(payloads)) as pool:
+            batched = list(pool.map(lambda payload: post(server, "run", payload), payloads))
+
+        metrics = get(server, "metrics")[1]
+        single = [post(server, "run", {**payload, "summary": False}) for payload in payloads]
+
+    finally:
+        server.shutdown()
+        service.close()
+
+    assert metrics["batches"] == 1
+    assert metrics["batched_runs"] == len(payloads)
+    for (status, summary), (_, result) in zip(batched, single):
+        assert status == 200
+        assert summary["months"] == result["months"]
+        assert summary["paid_off"] == result["paid_off"]
+        assert summary["final_payment"] == pytest.approx(result["final_payment"])
+        assert summary["final_investment"] == pytest.approx(result["final_investment"])
+
+def test_reloaded_ledger_starts_a_new_batch (ledger_path, payment_size: float) -> None:
+    # Both ledgers open at the same handler version, so only the warm ledger tells them apart
+    service = SimulationService(batch_window=0.5)
+    try:
+        first = service.submit("run", plan(ledger_path, payment_size, summary=True))
+        ColumnarStorage(path=ledger_path).save(synthetic_ledger(40, seed=6, horizon=HORIZON))
+        second = service.submit("run", plan(ledger_path, payment_size, summary=True))
+        results = first.result(timeout=30), second.result(timeout=30)
+
+    finally:
+        service.close()
+
+    handler = BalanceHandler(storage=ColumnarStorage(path=ledger_path))
+    sweep = get_payment_sweep(
+        handler, payment_size=payment_size, investment_size=500.0, initial_payment=0.0, profit_tax=0.15,
+        investment_yearly_percentage=0.1, start_date=START_DATE, keep_trajectories=False,
+    )
+
+    assert service.metrics.batches == 2
+    assert results[1]["months"] == int(sweep.months[0])
+    assert results[1]["final_investment"] == pytest.approx(float(sweep.final_investment[0]))
@@ -0,0 +1,133 @@
+import struct
+import numpy as np
+import pandas as pd
+import dataclasses as dc
+import pytest
+
+import config
+from balance_handler import BalanceHandler
+from benchmarks.ledger import synthetic_balances, synthetic_ledger
+from storage import (
+    BALANCE_COLUMNS, ENUM_COLUMNS, HEADER, MAGIC, NUMERIC_COLUMNS, ColumnarStorage,
+    EncodedStringArray, EncodedStringDtype, aligned,
+)
+
+
+@pytest.fixture(autouse=True)
+def no_journal (monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(config, "BALANCE_JOURNAL", False)
+
+@pytest.fixture
+def ledger () -> pd.DataFrame:
+    return synthetic_ledger(200, seed=3)
+
+def mapped (ledger: pd.DataFrame, path) -> BalanceHandler:
+    ColumnarStorage(path=path).save(ledger)
+    return BalanceHandler(storage=ColumnarStorage(path=path))
+
+def mutate (handler: BalanceHandler) -> None:
+    handler.add_balances(synthetic_balances(5, seed=1, prefix="added"))
+    handler.update_balances_by_id([
+        dc.replace(balance, id=f"b{row}", name=f"renamed {row}", expiry=None, start_month=None)
+        for row, balance in zip((0, 7, 150), synthetic_balances(3, seed=2))
+    ])
+    handler.remove_balances_by_id(["b3", "addedb2", "b199"])
+
+def test_load_keeps_columns_encoded (ledger: pd.DataFrame, tmp_path) -> None:
+    ColumnarStorage(path=tmp_path / "ledger.bal").save(ledger)
+    df = ColumnarStorage(path=tmp_path / "ledger.bal").load()
+
+    assert all(isinstance(df[column].dtype, EncodedStringDtype) for column in ("id", "name"))
+    assert all(isinstance(df[column].dtype, pd.CategoricalDtype) for column in ENUM_COLUMNS)
+    for column in BALANCE_COLUMNS:
+        assert df[column].astype(str).tolist() == ledger[column].astype(str).tolist()
+
+def test_mutations_survive_save_and_reopen (ledger: pd.DataFrame, tmp_path) -> None:
+    handler = mapped(ledger, tmp_path / "ledger.bal")
+    reference = BalanceHandler(dataframe=ledger.copy())
+    mutate(handler)
+    mutate(reference)
+
+    assert handler.ledger_hash == reference.ledger_hash
+
+    handler.save()
+    reopened = BalanceHandler(storage=ColumnarStorage(path=tmp_path / "ledger.bal"))
+
+    assert reopened.ledger_hash == reference.ledger_hash
+    assert reopened.query_balance_by_id("b7").name == "renamed 7"
+    assert reopened.query_balance_by_id("b3") is None
+    assert reopened.query_balance_by_id("addedb2") is None
+    assert reopened.query_balance_by_id("addedb4") is not None
+
+def test_reads_version_1_files (ledger: pd.DataFrame, tmp_path) -> None:
+    # Header, float64 columns, uint8 codes, then NUL-joined strings without offsets
+    rows = len(ledger)
+    codes = b"".join(
+        pd.Categorical(ledger[column], categories=values).codes.astype(np.uint8).tobytes()
+        for column, values in ENUM_COLUMNS.items()
+    )
+    strings = ["\0".join(ledger[column]).encode() for column in ("id", "name")]
+    chunks = [
+        HEADER.pack(MAGIC, 1, rows, len(strings[0]), len(strings[1])).ljust(aligned(HEADER.size), b"\0"),
+        *(ledger[column].to_numpy(dtype=np.float64).tobytes() for column in NUMERIC_COLUMNS),
+        codes.ljust(aligned(len(codes)), b"\0"),
+        *(text.ljust(aligned(len(text)), b"\0") for text in strings),
+    ]
+    (tmp_path / "ledger.bal").write_bytes(b"".join(chunks))
+
+    handler = BalanceHandler(storage=ColumnarStorage(path=tmp_path / "ledger.bal"))
+    assert handler.ledger_hash == BalanceHandler(dataframe=ledger.copy()).ledger_hash
+
+def test_rejects_unknown_versions (ledger: pd.DataFrame, tmp_path) -> None:
+    path = tmp_path / "ledger.bal"
+    ColumnarStorage(path=path).save(ledger)
+    data = bytearray(path.read_bytes())
+    data[4:8] = struct.pack("<I", 99)
+    path.write_bytes(bytes(data))
+
+    with pytest.raises(ValueError):
+        ColumnarStorage(path=path).load()
+
+def test_concat_with_plain_strings () -> None:
+    encoded = pd.Series(EncodedStringArray._from_sequence(["a", "b"]))
+    plain = pd.Series(["c", "d"], index=[2, 3], dtype=str)
+    concatenated = pd.concat([encoded, plain])
+
+    assert isinstance(concatenated.dtype, EncodedStringDtype)
+    assert concatenated.tolist() == ["a", "b", "c", "d"]
+
+def test_sort_filter_and_compare () -> None:
+    values = ["pear", "apple", "fig", "apple", "kiwi"]
+    encoded = pd.Series(EncodedStringArray._from_sequence(values))
+    plain = pd.Series(values, dtype=str)
+
+    assert encoded.sort_values().tolist() == plain.sort_values().tolist()
+    assert encoded.sort_values().index.tolist() == plain.sort_values().index.tolist()
+    assert encoded[encoded == "apple"].index.tolist() == [1, 3]
+    assert encoded[encoded.isin(["fig", "kiwi"])].tolist() == ["fig", "kiwi"]
+    assert encoded.duplicated().tolist() == plain.duplicated().tolist()
+    assert encoded.astype(str).str.contains("i").tolist() == plain.str.contains("i").tolist()
+
+def test_take_with_fill () -> None:
+    array = EncodedStringArray._from_sequence(["a", "é", "c"])
+
+    assert array.take([2, -1, 0], allow_fill=True).tolist()[::2] == ["c", "a"]
+    assert pd.isna(array.take([2, -1, 0], allow_fill=True)[1])
+    assert array.take([2, -1], allow_fill=True, fill_value="x").tolist() == ["c", "x"]
+    assert array.take([-1, 1]).tolist() == ["c", "é"]
+
+def test_writes_leave_copies_alone () -> None:
+    array = EncodedStringArray._from_sequence(["a", "b", "c"])
+    copy = array.copy()
+    array[1] = "changed"
+    array[[0, 2]] = ["x", np.nan]
+
+    assert copy.tolist() == ["a", "b", "c"]
+    assert array[:2].tolist() == ["x", "changed"]
+    assert array.isna().tolist() == [False, False, True]
+
+def test_rejects_nul_characters (ledger: pd.DataFrame, tmp_path) -> None:
+    ledger.loc[0, "name"] = "bad\0name"
+
+    with pytest.raises(ValueError):
+        ColumnarStorage(path=tmp_path / "ledger.bal").save(ledger)
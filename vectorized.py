@@ -0,0 +1,332 @@
+import numpy as np
+import dataclasses as dc
+from datetime import datetime
+from collections.abc import Callable
+
+import config
+from structs.balance import SpreadType
+from structs.payment import PaymentStatus
+from structs.calendar import SimulationCalendar, default_start_date
+from structs.trajectory import PaymentTrajectory
+from structs.schedule import (
+    BREAKDOWN_FIELDS, CREDIT, DEBIT, INVESTMENT, PAYMENT,
+    CashFlowLedger, breakdown_from_row,
+)
+
+
+INITIAL_BLOCK_SIZE = 120
+MAX_BLOCK_SIZE = 3840
+
+# Called with (scenarios, months) for every simulated block; returns the payment and investment
+# monthly rates, each broadcastable to that shape.
+RateSampler = Callable[[int, int], tuple[np.ndarray | float, np.ndarray | float]]
+# Called with (scenario rows, months) for every simulated block; returns the breakdown in force
+# at those months, shaped (months, 4) when every scenario shares one ledger or (rows, months, 4)
+BreakdownSampler = Callable[[np.ndarray, np.ndarray], np.ndarray]
+
+
+def affine_scan (multiplier: np.ndarray, addend: np.ndarray, initial: float) -> np.ndarray:
+    # Solves x[t + 1] = multiplier[t] * x[t] + addend[t] in closed form, one segment per zero
+    # multiplier, since a zero resets the recurrence and cannot be divided out.
+    out = np.empty(len(multiplier) + 1)
+    out[0] = initial
+
+    start = 0
+    for stop in [*np.flatnonzero(multiplier == 0).tolist(), len(multiplier)]:
+        if stop > start:
+            growth = np.cumprod(multiplier[start:stop])
+            with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+                scaled = np.cumsum(np.concatenate([[out[start]], addend[start:stop] / growth]))[1:]
+                segment = growth * scaled
+
+            if np.all(np.isfinite(segment)) and np.all(growth != 0):
+                out[start + 1:stop + 1] = segment
+
+            else:
+                for t in range(start, stop):
+                    out[t + 1] = multiplier[t] * out[t] + addend[t]
+
+        if stop < len(multiplier):
+            out[stop + 1] = addend[stop]
+
+        start = stop + 1
+
+    return out
+
+def affine_scan_rows (
+    multiplier: np.ndarray, addend: np.ndarray, initial: np.ndarray
+) -> np.ndarray:
+    # Row-wise affine_scan over a scenarios x months batch; multiplier and addend broadcast
+    # against (scenarios, months). Columns where any row has a zero multiplier are stepped
+    # directly, and rows the closed form still cannot handle fall back to affine_scan.
+    shape = (len(initial), np.broadcast_shapes(np.shape(multiplier), np.shape(addend))[-1])
+    multiplier = np.broadcast_to(multiplier, np.broadcast_shapes(np.shape(multiplier), (1, shape[1])))
+    addend = np.broadcast_to(addend, np.broadcast_shapes(np.shape(addend), (1, shape[1])))
+
+    out = np.empty((shape[0], shape[1] + 1))
+    out[:, 0] = initial
+
+    start = 0
+    for stop in [*np.flatnonzero((multiplier == 0).any(axis=0)).tolist(), shape[1]]:
+        if stop > start:
+            growth = np.cumprod(multiplier[:, start:stop], axis=1)
+            with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+                segment = np.cumsum(
+                    np.concatenate([
+                        out[:, start:start + 1],
+                        np.broadcast_to(addend[:, start:stop] / growth, (shape[0], stop - start)),
+                    ], axis=1),
+                    axis=1,
+                )[:, 1:] * growth
+
+            out[:, start + 1:stop + 1] = segment
+
+        if stop < shape[1]:
+            out[:, stop + 1] = multiplier[:, stop] * out[:, stop] + addend[:, stop]
+
+        start = stop + 1
+
+    invalid = ~np.isfinite(out).all(axis=1)
+    for row in np.flatnonzero(invalid).tolist():
+        out[row] = affine_scan(
+            np.broadcast_to(multiplier, shape)[row], np.broadcast_to(addend, shape)[row], initial[row]
+        )
+
+    return out
+
+@dc.dataclass(kw_only=True)
+class ScenarioSweep:
+    start_date: datetime
+    parameters: dict[str, np.ndarray]
+
+    months: np.ndarray
+    paid_off: np.ndarray
+    final_payment: np.ndarray
+    final_investment: np.ndarray
+
+    payment_size: np.ndarray | None = None
+    investment_size: np.ndarray | None = None
+    extra_credit: np.ndarray | None = None
+    total_breakdown: np.ndarray | None = None
+
+    def __len__ (self) -> int:
+        return len(self.months)
+
+    @property
+    def payoff_month (self) -> np.ndarray:
+        return np.where(self.paid_off, self.months, -1)
+
+def ledger_breakdown (ledger: CashFlowLedger, start_date: datetime) -> BreakdownSampler:
+    calendar = SimulationCalendar(start_date=start_date)
+
+    def sample (rows: np.ndarray, months: np.ndarray) -> np.ndarray:
+        return ledger.cash_flows(calendar, months)
+
+    return sample
+
+def simulate_scenarios (
+    ledger: CashFlowLedger, payment_size: np.ndarray | float, investment_size: np.ndarray | float, *,
+    initial_payment: np.ndarray | float = 0, profit_tax: np.ndarray | float = 0.0,
+    investment_yearly_percentage: np.ndarray | float = 0, start_date: datetime | None = None,
+    keep_trajectories: bool = True, keep_breakdown: bool = False,
+    rate_sampler: RateSampler | None = None, max_months: int | None = None,
+) -> ScenarioSweep:
+    start_date = start_date if start_date is not None else default_start_date()
+
+    return simulate_batch(
+        ledger_breakdown(ledger, start_date), payment_size, investment_size,
+        initial_payment=initial_payment,
+        profit_tax=profit_tax,
+        investment_yearly_percentage=investment_yearly_percentage,
+        start_date=start_date,
+        keep_trajectories=keep_trajectories,
+        keep_breakdown=keep_breakdown,
+        rate_sampler=rate_sampler,
+        max_months=max_months,
+    )
+
+def simulate_batch (
+    breakdown_at: BreakdownSampler, payment_size: np.ndarray | float, investment_size: np.ndarray | float, *,
+    initial_payment: np.ndarray | float = 0, profit_tax: np.ndarray | float = 0.0,
+    investment_yearly_percentage: np.ndarray | float = 0, start_date: datetime,
+    keep_trajectories: bool = True, keep_breakdown: bool = False,
+    rate_sampler: RateSampler | None = None, max_months: int | None = None,
+    max_block_cells: int | None = None,
+) -> ScenarioSweep:
+    # Scenarios that stop early keep NaN in the later months of their trajectories. With
+    # max_block_cells, blocks shrink so running scenarios x months stays under it.
+    parameters = dict(zip(
+        ("payment_size", "investment_size", "initial_payment", "profit_tax", "investment_yearly_percentage"),
+        np.broadcast_arrays(*(np.atleast_1d(np.asarray(param, dtype=float)) for param in (
+            payment_size, investment_size, initial_payment, profit_tax, investment_yearly_percentage
+        ))),
+    ))
+    calendar = SimulationCalendar(start_date=start_date)
+    profit_tax = parameters["profit_tax"]
+    yearly_percentage = parameters["investment_yearly_percentage"]
+    n_scenarios = len(profit_tax)
+
+    payment = parameters["payment_size"] - parameters["initial_payment"]
+    investment = parameters["investment_size"] - parameters["initial_payment"]
+
+    months_run = np.zeros(n_scenarios, dtype=np.int64)
+    final_payment = payment.copy()
+    final_investment = investment.copy()
+    with np.errstate(invalid="ignore"):
+        running = payment > 0
+
+    trajectories = {"payment_size": [payment[:, None]], "investment_size": [investment[:, None]]}
+    if keep_breakdown:
+        trajectories["total_breakdown"] = [np.zeros((n_scenarios, 1, len(BREAKDOWN_FIELDS)))]
+
+    else:
+        trajectories["extra_credit"] = [np.zeros((n_scenarios, 1))]
+
+    month = 0
+    block_size = INITIAL_BLOCK_SIZE
+    while running.any():
+        rows = np.flatnonzero(running)
+        size = block_size
+        if max_block_cells is not None:
+            size = max(min(size, max_block_cells // len(rows)), 1)
+
+        if max_months is not None:
+            size = min(size, max_months - month)
+            if size <= 0:
+                break
+
+        if rate_sampler is None:
+            payment_rate = config.PAYMENT_INTEREST_RATE
+            investment_rate = config.INVESTMENT_INTERST_RATE
+
+        else:
+            payment_rate, investment_rate = (
+                np.broadcast_to(rate, (n_scenarios, size))[running]
+                for rate in rate_sampler(n_scenarios, size)
+            )
+
+        months = np.arange(month, month + size)
+        december = calendar.is_due(SpreadType.YEARLY, months)
+        breakdown = breakdown_at(rows, months)
+
+        payments = affine_scan_rows(
+            1 + payment_rate, -breakdown[..., PAYMENT], final_payment[rows]
+        )
+        investments = affine_scan_rows(
+            1 + investment_rate - yearly_percentage[rows, None] * december,
+            breakdown[..., INVESTMENT], final_investment[rows]
+        )
+
+        with np.errstate(invalid="ignore"):
+            stop = ~(payments[:, 1:] > 0) | (payments[:, :-1] <= payments[:, 1:])
+
+        stopped = stop.any(axis=1)
+        steps = np.where(stopped, np.argmax(stop, axis=1) + 1, size)
+        ended = np.arange(size)[None, :] >= steps[:, None]
+
+        earnings = investments[:, :-1] * investment_rate
+        taxes = (earnings + breakdown[..., CREDIT]) * profit_tax[rows, None]
+
+        months_run[rows] += steps
+        final_payment[rows] = payments[np.arange(len(rows)), steps]
+        final_investment[rows] = investments[np.arange(len(rows)), steps]
+        running[rows[stopped]] = False
+
+        if keep_trajectories or keep_breakdown:
+            columns = {"payment_size": payments[:, 1:], "investment_size": investments[:, 1:]}
+            if keep_breakdown:
+                totals = np.broadcast_to(breakdown, (len(rows), size, len(BREAKDOWN_FIELDS))).copy()
+                totals[:, :, DEBIT] += taxes
+                totals[:, :, INVESTMENT] += earnings
+                columns["total_breakdown"] = totals
+
+            else:
+                extra_credit = (
+                    breakdown[..., CREDIT] - breakdown[..., DEBIT]
+                    - breakdown[..., PAYMENT] - breakdown[..., INVESTMENT]
+                )
+                columns["extra_credit"] = extra_credit - taxes - earnings
+
+            for name, column in columns.items():
+                block = np.full((n_scenarios, *column.shape[1:]), np.nan)
+                block[rows] = np.where(ended.reshape(*ended.shape, *[1] * (column.ndim - 2)), np.nan, column)
+                trajectories[name].append(block)
+
+        month += size
+        block_size = min(block_size * 2, MAX_BLOCK_SIZE)
+
+    sweep = ScenarioSweep(
+        start_date=start_date,
+        parameters=parameters,
+        months=months_run,
+        paid_off=~(final_payment > 0),
+        final_payment=final_payment,
+        final_investment=final_investment,
+    )
+
+    if keep_trajectories or keep_breakdown:
+        horizon = int(months_run.max()) + 1
+        for name, blocks in trajectories.items():
+            setattr(sweep, name, np.concatenate(blocks, axis=1)[:, :horizon])
+
+    return sweep
+
+def scenario_grid (**axes: np.ndarray | float) -> dict[str, np.ndarray]:
+    grids = np.meshgrid(*(np.atleast_1d(np.asarray(axis, dtype=float)) for axis in axes.values()), indexing="ij")
+
+    return {name: grid.ravel() for name, grid in zip(axes, grids)}
+
+def payment_status_list (
+    trajectory: PaymentTrajectory, ledger: CashFlowLedger
+) -> list[PaymentStatus]:
+    # Rebuilds the legacy per-month PaymentStatus copies from a trajectory computed by this module
+    calendar = SimulationCalendar(start_date=trajectory.start_date)
+    months = np.arange(len(trajectory) - 1)
+    monthly_breakdowns = ledger.monthly.state_at(months)
+    # States left by each month, once the periods closing in it moved their counters
+    periodic_breakdowns = {
+        spread: schedule.state_at(calendar.periods_before(spread, months + 1))
+        for spread, schedule in ledger.periodic.items()
+    }
+
+    simulation = []
+    for point in trajectory:
+        status = PaymentStatus(
+            payment_size=point.payment_size,
+            investment_size=point.investment_size,
+            ledger=ledger,
+        )
+
+        if point.month > 0:
+            status.total_breakdown = point.total_breakdown
+            status.monthly_breakdown = breakdown_from_row(monthly_breakdowns[point.month - 1])
+            status.periodic_breakdowns = {
+                spread: breakdown_from_row(breakdowns[point.month - 1])
+                for spread, breakdowns in periodic_breakdowns.items()
+            }
+
+        simulation.append(status)
+
+    return simulation
+
+def simulate_cash_flows (
+    ledger: CashFlowLedger, payment_size: float, investment_size: float, *,
+    initial_payment: float = 0, profit_tax: float = 0.0,
+    investment_yearly_percentage: float = 0, start_date: datetime | None = None,
+) -> PaymentTrajectory:
+    sweep = simulate_scenarios(
+        ledger, payment_size, investment_size,
+        initial_payment=initial_payment,
+        profit_tax=profit_tax,
+        investment_yearly_percentage=investment_yearly_percentage,
+        start_date=start_date,
+        keep_breakdown=True,
+    )
+    horizon = int(sweep.months[0]) + 1
+
+    return PaymentTrajectory.from_arrays(
+        sweep.payment_size[0, :horizon],
+        sweep.investment_size[0, :horizon],
+        sweep.total_breakdown[0, :horizon],
+        start_date=sweep.start_date,
+    )